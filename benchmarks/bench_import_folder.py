@@ -0,0 +1,64 @@
+"""
+Benchmark of neurphys.read_pv.import_folder with serial and thread pooled
+parsing of the XML/csv pairs, and with each csv engine and dtype.
+
+Usage
+-----
+    python benchmarks/bench_import_folder.py [folder ...]
+
+Without arguments a synthetic 500 sweep T-series folder (2000 voltage
+recording rows and a 2 profile linescan per sweep) is written to a temporary
+directory and used instead.
+
+Thread pooling can only pay off with several cores, so the CPU count is
+printed with the timings.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from neurphys.read_pv import import_folder  # noqa: E402
+
+
+def main(folders):
+    tmpdir = None
+    if not folders:
+        from tests.synthetic import write_pv_folder
+        tmpdir = tempfile.TemporaryDirectory()
+        write_pv_folder(tmpdir.name, num_sweeps=500, rows=2000, ls_rows=200)
+        folders = [tmpdir.name]
+
+    print('{} CPUs'.format(os.cpu_count()))
+    for folder in folders:
+        print(folder)
+        for workers in [1, 2, 4, 8, None]:
+            runs = timeit.repeat(lambda: import_folder(folder,
+                                                       workers=workers),
+                                 number=1, repeat=3)
+            print('    workers={:<5} {:8.1f} ms (best of 3)'.format(
+                str(workers), min(runs) * 1e3))
+
+        engines = ['c']
+        if importlib.util.find_spec('pyarrow') is not None:
+            engines.append('pyarrow')
+        for engine in engines:
+            for dtype in [np.float64, np.float32]:
+                runs = timeit.repeat(
+                    lambda: import_folder(folder, dtype=dtype, engine=engine),
+                    number=1, repeat=3)
+                print('    engine={:<8} dtype={:<8} {:8.1f} ms '
+                      '(best of 3)'.format(engine, np.dtype(dtype).name,
+                                           min(runs) * 1e3))
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
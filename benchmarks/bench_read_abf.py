@@ -0,0 +1,92 @@
+"""
+Benchmark of neurphys.read_abf against the neo AxonIO round-trip it
+replaced.
+
+Usage
+-----
+    python benchmarks/bench_read_abf.py [file.abf ...]
+
+neo is only needed to run this comparison. Without arguments a synthetic
+20 sweep x 100k sample x 2 channel ABF2 file is written to a temporary
+directory and used instead.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import timeit
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from neurphys.read_abf import read_abf  # noqa: E402
+
+
+def read_abf_neo(filepath):
+    """ The neo based read_abf implementation, kept for comparison """
+    from neo import io
+
+    r = io.AxonIO(filename=filepath)
+    bl = r.read_block(lazy=False)
+    num_channels = len(bl.segments[0].analogsignals[0].T)
+    df_list = []
+    sweep_list = []
+    for seg_num, seg in enumerate(bl.segments):
+        channels = ['primary']+['channel_{0}'.format(str(i+1))
+                                for i in range(num_channels-1)]
+        signal = np.array(seg.analogsignals[0])
+        data_dict = OrderedDict(zip(channels, signal.T))
+        time = seg.analogsignals[0].times - seg.analogsignals[0].times[0]
+        data_dict.update({'time': np.array(time)})
+        data_dict.move_to_end('time', last=False)
+        df_list.append(pd.DataFrame(data_dict))
+        sweep_list.append('sweep' + str(seg_num + 1).zfill(3))
+
+    return pd.concat(df_list, keys=sweep_list, names=['sweep', 'index'])
+
+
+def import_time(module):
+    """ Seconds taken to import a module in a fresh interpreter """
+    code = ('import time; t = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - t)'.format(module))
+    out = subprocess.check_output([sys.executable, '-c', code],
+                                  cwd=os.path.join(os.path.dirname(__file__),
+                                                   '..'))
+    return float(out)
+
+
+def main(paths):
+    tmpdir = None
+    if not paths:
+        from tests.synthetic import write_abf2
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, 'bench.abf')
+        write_abf2(path, np.random.randn(20, 100000, 2) * 50)
+        paths = [path]
+
+    print('import neurphys.read_abf: {:8.1f} ms'.format(
+        import_time('neurphys.read_abf') * 1e3))
+    print('import neo.io:            {:8.1f} ms'.format(
+        import_time('neo.io') * 1e3))
+
+    for path in paths:
+        print(os.path.basename(path))
+        for name, func in [('neurphys', read_abf), ('neo', read_abf_neo)]:
+            runs = timeit.repeat(lambda: func(path), number=1, repeat=5)
+            print('    {:10s} {:8.1f} ms (best of 5)'.format(
+                name, min(runs) * 1e3))
+        window = timeit.repeat(lambda: read_abf(path, channels=['primary'],
+                                                t_start=0.1, t_stop=0.3),
+                               number=1, repeat=5)
+        print('    {:10s} {:8.1f} ms (best of 5)'.format(
+            'window', min(window) * 1e3))
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
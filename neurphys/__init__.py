@@ -8,7 +8,11 @@ and calcium imaging data
 
 __version__ = '0.1.0'
 
+from . import archive
+from . import cache
 from . import calcium
+from . import fitting
+from . import linescan
 from . import membrane
 from . import nuplot
 from . import oscillation
@@ -16,4 +20,5 @@ from . import pacemaking
 from . import read_abf
 from . import read_pv
 from . import synaptics
+from . import sweeps
 from . import utilities
@@ -0,0 +1,178 @@
+"""
+Single file binary archives of parsed recordings.
+
+An archive holds the DataFrames produced by a reader, column by column, as
+raw contiguous arrays, plus a JSON header with the column names, the index
+layout and JSON serializable metadata (e.g. the PrairieView file
+attributes). Reading an archive memory-maps the file once and builds the
+DataFrames on top of it, so opening one costs next to nothing whatever
+its size.
+
+Layout
+------
+    8 bytes    magic, b'NPHARC01'
+    8 bytes    header length (little endian uint64)
+    header     utf-8 JSON
+    arrays     each starting on a 64 byte boundary
+"""
+
+import json
+import os
+import struct
+import tempfile
+import numpy as np
+import pandas as pd
+
+MAGIC = b'NPHARC01'
+ALIGN = 64
+
+
+def frame_arrays(df):
+    """
+    Splits a DataFrame into named arrays (its columns, index levels and
+    codes) and a JSON serializable description. Shared by archives and
+    the cache (neurphys.cache), so frames round-trip the same way through
+    both; `frame_from_arrays` reverses it.
+
+    Return
+    ------
+    arrays: list of (name, array)
+    desc: dict of columns, index names and object levels, and df.attrs
+    """
+    arrays = []
+    for i, col in enumerate(df.columns):
+        arrays.append(('col{}'.format(i), df[col].values))
+    index = df.index
+    if not isinstance(index, pd.MultiIndex):
+        index = pd.MultiIndex.from_arrays([index])
+    levels = []
+    for i, level in enumerate(index.levels):
+        level = np.asarray(level)
+        if level.dtype == object:
+            levels.append([str(v) for v in level])
+        else:
+            levels.append(None)
+            arrays.append(('level{}'.format(i), level))
+        arrays.append(('codes{}'.format(i), np.asarray(index.codes[i])))
+    desc = {'columns': [str(c) for c in df.columns],
+            'index_names': list(index.names),
+            'multiindex': isinstance(df.index, pd.MultiIndex),
+            'levels': levels,
+            'attrs': dict(df.attrs)}
+    return arrays, desc
+
+
+def frame_from_arrays(desc, array):
+    """
+    Rebuilds a DataFrame split by `frame_arrays` without copying its
+    arrays.
+
+    Parameters
+    ----------
+    desc: dict
+        Description returned by `frame_arrays`.
+    array: callable
+        Returns the array stored under a name, e.g. memory-mapped.
+    """
+    data = {col: array('col{}'.format(i))
+            for i, col in enumerate(desc['columns'])}
+    levels = [level if level is not None
+              else array('level{}'.format(i))
+              for i, level in enumerate(desc['levels'])]
+    codes = [array('codes{}'.format(i)) for i in range(len(levels))]
+    index = pd.MultiIndex(levels=levels, codes=codes,
+                          names=desc['index_names'])
+    if not desc['multiindex']:
+        index = index.get_level_values(0)
+    df = pd.DataFrame(data, index=index, columns=desc['columns'], copy=False)
+    df.attrs.update(desc['attrs'])
+    return df
+
+
+def save(filepath, frames, meta=None):
+    """
+    Writes DataFrames and metadata into a single archive file.
+
+    Parameters
+    ----------
+    filepath: str
+    frames: dict of name: DataFrame (or None)
+    meta: dict
+        JSON serializable metadata.
+    """
+    descs = {}
+    arrays = []
+    for name, df in frames.items():
+        if df is None:
+            descs[name] = None
+            continue
+        arrays_, descs[name] = frame_arrays(df)
+        descs[name]['arrays'] = {}
+        for key, values in arrays_:
+            arrays.append((name, key, np.ascontiguousarray(values)))
+
+    # lay the arrays out after the header, then write the header with the
+    # final offsets; the header length only depends on the offsets' digits
+    # so iterate until it is stable
+    header_len = 0
+    while True:
+        offset = len(MAGIC) + 8 + header_len
+        for name, key, values in arrays:
+            offset += -offset % ALIGN
+            descs[name]['arrays'][key] = {'offset': offset,
+                                          'dtype': values.dtype.str,
+                                          'shape': list(values.shape)}
+            offset += values.nbytes
+        header = json.dumps({'frames': descs, 'meta': meta}).encode('utf-8')
+        if len(header) == header_len:
+            break
+        header_len = len(header)
+
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+            for name, key, values in arrays:
+                f.write(b'\x00' * (descs[name]['arrays'][key]['offset'] -
+                                   f.tell()))
+                f.write(values.tobytes())
+        os.replace(tmp, filepath)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def load(filepath):
+    """
+    Opens an archive written by `save`.
+
+    Return
+    ------
+    frames: dict of name: DataFrame (or None), memory-mapped from the file
+    meta: dict of metadata stored with the frames
+    """
+    with open(filepath, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise IOError('{} is not a neurphys archive'.format(filepath))
+        header_len, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    buf = np.memmap(filepath, dtype=np.uint8, mode='r')
+
+    def array(spec):
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        start = spec['offset']
+        return buf[start:start + count * dtype.itemsize].view(dtype).reshape(
+            spec['shape'])
+
+    frames = {}
+    for name, desc in header['frames'].items():
+        if desc is None:
+            frames[name] = None
+            continue
+        specs = desc.pop('arrays')
+        df = frame_from_arrays(desc, lambda key: array(specs[key]))
+        frames[name] = df
+
+    return frames, header['meta']
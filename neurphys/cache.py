@@ -0,0 +1,232 @@
+"""
+Opt-in on-disk cache of parsed recordings.
+
+Each entry holds the DataFrames produced by a reader, stored column by
+column as .npy files, plus a JSON file of metadata (channel units, sampling,
+XML file attributes...). Entries are keyed by the source path, its size and
+modification time, the reader and the reader version, so any change to the
+raw data or to the reader invalidates them. Warm loads memory-map the
+columns instead of re-parsing the raw files. The cache is size-bounded and
+least recently used entries are evicted first.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from . import archive
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'neurphys')
+DEFAULT_MAX_BYTES = 4 * 1024**3
+# bump whenever the on-disk layout of the entries changes
+FORMAT_VERSION = 2
+
+
+def get_cache_dir(cache_dir=None):
+    """
+    Resolves the cache directory: cache_dir if given, else the
+    NEURPHYS_CACHE_DIR environment variable, else ~/.cache/neurphys.
+    """
+    if cache_dir is None or cache_dir is True:
+        cache_dir = os.environ.get('NEURPHYS_CACHE_DIR', DEFAULT_CACHE_DIR)
+    return cache_dir
+
+
+def _stat_list(path):
+    """ (name, size, mtime) of a file, or of every file in a folder """
+    if os.path.isdir(path):
+        entries = sorted((e for e in os.scandir(path) if e.is_file()),
+                         key=lambda e: e.name)
+        stats = [(e.name, e.stat()) for e in entries]
+    else:
+        stats = [(os.path.basename(path), os.stat(path))]
+    return [(name, st.st_size, st.st_mtime_ns) for name, st in stats]
+
+
+def fingerprint(path, reader, version, params=None):
+    """
+    Cache key for a file (or folder) read by reader.
+
+    Parameters
+    ----------
+    path: str
+        File or folder that the reader parses.
+    reader: str
+        Name of the reader, e.g. 'read_abf'.
+    version: int or str
+        Reader version. Bump it whenever the reader output changes.
+    params: dict
+        Reader arguments that change its output (channels, sweeps...).
+
+    Return
+    ------
+    key: str
+        Hex digest identifying the cache entry.
+    """
+    desc = {'path': os.path.abspath(path),
+            'files': _stat_list(path),
+            'reader': reader,
+            'version': str(version),
+            'format': FORMAT_VERSION,
+            'params': repr(sorted((params or {}).items()))}
+    blob = json.dumps(desc, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(blob).hexdigest()
+
+
+def _entry_size(entry):
+    return sum(e.stat().st_size for e in os.scandir(entry) if e.is_file())
+
+
+def _save_frame(df, dirpath):
+    """ Writes each array of `archive.frame_arrays(df)` as a .npy file """
+    os.makedirs(dirpath)
+    arrays, desc = archive.frame_arrays(df)
+    for key, values in arrays:
+        np.save(os.path.join(dirpath, key + '.npy'),
+                np.ascontiguousarray(values))
+    return desc
+
+
+def _load_frame(dirpath, desc):
+    """ Rebuilds a DataFrame on top of memory-mapped array files """
+    return archive.frame_from_arrays(
+        desc, lambda key: np.load(os.path.join(dirpath, key + '.npy'),
+                                  mmap_mode='r'))
+
+
+def load(key, cache_dir=None):
+    """
+    Loads a cache entry.
+
+    Return
+    ------
+    frames: dict of name: DataFrame (or None), memory-mapped from disk
+    meta: dict of metadata stored with the entry
+    **if there is no entry for key, returns None
+    """
+    entry = os.path.join(get_cache_dir(cache_dir), key)
+    meta_file = os.path.join(entry, 'meta.json')
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+    frames = {}
+    for name, desc in meta['frames'].items():
+        if desc is None:
+            frames[name] = None
+        else:
+            frames[name] = _load_frame(os.path.join(entry, name), desc)
+    # modification time of meta.json marks the last use (for LRU eviction)
+    os.utime(meta_file, None)
+
+    return frames, meta['meta']
+
+
+def store(key, frames, meta, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Stores DataFrames and JSON serializable metadata under key, then
+    evicts least recently used entries to stay under max_bytes.
+
+    Parameters
+    ----------
+    key: str
+        Cache key (see `fingerprint`).
+    frames: dict of name: DataFrame (or None)
+    meta: dict
+        JSON serializable metadata.
+    cache_dir: str (default: None)
+        See `get_cache_dir`.
+    max_bytes: int
+        Size limit of the whole cache.
+    """
+    root = get_cache_dir(cache_dir)
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    # write into a temporary folder first so readers never see half an entry
+    tmp = tempfile.mkdtemp(dir=root, prefix='.tmp')
+    try:
+        descs = {}
+        for name, df in frames.items():
+            if df is None:
+                descs[name] = None
+            else:
+                descs[name] = _save_frame(df, os.path.join(tmp, name))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'frames': descs, 'meta': meta}, f)
+        entry = os.path.join(root, key)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(tmp, entry)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """ Removes least recently used entries until the cache fits max_bytes """
+    root = get_cache_dir(cache_dir)
+    if not os.path.isdir(root):
+        return
+    entries = []
+    for e in os.scandir(root):
+        meta_file = os.path.join(e.path, 'meta.json')
+        if e.is_dir() and os.path.exists(meta_file):
+            size = sum(_entry_size(d.path) for d in os.scandir(e.path)
+                       if d.is_dir()) + os.stat(meta_file).st_size
+            entries.append((os.stat(meta_file).st_mtime, size, e.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def clear(cache_dir=None):
+    """ Removes every entry from the cache """
+    root = get_cache_dir(cache_dir)
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+
+
+def memoize(path, reader, version, build, cache_dir=None, params=None,
+            max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Returns the cached output of a reader for path, or builds and caches it.
+
+    Parameters
+    ----------
+    path: str
+        File or folder parsed by the reader.
+    reader: str
+        Name of the reader.
+    version: int or str
+        Reader version.
+    build: callable
+        Called without arguments on a cache miss; must return a
+        (frames, meta) tuple as taken by `store`.
+    cache_dir: str or True
+        See `get_cache_dir`.
+    params: dict
+        Reader arguments that change its output.
+    max_bytes: int
+        Size limit of the whole cache.
+
+    Return
+    ------
+    frames, meta: as returned by `load`
+    """
+    key = fingerprint(path, reader, version, params)
+    cached = load(key, cache_dir)
+    if cached is not None:
+        return cached
+    frames, meta = build()
+    store(key, frames, meta, cache_dir, max_bytes)
+    return frames, meta
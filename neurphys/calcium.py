@@ -1,5 +1,11 @@
 """ Module for analyzing 2PLSM calcium imaging data """
 
+import numpy as np
+import pandas as pd
+from . import fitting
+from . import utilities as util
+from .linescan import LineScan
+
 
 def calc_ca_conc(df, profile_num, f0_start, f0_end, background,
                  kd, rf, rf_real):
@@ -38,9 +44,200 @@ def calc_ca_conc(df, profile_num, f0_start, f0_end, background,
     ca_df = df[[prof, prof_time]].copy()
     ca_df[prof] -= background
 
-    f0 = ca_df[prof][(ca_df[prof_time] >= f0_start) &
-                     (ca_df[prof_time] <= f0_end)].mean()
+    f0 = ca_df[prof].iloc[util.time_window(ca_df, f0_start, f0_end,
+                                           prof_time)].mean()
     fmax = f0 * (rf / rf_real)
     ca_df[prof] = kd * ((1-ca_df[prof] / fmax) / (ca_df[prof] / fmax - (1/rf)))
 
     return ca_df[prof].values
+
+
+def calc_ca_conc_all(scan, f0_start, f0_end, background, kd=None, rf=None,
+                     rf_real=None, method='conc'):
+    """Calculates estimated calcium concentration (or dF/F0) for every
+    profile of every sweep at once.
+
+    Parameters
+    -----------
+    scan: LineScan, or linescan dataframe
+        e.g. the 'linescan' output of read_pv.import_folder (dataframes are
+        converted with LineScan.from_frame)
+    f0_start: positive number (seconds)
+        designates beginning of the region over which to average to determine f0
+    f0_end: positive number (seconds)
+        designates end of the region over which to average to determine f0
+    background: positive number or 1D array_like (AU)
+        PMT background fluorescent value, or one value per profile
+    kd: positive number (nM)
+        kd for specific dye being used in experiment (method='conc' only)
+    rf: positive number (no units)
+        theoretical rf for specific dye being used in experiment
+        (method='conc' only)
+    rf_real: positive number (no units)
+        experimentally determined rf for specific dye being used
+        (method='conc' only)
+    method: string (either 'conc' or 'dff')
+        'conc' returns calcium concentration (nM) as calc_ca_conc,
+        'dff' returns (F - F0) / F0 of the background subtracted
+        fluorescence
+
+    Return
+    ------
+    LineScan of the same shape as scan holding the calcium concentration
+    (nM) or dF/F0 values
+    """
+    if not isinstance(scan, LineScan):
+        scan = LineScan.from_frame(scan)
+    if method not in ('conc', 'dff'):
+        raise ValueError("method must be 'conc' or 'dff'")
+    if method == 'conc' and None in (kd, rf, rf_real):
+        raise ValueError("method='conc' requires kd, rf and rf_real")
+
+    # background per profile broadcasts over (sweeps x profiles x samples)
+    f = scan.data - np.asarray(background,
+                               dtype=scan.data.dtype).reshape(-1, 1)
+    # f0 window as a slice of the shared time base
+    window = util.time_window(scan.time, f0_start, f0_end)
+    f0 = f[:, :, window].mean(axis=2, dtype=np.float64, keepdims=True)
+
+    if method == 'dff':
+        f -= f0.astype(f.dtype)
+        f /= f0.astype(f.dtype)
+    else:
+        # same conversion as calc_ca_conc, in float64 one sweep at a time:
+        # f/fmax - 1/rf cancels near the dye's minimum fluorescence
+        fmax = f0 * (rf / rf_real)
+        for s in range(len(f)):
+            ratio = f[s] / fmax[s]
+            f[s] = kd * ((1 - ratio) / (ratio - (1/rf)))
+
+    return LineScan(f, scan.time, scan.profile_names, scan.sweep_names,
+                    f.dtype)
+
+
+def _transients(trace, threshold, reset, min_interval, window):
+    """Onset, peak and end sample indexes of the transients of a trace.
+    An onset is an upward crossing of threshold at least min_interval
+    samples after the previous onset, once the trace has fallen below reset
+    since then; an event ends at the next onset or window samples after its
+    onset, whichever comes first.
+    """
+    above = trace >= threshold
+    crossings = np.flatnonzero(above[1:] & ~above[:-1]) + 1
+    # number of samples below reset up to each index
+    num_reset = np.cumsum(trace < reset)
+    onsets = []
+    for i in crossings:
+        if not onsets or (i - onsets[-1] >= min_interval and
+                          num_reset[i] > num_reset[onsets[-1]]):
+            onsets.append(i)
+    onsets = np.array(onsets, dtype=np.int64)
+    if not len(onsets):
+        return onsets, onsets, onsets
+    ends = np.minimum(np.append(onsets[1:], len(trace)), onsets + window)
+    peaks = np.array([on + np.argmax(trace[on:end])
+                      for on, end in zip(onsets, ends)], dtype=np.int64)
+    return onsets, peaks, ends
+
+
+def _rise_starts(trace, onsets, peaks, num_baseline):
+    """Baseline of each transient, as the median of the num_baseline
+    samples before its threshold crossing (and after the previous peak),
+    and the sample where it leaves that baseline: the last sample at or
+    below it before the crossing.
+    """
+    starts = np.empty(len(onsets), dtype=np.int64)
+    bases = np.empty(len(onsets))
+    prev_peak = -1
+    for k, (on, pk) in enumerate(zip(onsets, peaks)):
+        lo = max(on - num_baseline, prev_peak + 1, 0)
+        before = trace[lo:on]
+        bases[k] = np.median(before) if len(before) else trace[on]
+        below = np.flatnonzero(before <= bases[k])
+        starts[k] = lo + below[-1] if len(below) else lo
+        prev_peak = pk
+    return starts, bases
+
+
+def find_transients(scan, threshold, reset=None, min_interval=0.05,
+                    window=1., baseline=0.05, fit_decay=True, workers=1,
+                    chunk_size=256):
+    """Detects calcium transients in every profile of every sweep and
+    measures their amplitude, rise and decay.
+
+    Parameters
+    -----------
+    scan: LineScan, or linescan dataframe
+        Typically dF/F0 or calcium concentration, e.g. the output of
+        calc_ca_conc_all.
+    threshold: number
+        A transient is detected where a profile crosses threshold upwards.
+    reset: number, default = None
+        a new transient can only start once the profile has fallen below
+        reset, so that noise around threshold is not counted as several
+        transients. None uses threshold / 2.
+    min_interval: positive number (seconds), default = 0.05
+        crossings closer than this to the previous crossing are ignored
+    window: positive number (seconds), default = 1.
+        longest duration of a transient; a transient also ends at the next
+        crossing. The peak is searched and the decay fitted within it.
+    baseline: positive number (seconds), default = 0.05
+        the baseline of a transient is the median of the profile over this
+        long before its threshold crossing (and after the previous peak).
+        The transient starts at the last sample at or below its baseline.
+    fit_decay: boolean, default = True
+        fit a single exponential decay from the peak to the end of each
+        transient (see `fitting.fit_decays`)
+    workers: int, default = 1
+        number of processes fitting the decays. 1 fits in this process,
+        None uses the ProcessPoolExecutor default.
+    chunk_size: int, default = 256
+        transients sent to a worker at a time
+
+    Return
+    ------
+    events: dataframe
+        One row per transient with sweep, profile, onset time (start of the
+        rise), peak time, time to peak (s, from the onset), rise time
+        (10-90%, s), amplitude (peak - baseline), decay tau (s) and fit
+        converged columns.
+    """
+    if not isinstance(scan, LineScan):
+        scan = LineScan.from_frame(scan)
+    time = scan.time
+    dt = time[1] - time[0]
+    if reset is None:
+        reset = threshold / 2.
+    min_interval = max(int(round(min_interval / dt)), 1)
+    window = max(int(round(window / dt)), 2)
+    num_baseline = max(int(round(baseline / dt)), 1)
+
+    rows = []
+    segments = []
+    for s, sweep in enumerate(scan.sweep_names):
+        for p, profile in enumerate(scan.profile_names):
+            trace = scan.data[s, p].astype(np.float64)
+            onsets, peaks, ends = _transients(trace, threshold, reset,
+                                              min_interval, window)
+            starts, bases = _rise_starts(trace, onsets, peaks, num_baseline)
+            for start, base, pk, end in zip(starts, bases, peaks, ends):
+                amp = trace[pk] - base
+                rise = trace[start:pk + 1] - base
+                t10 = np.argmax(rise >= 0.1 * amp)
+                t90 = np.argmax(rise >= 0.9 * amp)
+                rows.append((sweep, profile, time[start], time[pk],
+                             time[pk] - time[start], (t90 - t10) * dt, amp))
+                segments.append((time[pk:end] - time[pk], trace[pk:end]))
+
+    events = pd.DataFrame(rows, columns=['sweep', 'profile', 'onset time',
+                                         'peak time', 'time to peak',
+                                         'rise time', 'amplitude'])
+    if not fit_decay:
+        return events
+
+    fits = fitting.fit_decays(segments, single=True, workers=workers,
+                              chunk_size=chunk_size)
+    events['decay tau'] = fits['tau'].values
+    events['fit converged'] = fits['converged'].values
+
+    return events
@@ -0,0 +1,369 @@
+"""
+Biexponential decay fitting engine.
+
+Fits y = a1*exp(-x/tau1) + a2*exp(-x/tau2) + c to event decays by least
+squares with an analytic Jacobian, starting from a log-linear pre-fit of
+the data (or from the fit of the previous event). Single exponential
+decays y = a*exp(-x/tau) + c are fitted the same way, on their own or, on
+request, as the alternative kept when the data do not support a second
+component. Time constants are bounded by a multiple of the fitted span
+and the offset by the data range. Fits never raise on bad data: every
+result carries a convergence flag, and failed fits give NaN. Fits whose
+time constants end on their bound, or whose two components cancel each
+other, count as failed.
+"""
+
+from functools import partial
+import numpy as np
+import pandas as pd
+from scipy.optimize import least_squares
+from . import utilities as util
+
+PARAMS = ['a1', 'tau1', 'a2', 'tau2', 'c']
+MIN_POINTS = 6
+# longest time constant fitted, in multiples of the span of the decay; a
+# slower component is not distinguishable from the offset
+MAX_TAU_SPAN = 5.
+
+
+def biexp(x, a1, tau1, a2, tau2, c):
+    """ a1*exp(-x/tau1) + a2*exp(-x/tau2) + c """
+    return a1*np.exp(-x/tau1) + a2*np.exp(-x/tau2) + c
+
+
+def exp_decay(x, a, tau, c):
+    """ a*exp(-x/tau) + c """
+    return a*np.exp(-x/tau) + c
+
+
+def weighted_tau(params):
+    """ Amplitude weighted time constant of (a1, tau1, a2, tau2, c) """
+    a1, tau1, a2, tau2, _ = params
+    return (tau1*a1 + tau2*a2) / (a1 + a2)
+
+
+def _residuals(params, x, y):
+    return biexp(x, *params) - y
+
+
+def _jacobian(params, x, y):
+    a1, tau1, a2, tau2, _ = params
+    e1 = np.exp(-x/tau1)
+    e2 = np.exp(-x/tau2)
+    return np.column_stack([e1, a1*x*e1/tau1**2, e2, a2*x*e2/tau2**2,
+                            np.ones_like(x)])
+
+
+def _exp_residuals(params, x, y):
+    return exp_decay(x, *params) - y
+
+
+def _exp_jacobian(params, x, y):
+    a, tau, _ = params
+    e = np.exp(-x/tau)
+    return np.column_stack([e, a*x*e/tau**2, np.ones_like(x)])
+
+
+def _loglin(x, z, sign):
+    """ (a, tau) of z ~ a*exp(-x/tau) from a line fit to log(sign*z) """
+    valid = sign*z > 0
+    if valid.sum() < 2:
+        return None
+    slope, intercept = np.polyfit(x[valid], np.log(sign*z[valid]), 1)
+    if not slope < 0:
+        return None
+    return sign*np.exp(intercept), -1/slope
+
+
+def _single_guess(x, y):
+    """Starting point (a, tau, c) of a single exponential decay: offset
+    from the tail, a and tau from a log-linear fit down to 10% of the
+    amplitude.
+    """
+    span = (x[-1] - x[0]) or 1.
+    c = np.median(y[-max(len(y) // 10, 1):])
+    z = y - c
+    if z[0] == 0:
+        return 0., span/3, c
+    sign = np.sign(z[0])
+    rel = z / z[0]
+    one = _loglin(x[rel > 0.1], z[rel > 0.1], sign)
+    a, tau = one if one is not None else (z[0], span/3)
+    return a, tau, c
+
+
+def initial_guess(x, y):
+    """Data-driven starting point for `fit_decay`, by exponential peeling:
+    the offset is taken from the tail of the decay, the slow component from
+    a log-linear fit between 50% and 10% of the amplitude and the fast one
+    from a log-linear fit of what remains above 50%. Falls back on splitting
+    a single log-linear fit in a fast and a slow half.
+
+    Parameters
+    -----------
+    x: 1D array
+        time from the start of the decay
+    y: 1D array
+
+    Return
+    ------
+    params: array (a1, tau1, a2, tau2, c)
+    """
+    a, tau, c = _single_guess(x, y)
+    z = y - c
+    if z[0] == 0:
+        return np.array([0., tau/2, 0., tau*2, c])
+    sign = np.sign(z[0])
+    rel = z / z[0]
+
+    late = (rel > 0.1) & (rel < 0.5)
+    slow = _loglin(x[late], z[late], sign)
+    if slow is not None:
+        early = rel >= 0.5
+        fast_z = z - slow[0]*np.exp(-x/slow[1])
+        fast = _loglin(x[early], fast_z[early], sign)
+        if fast is not None and fast[1] < slow[1]:
+            return np.array([fast[0], fast[1], slow[0], slow[1], c])
+
+    return np.array([a/2, tau/2, a/2, tau*2, c])
+
+
+def _least_squares(residuals, jacobian, q0, x, y, taus):
+    """Bounded least squares on x and y normalised to unit spans: time
+    constants (at indexes taus) within (0, MAX_TAU_SPAN], the offset (last
+    parameter) within one span of the data. None if the fit fails or a
+    time constant ends on its upper bound.
+    """
+    q0 = np.array(q0, dtype=np.float64)
+    if not np.isfinite(q0).all():
+        return None
+    lower = np.full(len(q0), -np.inf)
+    upper = np.full(len(q0), np.inf)
+    lower[taus] = 1e-9
+    upper[taus] = MAX_TAU_SPAN
+    lower[-1] = y.min() - 1
+    upper[-1] = y.max() + 1
+    margin = 1e-6
+    q0 = np.clip(q0, lower + margin, upper - margin)
+    try:
+        fit = least_squares(residuals, q0, jac=jacobian, args=(x, y),
+                            bounds=(lower, upper))
+    except (ValueError, np.linalg.LinAlgError):
+        return None
+    if not (fit.success and np.isfinite(fit.x).all()) or \
+            (fit.x[taus] >= MAX_TAU_SPAN*(1 - 1e-3)).any():
+        return None
+    return fit
+
+
+def _cancelling(params):
+    """ Whether the two components of (a1, tau1, a2, tau2, c) are large
+    and of opposite sign, cancelling each other """
+    return abs(params[0]) + abs(params[2]) > 3*abs(params[0] + params[2])
+
+
+def _bic(fit, n):
+    """ Bayesian information criterion of a least squares fit """
+    return n*np.log(max(2*fit.cost, 1e-300)/n) + len(fit.x)*np.log(n)
+
+
+def _prepare(x, y):
+    """ float64 x and y, or None if they cannot be fitted """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) < MIN_POINTS or not (np.isfinite(x).all() and
+                                   np.isfinite(y).all()):
+        return None
+    return x, y
+
+
+def fit_exp_decay(x, y, p0=None):
+    """Fits a single exponential decay to one event, normalised as
+    `fit_decay`.
+
+    Parameters
+    -----------
+    x: 1D array_like
+        time from the start of the decay
+    y: 1D array_like
+    p0: array_like (a, tau, c), default = None
+        starting point; None starts from a log-linear fit of the data
+
+    Return
+    ------
+    params: array (a, tau, c); NaN if the fit failed
+    converged: boolean
+    nfev: number of function evaluations
+    """
+    data = _prepare(x, y)
+    if data is None:
+        return np.full(3, np.nan), False, 0
+    x, y = data
+    if p0 is None:
+        p0 = _single_guess(x, y)
+
+    x_scale = np.ptp(x) or 1.
+    y_scale = np.ptp(y) or 1.
+    scale = np.array([y_scale, x_scale, y_scale])
+    fit = _least_squares(_exp_residuals, _exp_jacobian,
+                         np.asarray(p0, dtype=np.float64) / scale,
+                         x / x_scale, y / y_scale, [1])
+    if fit is None:
+        return np.full(3, np.nan), False, 0
+    return fit.x * scale, True, fit.nfev
+
+
+def fit_decay(x, y, p0=None, select=False):
+    """Fits a biexponential decay to one event.
+
+    The problem is normalised by the span of x and of y before fitting, so
+    it is equally well conditioned in any units.
+
+    Parameters
+    -----------
+    x: 1D array_like
+        time from the start of the decay
+    y: 1D array_like
+    p0: array_like (a1, tau1, a2, tau2, c), default = None
+        starting point; None uses `initial_guess`
+    select: boolean, default = False
+        also fit a single exponential, and keep it (as a2 = 0) when the
+        second component does not improve the fit by the Bayesian
+        information criterion, or the biexponential fit failed. Use it for
+        decays that may be single exponential, where the second component
+        otherwise trades off with the offset.
+
+    Return
+    ------
+    params: array (a1, tau1, a2, tau2, c), tau1 <= tau2; NaN if the fit
+        failed: it did not converge, a time constant reached
+        MAX_TAU_SPAN times the span of x, or the components cancel each
+        other
+    converged: boolean
+    nfev: number of function evaluations
+    """
+    data = _prepare(x, y)
+    if data is None:
+        return np.full(len(PARAMS), np.nan), False, 0
+    x, y = data
+    if p0 is None:
+        p0 = initial_guess(x, y)
+
+    x_scale = np.ptp(x) or 1.
+    y_scale = np.ptp(y) or 1.
+    scale = np.array([y_scale, x_scale, y_scale, x_scale, y_scale])
+    xn, yn = x / x_scale, y / y_scale
+    fit = _least_squares(_residuals, _jacobian,
+                         np.asarray(p0, dtype=np.float64) / scale, xn, yn,
+                         [1, 3])
+    nfev = fit.nfev if fit is not None else 0
+    if fit is not None and _cancelling(fit.x):
+        # the second exponential is not identifiable
+        fit = None
+    params = fit.x if fit is not None else None
+    if select:
+        a, tau, c = _single_guess(x, y)
+        single = _least_squares(_exp_residuals, _exp_jacobian,
+                                [a / y_scale, tau / x_scale, c / y_scale],
+                                xn, yn, [1])
+        if single is not None:
+            nfev += single.nfev
+            if fit is None or _bic(single, len(x)) <= _bic(fit, len(x)):
+                a, tau, c = single.x
+                params = np.array([a, tau, 0., tau, c])
+    if params is None:
+        return np.full(len(PARAMS), np.nan), False, nfev
+
+    params = params * scale
+    if params[1] > params[3]:
+        params = params[[2, 3, 0, 1, 4]]
+    return params, True, nfev
+
+
+def _fit_single(x, y, p0=None):
+    """ fit_exp_decay with p0 and params laid out as PARAMS (a2 = 0) """
+    if p0 is not None:
+        p0 = [p0[0] + p0[2], p0[1], p0[4]]
+    (a, tau, c), converged, nfev = fit_exp_decay(x, y, p0)
+    return np.array([a, tau, 0., tau, c]), converged, nfev
+
+
+def _warm_guess(prev, x, y):
+    """ Previous event's time constants, amplitudes rescaled to this event """
+    c = np.median(y[-max(len(y) // 10, 1):])
+    total = prev[0] + prev[2]
+    if total == 0:
+        return None
+    ratio = (y[0] - c) / total
+    return np.array([prev[0]*ratio, prev[1], prev[2]*ratio, prev[3], c])
+
+
+def _fit_chunk(segments, warm_start=False, select=False, single=False):
+    """Fits each (x, y) segment in turn, starting from the previous
+    converged fit when warm_start, and from `initial_guess` if there is
+    none or the warm started fit fails.
+    """
+    fit = _fit_single if single else partial(fit_decay, select=select)
+    results = []
+    prev = None
+    for x, y in segments:
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        params, converged, nfev = np.full(len(PARAMS), np.nan), False, 0
+        if warm_start and prev is not None and len(y) >= MIN_POINTS:
+            p0 = _warm_guess(prev, x, y)
+            if p0 is not None:
+                params, converged, nfev = fit(x, y, p0)
+        if not converged:
+            params, converged, more = fit(x, y)
+            nfev += more
+        if converged:
+            prev = params
+        results.append((params, converged, nfev))
+    return results
+
+
+def fit_decays(segments, warm_start=False, select=False, single=False,
+               workers=1, chunk_size=256):
+    """Fits a biexponential decay to each of many events.
+
+    Parameters
+    -----------
+    segments: iterable of (x, y) pairs
+        x is the time from the start of each decay, e.g. from the peak
+    warm_start: boolean, default = False
+        start each fit from the fit of the previous event in the same
+        chunk, which saves iterations on similar consecutive events. Fits
+        fall back on `initial_guess` when the warm start fails. Warm
+        started fits can land in a different minimum than cold ones, so
+        their results depend on chunk_size and workers; cold fits (the
+        default) do not.
+    select: boolean, default = False
+        keep a single exponential where the second component is not
+        supported by the data (see `fit_decay`)
+    single: boolean, default = False
+        fit single exponential decays (see `fit_exp_decay`) instead
+    workers: int, default = 1
+        number of processes fitting the events. 1 fits in this process,
+        None uses the ProcessPoolExecutor default.
+    chunk_size: int, default = 256
+        events sent to a worker at a time
+
+    Return
+    ------
+    fits: dataframe
+        One row per event with a1, tau1, a2, tau2, c, weighted tau,
+        converged and nfev (function evaluations) columns. Single
+        exponential fits have a2 = 0 and tau2 = tau1. Parameters are NaN
+        where the fit did not converge.
+    """
+    results = util.map_chunks(partial(_fit_chunk, warm_start=warm_start,
+                                      select=select, single=single),
+                              segments, workers, chunk_size)
+
+    fits = pd.DataFrame([params for params, _, _ in results],
+                        columns=PARAMS, dtype=np.float64)
+    fits['tau'] = weighted_tau(fits[PARAMS].values.T)
+    fits['converged'] = np.array([ok for _, ok, _ in results], dtype=bool)
+    fits['nfev'] = np.array([nfev for _, _, nfev in results], dtype=np.int64)
+    return fits
@@ -0,0 +1,305 @@
+"""
+Array-backed container for linescan profile data.
+"""
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from . import utilities as util
+
+
+class LineScan(object):
+    """
+    Linescan profiles held as one (sweeps x profiles x samples) float32
+    array with a single time base shared by every profile and sweep.
+    Alternative to the wide linescan DataFrames of `read_pv`, which repeat
+    a time column for each profile: profiles and sweeps are views of the
+    array, so profile operations are vectorized over all of them.
+
+    Parameters
+    ----------
+    data: 3D array_like (sweeps x profiles x samples)
+    time: 1D array_like (samples)
+        Time base (seconds).
+    profile_names: list of str (default: None)
+        Defaults to 'Prof 1', 'Prof 2', ...
+    sweep_names: list of str (default: None)
+        Defaults to 'sweep001', 'sweep002', ...
+    dtype: numpy float type (default: np.float32)
+
+    Examples
+    --------
+    >>> ls = read_pv.import_folder(folder, as_array=True)['linescan']
+    >>> ls.profile(1)                   # (sweeps x samples) view of Prof 1
+    >>> ls.sweep('sweep002')            # (profiles x samples) view
+    """
+
+    def __init__(self, data, time, profile_names=None, sweep_names=None,
+                 dtype=np.float32):
+        data = np.asarray(data, dtype=dtype)
+        if data.ndim == 2:
+            data = data[np.newaxis]
+        if data.ndim != 3:
+            raise ValueError('data must be (sweeps x profiles x samples)')
+        num_sweeps, num_profiles, _ = data.shape
+        if profile_names is None:
+            profile_names = ['Prof ' + str(i+1) for i in range(num_profiles)]
+        if sweep_names is None:
+            sweep_names = ['sweep' + str(i+1).zfill(3)
+                           for i in range(num_sweeps)]
+        if len(profile_names) != num_profiles or \
+                len(sweep_names) != num_sweeps or \
+                len(time) != data.shape[2]:
+            raise ValueError('sweep_names, profile_names and time do not '
+                             'match the shape of data {}'.format(data.shape))
+        self.data = data
+        self.time = np.asarray(time, dtype=np.float64)
+        self.profile_names = list(profile_names)
+        self.sweep_names = list(sweep_names)
+        self._profile_pos = {name: i
+                             for i, name in enumerate(self.profile_names)}
+        self._sweep_pos = {name: i for i, name in enumerate(self.sweep_names)}
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __repr__(self):
+        return ('<LineScan: {0} sweeps x {1} profiles x {2} samples>'
+                .format(*self.data.shape))
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def sampling(self):
+        """ Line rate (Hz) """
+        return 1 / (self.time[1] - self.time[0])
+
+    def profile_index(self, profile):
+        """
+        Position of a profile given its number (1-indexed, as in
+        'Prof 1') or its name.
+        """
+        if isinstance(profile, (int, np.integer)):
+            profile = 'Prof ' + str(profile)
+        try:
+            return self._profile_pos[profile]
+        except KeyError:
+            raise KeyError(profile)
+
+    def sweep_index(self, sweep):
+        """ Position of a sweep given its number (1-indexed) or its name """
+        if isinstance(sweep, (int, np.integer)):
+            if not 0 < sweep <= len(self):
+                raise KeyError(sweep)
+            return int(sweep) - 1
+        try:
+            return self._sweep_pos[sweep]
+        except KeyError:
+            raise KeyError(sweep)
+
+    def index_at(self, times, method='nearest'):
+        """ Lookup table of line indexes for times (see `time_index`) """
+        return time_index(self.time, times, method)
+
+    def sample(self, times, method='nearest'):
+        """
+        Profile values at arbitrary times (e.g. the samples of the voltage
+        recording), gathered from the array rather than resampled.
+
+        Parameters
+        ----------
+        times: 1D array_like (seconds)
+        method: str (default: 'nearest')
+            'nearest' line, 'previous' line or 'linear' interpolation
+            between lines. Times outside the time base give NaN.
+
+        Return
+        ------
+        values: array (sweeps x profiles x times)
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if method != 'linear':
+            idx = self.index_at(times, method)
+            values = self.data[:, :, np.clip(idx, 0, None)]
+            values = values.astype(np.result_type(values, np.float32))
+            values[:, :, idx < 0] = np.nan
+            return values
+        idx = self.index_at(times, 'previous')
+        valid = (idx >= 0) & (times <= self.time[-1])
+        i0 = np.clip(idx, 0, len(self.time) - 2)
+        frac = (times - self.time[i0]) / (self.time[i0 + 1] - self.time[i0])
+        values = self.data[:, :, i0] * (1 - frac) + \
+            self.data[:, :, i0 + 1] * frac
+        values[:, :, ~valid] = np.nan
+        return values
+
+    def profile(self, profile):
+        """ (sweeps x samples) view of a profile, by number or name """
+        return self.data[:, self.profile_index(profile)]
+
+    def sweep(self, sweep):
+        """ (profiles x samples) view of a sweep, by number or name """
+        return self.data[self.sweep_index(sweep)]
+
+    def sweep_frame(self, sweep):
+        """ Wide DataFrame of a sweep, laid out as `read_pv.import_ls_csv` """
+        data = self.sweep(sweep)
+        data_dict = OrderedDict()
+        for i, name in enumerate(self.profile_names):
+            data_dict[name + ' time'] = self.time
+            data_dict[name] = data[i]
+        return pd.DataFrame(data_dict)
+
+    def to_frame(self):
+        """
+        ('sweep', 'index') multiindexed wide DataFrame with the layout of
+        the 'linescan' output of `read_pv.import_folder`.
+        """
+        return pd.concat([self.sweep_frame(i+1) for i in range(len(self))],
+                         keys=self.sweep_names, names=['sweep', 'index'])
+
+    @classmethod
+    def from_frames(cls, frames, sweep_names=None, dtype=np.float32):
+        """
+        Builds a LineScan from wide single sweep DataFrames (alternating
+        'Prof N time' and 'Prof N' columns, as from `read_pv.import_ls_csv`)
+        of equal length. The profile time columns must be identical.
+        """
+        frames = list(frames)
+        lengths = set(len(df) for df in frames)
+        if len(lengths) > 1:
+            raise ValueError('Sweeps have different lengths {}'.format(
+                sorted(lengths)))
+        columns = list(frames[0].columns)
+        time_cols, profile_names = columns[::2], columns[1::2]
+        data = np.empty((len(frames), len(profile_names), lengths.pop()),
+                        dtype=dtype)
+        for i, df in enumerate(frames):
+            if list(df.columns) != columns:
+                raise ValueError('Sweeps have different profiles')
+            values = df.to_numpy()
+            if i == 0:
+                time = values[:, 0].astype(np.float64)
+            if not np.allclose(values[:, ::2], time[:, np.newaxis]):
+                raise ValueError('Profiles do not share a time base')
+            data[i] = values[:, 1::2].T
+
+        return cls(data, time, profile_names, sweep_names, dtype)
+
+    @classmethod
+    def from_frame(cls, df, dtype=np.float32):
+        """
+        Builds a LineScan from a wide single sweep DataFrame or from a
+        ('sweep', 'index') multiindexed one.
+        """
+        if isinstance(df.index, pd.MultiIndex):
+            sweep_names = list(df.index.get_level_values(0).unique())
+            return cls.from_frames([df.xs(name, level=0)
+                                    for name in sweep_names],
+                                   sweep_names, dtype)
+        return cls.from_frames([df], dtype=dtype)
+
+
+def time_index(timebase, times, method='nearest'):
+    """
+    Lookup table between two time bases: the index of the sample of
+    timebase matching each time, computed arithmetically for regularly
+    sampled time bases (binary search otherwise) instead of by time masks.
+
+    Parameters
+    ----------
+    timebase: 1D array_like, sorted (seconds)
+        e.g. LineScan.time or the time column of a voltage recording.
+    times: array_like (seconds)
+        e.g. the voltage recording time column, or spike times.
+    method: str (default: 'nearest')
+        'nearest' sample, or 'previous' (last sample at or before).
+
+    Return
+    ------
+    idx: int array shaped like times; -1 where times fall outside the time
+        base (more than half a sample away for 'nearest').
+    """
+    timebase = np.asarray(timebase, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    if method not in ('nearest', 'previous'):
+        raise ValueError("method must be 'nearest' or 'previous'")
+    n = len(timebase)
+    step = (timebase[-1] - timebase[0]) / (n - 1) if n > 1 else 1.
+    regular = n > 1 and np.allclose(np.diff(timebase), step,
+                                    rtol=1e-6, atol=0)
+    if regular:
+        # last sample at or before the time (or half a sample after it)
+        shift = step / 2 if method == 'nearest' else 0.
+        idx = util.sample_index(times + shift, 1 / step, 'right',
+                                timebase[0]) - 1
+    else:
+        idx = np.searchsorted(timebase, times, side='right') - 1
+        if method == 'nearest':
+            nxt = np.clip(idx + 1, 0, n - 1)
+            cur = np.clip(idx, 0, n - 1)
+            closer = np.abs(timebase[nxt] - times) < \
+                np.abs(times - timebase[cur])
+            idx = np.where(closer | (idx < 0), idx + 1, idx)
+    half = step / 2 if method == 'nearest' else 0.
+    outside = (times < timebase[0] - half) | \
+        (times > timebase[-1] + (half if method == 'nearest' else step)) | \
+        (idx < 0) | (idx >= n)
+    return np.where(outside, -1, idx)
+
+
+def event_triggered(scan, events, pre, post):
+    """
+    Profile snippets around events (e.g. spikes detected in the voltage
+    recording), gathered in one indexing operation.
+
+    Parameters
+    ----------
+    scan: LineScan
+    events: dataframe with 'sweep' and 'time' columns, or iterable of
+        (sweep, time) pairs. Sweeps by name or number (1-indexed).
+    pre, post: positive numbers (seconds)
+        span of each snippet before and after its event.
+
+    Return
+    ------
+    lags: 1D array (seconds), line times relative to the event
+    snippets: array (events x profiles x lags); NaN where a snippet
+        extends past the start or end of its sweep.
+    """
+    if isinstance(events, pd.DataFrame):
+        events = zip(events['sweep'], events['time'])
+    events = list(events)
+    sweeps, times = zip(*events) if len(events) else ((), ())
+    sweep_idx = np.array([scan.sweep_index(s) for s in sweeps],
+                         dtype=np.int64)
+    centers = scan.index_at(np.asarray(times, dtype=np.float64))
+    dt = scan.time[1] - scan.time[0]
+    offsets = np.arange(-int(round(pre / dt)), int(round(post / dt)) + 1)
+
+    idx = centers[:, np.newaxis] + offsets
+    invalid = (centers[:, np.newaxis] < 0) | (idx < 0) | \
+        (idx >= len(scan.time))
+    snippets = scan.data[sweep_idx[:, np.newaxis, np.newaxis],
+                         np.arange(len(scan.profile_names))[:, np.newaxis],
+                         np.clip(idx, 0, len(scan.time) - 1)[:, np.newaxis]]
+    snippets = snippets.astype(np.result_type(snippets, np.float32))
+    snippets[np.broadcast_to(invalid[:, np.newaxis], snippets.shape)] = np.nan
+
+    return offsets * dt, snippets
+
+
+def event_triggered_average(scan, events, pre, post):
+    """
+    Event (e.g. spike) triggered average of every profile. See
+    `event_triggered`.
+
+    Return
+    ------
+    lags: 1D array (seconds)
+    average: array (profiles x lags), NaN snippet samples ignored
+    """
+    lags, snippets = event_triggered(scan, events, pre, post)
+    return lags, np.nanmean(snippets, axis=0)
@@ -1,7 +1,13 @@
 """ Functions for analyzing membrane properties of a cell """
 
+import numpy as np
+import pandas as pd
 from scipy.integrate import trapz
+from . import fitting
 from . import utilities as util
+from .sweeps import SweepArray
+
+PROP_COLUMNS = ['Ra', 'Rm', 'Cm', 'Tau', 'Fit converged']
 
 
 def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
@@ -38,7 +44,8 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
     Electrophysiology - User Guide, pages 163-166.
     """
     # have to make copy of df to not modify original df with calculation
-    data = df.copy()
+    # (this also applies the scaling of frames read with raw=True)
+    data = util.to_float(df)
 
     # conversions - pulse_amp is in mVs, data.primary is in pAs
     pulse_amp *= 1e-3
@@ -48,13 +55,14 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
     data = util.baseline(data, bsl_start, bsl_end)
 
     # i_baseline is defined as average current over baseline region
-    i_baseline = data.primary[(data.time >= bsl_start) &
-                              (data.time <= bsl_end)].mean()
+    i_baseline = data.primary.iloc[
+        util.time_window(data, bsl_start, bsl_end)].mean()
 
     # i_ss is the stead-state current during the pulse, taken between 70% and
     # 90% of pulse duration
-    i_ss = data.primary[(data.time >= pulse_start + pulse_dur*0.7) &
-                        (data.time <= pulse_start + pulse_dur*0.9)].mean()
+    i_ss = data.primary.iloc[
+        util.time_window(data, pulse_start + pulse_dur*0.7,
+                         pulse_start + pulse_dur*0.9)].mean()
 
     # calculate delta_i -- i.e. difference between baseline current amplitude
     # and steady-state current amplitude
@@ -73,7 +81,7 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
 
     peak = peak_df['Peak Amp'].values[0]
     peak_time = peak_df['Peak time'].values[0]
-    tau, x_vals, y_vals, fit_vals, ix1, ix2 = util.calc_decay(data, peak, peak_time, True)
+    tau, x_vals, y_vals, fit_vals, ix1, ix2 = util.calc_decay(data, peak, peak_time, True, select=True)
 
     # take integral of curve to get q1
     fit_sub = data.loc[ix1:ix2, :]
@@ -94,3 +102,240 @@ def calc_mem_prop(df, bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp):
     cm = (qt * rt) / (pulse_amp * rm)
 
     return ra*1e-6, rm*1e-6, cm*1e12, tau*1e3
+
+
+def calc_mem_prop_all(data, bsl_start, bsl_end, pulse_start, pulse_dur,
+                      pulse_amp, average=False, workers=1, chunk_size=256):
+    """Calculates membrane access resistance (ra), membrane resistance (rm),
+    membrane capacitance (cm) and membrane time constant (tau) of every
+    sweep, as calc_mem_prop does for one sweep.
+
+    Baselines, steady-state currents, peaks, fit bounds and charges are
+    computed for all sweeps at once on the (sweeps x samples) current
+    array, without frame copies; the capacitive transients are fitted
+    by `fitting.fit_decays`, in a process pool. A single exponential is
+    kept unless the data support a second component, since the
+    transients of a single compartment cell are single exponential.
+
+    Input Parameters
+    -----------------
+    data: multi-sweep dataframe or SweepArray
+        should contain time and primary columns, e.g. the output of read_abf
+    bsl_start, bsl_end, pulse_start, pulse_dur, pulse_amp: see calc_mem_prop
+    average: boolean, default = False
+        analyze the average of all sweeps rather than each sweep
+    workers: int, default = 1
+        number of processes fitting the transients. 1 fits in this
+        process, None uses the ProcessPoolExecutor default.
+    chunk_size: int, default = 256
+        sweeps sent to a worker at a time
+
+    Return
+    ------
+    props: dataframe
+        indexed by sweep ('average' if average) with Ra (MOhm), Rm (MOhm),
+        Cm (pF), Tau (ms) and Fit converged columns. Values are NaN where
+        the transient could not be fitted.
+    """
+    if not isinstance(data, SweepArray):
+        data = SweepArray.from_frame(data[['time', 'primary']])
+    values = data.channel('primary').astype(np.float64)
+    sweep_names = list(data.sweep_names)
+    if average:
+        values = values.mean(axis=0, keepdims=True)
+        sweep_names = ['average']
+
+    props = _mem_prop(values, data.time, bsl_start, bsl_end, pulse_start,
+                      pulse_dur, pulse_amp, workers, chunk_size)
+    props.index = pd.Index(sweep_names, name='sweep')
+    return props
+
+
+def _mem_prop(values, time, bsl_start, bsl_end, pulse_start, pulse_dur,
+              pulse_amp, workers, chunk_size):
+    """calc_mem_prop of each row of a (sweeps x samples) current array (pA),
+    which is modified in place. Returns a dataframe with a default index.
+    """
+    if pulse_amp == 0:
+        raise ValueError('pulse_amp must be non-zero')
+    time = np.asarray(time, dtype=np.float64)
+    # conversions - pulse_amp is in mVs, values are in pAs
+    values *= 1e-12
+    pulse_amp *= 1e-3
+    rows = np.arange(len(values))
+
+    # baseline, then i_baseline (average current over baseline region) and
+    # i_ss (steady-state current, between 70% and 90% of pulse duration)
+    bsl = util.time_window(time, bsl_start, bsl_end)
+    values -= values[:, bsl].mean(axis=1)[:, np.newaxis]
+    i_baseline = values[:, bsl].mean(axis=1)
+    steady = util.time_window(time, pulse_start + pulse_dur*0.7,
+                              pulse_start + pulse_dur*0.9)
+    delta_i = values[:, steady].mean(axis=1) - i_baseline
+    values -= delta_i[:, np.newaxis]
+
+    # peak of the transient, then the decay fit bounds
+    pulse = util.time_window(time, pulse_start, pulse_start + pulse_dur)
+    argpeak = np.argmax if pulse_amp > 0 else np.argmin
+    peak_idx = argpeak(values[:, pulse], axis=1) + pulse.start
+    ix1, ix2 = util.decay_bounds(values, peak_idx, sign=pulse_amp)
+    valid = (ix1 >= 0) & (ix2 >= 0)
+
+    segments = [(time[i1:i2 + 1] - time[i1], values[s, i1:i2 + 1])
+                if ok else ((), ())
+                for s, (i1, i2, ok) in enumerate(zip(ix1, ix2, valid))]
+    fits = fitting.fit_decays(segments, select=True, workers=workers,
+                              chunk_size=chunk_size)
+    tau = fits['tau'].values
+
+    # q1: integral of the transient between the fit bounds (cumulative
+    # trapezoids of every sweep), q2: charge from i_baseline to i_ss
+    charge = np.zeros_like(values)
+    charge[:, 1:] = np.cumsum((values[:, 1:] + values[:, :-1]) / 2 *
+                              np.diff(time), axis=1)
+    q1 = np.where(valid, charge[rows, ix2] - charge[rows, ix1], np.nan)
+    q2 = tau * delta_i
+    qt = q1 + q2
+
+    # resistance and capacitance calculations
+    ra = (tau*pulse_amp)/qt
+    rt = (pulse_amp)/delta_i
+    rm = rt - ra
+    cm = (qt * rt) / (pulse_amp * rm)
+
+    return pd.DataFrame({'Ra': ra*1e-6, 'Rm': rm*1e-6, 'Cm': cm*1e12,
+                         'Tau': tau*1e3,
+                         'Fit converged': fits['converged'].values},
+                        columns=PROP_COLUMNS)
+
+
+class MembraneMonitor(object):
+    """Streaming Ra/Rm/Cm/tau of periodic test pulses in a continuous
+    recording. Consumes the recording chunk by chunk (e.g. from
+    `read_abf.ContinuousABF.iter_chunks`), analyzes each test pulse as soon
+    as its epoch (baseline + pulse) is complete and emits the new
+    measurements. Only the samples of the pulse epoch in progress are kept
+    between updates, so memory does not grow with the recording.
+
+    Parameters
+    ----------
+    first_pulse: number (time, seconds)
+        onset of the first test pulse, in the time base of the chunks
+    period: positive number (time, seconds)
+        interval between test pulse onsets
+    pulse_dur, pulse_amp:
+        See `calc_mem_prop`.
+    bsl_dur: positive number (time, seconds), default = None
+        duration of the baseline epoch right before each pulse. None uses
+        pulse_dur / 2.
+    channel: string, default = 'primary'
+        current channel (pA)
+    workers: int, default = 1
+        number of processes fitting the transients (see
+        `fitting.fit_decays`). Updates usually hold a few pulses, which are
+        fitted faster in this process.
+
+    Examples
+    --------
+    >>> rec = read_abf.ContinuousABF(glob('2017_05_04_*.abf'))
+    >>> monitor = MembraneMonitor(0.5, 10., 0.02, -5)
+    >>> for chunk in rec.iter_chunks(60., channels=['primary']):
+    ...     new = monitor.update(chunk)
+    ...     if (new.Ra > 25).any():
+    ...         print('access resistance above 25 MOhm')
+    >>> props = monitor.output()     # indexed by pulse onset time
+    """
+
+    def __init__(self, first_pulse, period, pulse_dur, pulse_amp,
+                 bsl_dur=None, channel='primary', workers=1):
+        if period < pulse_dur:
+            raise ValueError('period must be longer than pulse_dur')
+        self.first_pulse = first_pulse
+        self.period = period
+        self.pulse_dur = pulse_dur
+        self.pulse_amp = pulse_amp
+        self.bsl_dur = pulse_dur / 2. if bsl_dur is None else bsl_dur
+        self.channel = channel
+        self.workers = workers
+        self.sampling = None
+        # samples of the epoch in progress, and index of its pulse
+        self._time = np.empty(0)
+        self._values = np.empty(0)
+        self._next = 0
+        self._results = []
+
+    def __len__(self):
+        return sum(len(df) for df in self._results)
+
+    def _epoch_start(self, pulse):
+        return self.first_pulse + pulse*self.period - self.bsl_dur
+
+    def update(self, chunk):
+        """Adds the next chunk of the recording and analyzes the test pulses
+        completed by it. Samples overlapping the previous chunks are
+        ignored, and pulses whose epoch started before the first chunk are
+        skipped.
+
+        Parameters
+        ----------
+        chunk: dataframe
+            time (seconds) and channel columns, as yielded by
+            `ContinuousABF.iter_chunks`; raw frames are scaled.
+
+        Return
+        ------
+        new: dataframe
+            Ra (MOhm), Rm (MOhm), Cm (pF), Tau (ms) and Fit converged of the
+            new pulses, indexed by pulse onset time.
+        """
+        time = chunk['time'].values.astype(np.float64)
+        values = util.scaled(chunk, self.channel)
+        if len(self._time):
+            new = time > self._time[-1]
+            time, values = time[new], values[new]
+        time = np.concatenate([self._time, time])
+        values = np.concatenate([self._values, values])
+        if self.sampling is None and len(time) > 1:
+            self.sampling = 1 / (time[1] - time[0])
+        if self.sampling is None:
+            self._time, self._values = time, values
+            return self._empty()
+
+        half = 0.5 / self.sampling
+        num_samples = int(round((self.bsl_dur + self.pulse_dur) *
+                                self.sampling)) + 1
+        skip = np.ceil((time[0] - half - self._epoch_start(0)) / self.period)
+        self._next = max(self._next, int(skip))
+        starts = []
+        onsets = []
+        while True:
+            start = np.searchsorted(time, self._epoch_start(self._next) - half)
+            if start + num_samples > len(time):
+                break
+            starts.append(start)
+            onsets.append(self._epoch_start(self._next) + self.bsl_dur)
+            self._next += 1
+        # keep the samples from the start of the next epoch on
+        cut = np.searchsorted(time, self._epoch_start(self._next) - half)
+        self._time, self._values = time[cut:], values[cut:]
+        if not starts:
+            return self._empty()
+
+        epochs = values[np.array(starts)[:, np.newaxis] +
+                        np.arange(num_samples)]
+        props = _mem_prop(epochs, np.arange(num_samples) / self.sampling, 0,
+                          self.bsl_dur, self.bsl_dur, self.pulse_dur,
+                          self.pulse_amp, self.workers, 256)
+        props.index = pd.Index(onsets, name='time')
+        self._results.append(props)
+        return props
+
+    def _empty(self):
+        return pd.DataFrame(columns=PROP_COLUMNS,
+                            index=pd.Index([], name='time', dtype=float))
+
+    def output(self):
+        """ Measurements of every pulse analyzed so far, by onset time """
+        if not self._results:
+            return self._empty()
+        return pd.concat(self._results)
@@ -7,6 +7,7 @@ from scipy.stats import gaussian_kde
 from scipy.signal import periodogram
 from scipy.signal import spectrogram
 import pandas as pd
+from . import utilities as util
 
 
 def _create_epoch(df, window, step):
@@ -145,7 +146,7 @@ def epoch_hist(df, window, step, channel, hist_min, hist_max, num_bins):
     index = pd.MultiIndex.from_product(arrays, names=['sweep', 'epoch', None])
 
     for epoch in epochs:
-        hist, bins = np.histogram(epoch[channel],
+        hist, bins = np.histogram(util.scaled(epoch, channel),
                                   bins=num_bins, range=(hist_min, hist_max))
         hist_arrays.append(hist)
         bin_arrays.append(bins[:-1])
@@ -222,7 +223,7 @@ def epoch_kde(df, window, step, channel, range_min, range_max,
     index = pd.MultiIndex.from_product(arrays, names=['sweep', 'epoch', None])
 
     for epoch in epochs:
-        kde = gaussian_kde(epoch[channel])
+        kde = gaussian_kde(util.scaled(epoch, channel))
         kde_data = kde(x)
         kde_arrays.append(kde_data)
         x_arrays.append(x)
@@ -287,7 +288,7 @@ def epoch_pgram(df, window, step, channel, fs=10e3):
     index = pd.MultiIndex.from_product(arrays, names=['sweep', 'epoch', None])
 
     for epoch in epochs:
-        f, den = periodogram(epoch[channel], fs)
+        f, den = periodogram(util.scaled(epoch, channel), fs)
         f_arrays.append(f)
         den_arrays.append(den)
 
@@ -337,15 +338,15 @@ def nu_spectrogram(df, window, step, channel, fs=10e3, f_trim=(0,100)):
 
     # compute the spectrogram. f=sample frequencies, t=segment times
     if len(sweeps) == 1:
-        f, t, Sxx = spectrogram(df[channel], fs,
+        f, t, Sxx = spectrogram(util.scaled(df, channel), fs,
                                 nperseg=window, noverlap=noverlap)
         t -= t[0]  # left align the spectrogram time values
         df = pd.DataFrame(Sxx,index=f,columns=t).loc[f_trim[0]:f_trim[1]]
     else:
         df_list = []
         for sweep in sweeps:
-            f, t, Sxx = spectrogram(df[channel].xs(sweep), fs,
-                                    nperseg=window, noverlap=noverlap)
+            f, t, Sxx = spectrogram(util.scaled(df.xs(sweep), channel),
+                                    fs, nperseg=window, noverlap=noverlap)
             t -= t[0]  # left align the spectrogram time values
             df_list.append(
             pd.DataFrame(Sxx,index=f,columns=t).loc[f_trim[0]:f_trim[1]])
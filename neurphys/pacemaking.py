@@ -135,6 +135,8 @@ def baseline_pacemaking(df, n=200):
     values are not baselined. At the sampling frequencies normally used this
     should not be a major concern, though.
     """
+    if df.attrs.get('scale'):
+        df = util.to_float(df)
     smoothed = util.simple_smoothing(df.primary.values, n)
     df.primary -= np.nan_to_num(smoothed)
 
@@ -172,10 +174,10 @@ def calc_freq(df, mph, mpd, valley=False, hz=True,
 
     ret_vals = []
     if valley:
-        indices = detect_peaks(df['primary'].values, mph=abs(mph),
+        indices = detect_peaks(util.scaled(df, 'primary'), mph=abs(mph),
                                valley=valley, mpd=mpd)
     else:
-        indices = detect_peaks(df['primary'].values, mph=mph, mpd=mpd)
+        indices = detect_peaks(util.scaled(df, 'primary'), mph=mph, mpd=mpd)
     times = df.loc[indices, 'time'].values
     times_dif = times[1:] - times[:-1]
 
@@ -2,14 +2,25 @@
 Functions to import and manipulate Axon Binary Files.
 """
 
+import datetime
+import struct
+import warnings
 from collections import OrderedDict
-from neo import io
 import pandas as pd
 import numpy as np
+from . import cache as nu_cache
+from . import utilities as nu_util
+from .sweeps import SweepArray
+
+BLOCKSIZE = 512
+# bump whenever the DataFrame returned by read_abf changes, so that cached
+# copies made by older versions are not reused
+CACHE_VERSION = 1
+
 
 def _all_ints(ii):
     """ Determines if list or tuples contains only integers """
-    return all(isinstance(i, int) for i in ii)
+    return all(isinstance(i, (int, np.integer)) for i in ii)
 
 
 def _all_strs(ii):
@@ -17,90 +28,968 @@ def _all_strs(ii):
     return all(isinstance(i, str) for i in ii)
 
 
-def read_abf(filepath):
+def _sweep_name(num):
+    """ Formats a 1-indexed sweep number as a sweep name """
+    return 'sweep' + str(num).zfill(3)
+
+
+# ABF1 keeps everything in one fixed header: (name, byte offset, format)
+_ABF1_HEADER = [
+    ('fFileVersionNumber', 4, 'f'),
+    ('nOperationMode', 8, 'h'),
+    ('lActualAcqLength', 10, 'i'),
+    ('nNumPointsIgnored', 14, 'h'),
+    ('lFileStartDate', 20, 'i'),
+    ('lFileStartTime', 24, 'i'),
+    ('lDataSectionPtr', 40, 'i'),
+    ('lSynchArrayPtr', 92, 'i'),
+    ('lSynchArraySize', 96, 'i'),
+    ('nDataFormat', 100, 'h'),
+    ('nADCNumChannels', 120, 'h'),
+    ('fADCSampleInterval', 122, 'f'),
+    ('fSynchTimeUnit', 130, 'f'),
+    ('fADCRange', 244, 'f'),
+    ('lADCResolution', 252, 'i'),
+    ('nFileStartMillisecs', 366, 'h'),
+    ('nADCSamplingSeq', 410, '16h'),
+    ('sADCUnits', 602, '8s' * 16),
+    ('fADCProgrammableGain', 730, '16f'),
+    ('fInstrumentScaleFactor', 922, '16f'),
+    ('fInstrumentOffset', 986, '16f'),
+    ('fSignalGain', 1050, '16f'),
+    ('fSignalOffset', 1114, '16f'),
+    ('nTelegraphEnable', 4512, '16h'),
+    ('fTelegraphAdditGain', 4576, '16f'),
+]
+
+# ABF2 section index entries, in file order, starting at byte 76
+_ABF2_SECTIONS = ['ProtocolSection', 'ADCSection', 'DACSection',
+                  'EpochSection', 'ADCPerDACSection', 'EpochPerDACSection',
+                  'UserListSection', 'StatsRegionSection', 'MathSection',
+                  'StringsSection', 'DataSection', 'TagSection',
+                  'ScopeSection', 'DeltaSection', 'VoiceTagSection',
+                  'SynchArraySection', 'AnnotationSection', 'StatsSection']
+
+# ABF2 protocol and per-channel ADC fields: (name, byte offset, format)
+_ABF2_PROTOCOL = [
+    ('nOperationMode', 0, '<i2'),
+    ('fADCSequenceInterval', 2, '<f4'),
+    ('fSynchTimeUnit', 14, '<f4'),
+    ('fADCRange', 110, '<f4'),
+    ('lADCResolution', 118, '<i4'),
+]
+
+_ABF2_ADC = [
+    ('nTelegraphEnable', 2, '<i2'),
+    ('fTelegraphAdditGain', 6, '<f4'),
+    ('fADCProgrammableGain', 28, '<f4'),
+    ('fInstrumentScaleFactor', 40, '<f4'),
+    ('fInstrumentOffset', 44, '<f4'),
+    ('fSignalGain', 48, '<f4'),
+    ('fSignalOffset', 52, '<f4'),
+    ('lADCChannelNameIndex', 74, '<i4'),
+    ('lADCUnitsIndex', 78, '<i4'),
+]
+
+
+def _struct_dtype(fields, itemsize=None):
+    """ Builds a numpy structured dtype from (name, offset, format) fields """
+    names, offsets, formats = zip(*fields)
+    spec = {'names': names, 'offsets': offsets, 'formats': formats}
+    if itemsize is not None:
+        spec['itemsize'] = itemsize
+    return np.dtype(spec)
+
+
+def _decode_units(units):
+    """ Cleans up a raw ABF unit string (padding removed, mu -> u) """
+    units = units.split(b'\x00')[0].replace(b' ', b'').replace(b'\xb5', b'u')
+    return units.decode('utf-8', 'replace')
+
+
+def _read_header_v1(f):
+    """ Parses the fixed ABF1 (pCLAMP <= 9) header """
+    f.seek(0)
+    buf = f.read(12 * BLOCKSIZE).ljust(12 * BLOCKSIZE, b'\x00')
+    h = {}
+    for name, offset, fmt in _ABF1_HEADER:
+        val = struct.unpack_from('<' + fmt, buf, offset)
+        h[name] = val[0] if len(val) == 1 else np.array(val)
+
+    dtype = np.dtype('<i2') if h['nDataFormat'] == 0 else np.dtype('<f4')
+    num_channels = int(h['nADCNumChannels'])
+    chan_ids = [c for c in h['nADCSamplingSeq'] if c >= 0][:num_channels]
+
+    return {'dtype': dtype,
+            'num_channels': num_channels,
+            'data_offset': (h['lDataSectionPtr'] * BLOCKSIZE +
+                            h['nNumPointsIgnored'] * dtype.itemsize),
+            'total_size': h['lActualAcqLength'],
+            'mode': h['nOperationMode'],
+            'synch_offset': h['lSynchArrayPtr'] * BLOCKSIZE,
+            'synch_size': h['lSynchArraySize'],
+            'synch_time_unit': h['fSynchTimeUnit'],
+            'sampling': 1 / (h['fADCSampleInterval'] * num_channels * 1e-6),
+            'start_date': h['lFileStartDate'],
+            'start_ms': h['lFileStartTime'] * 1000 + h['nFileStartMillisecs'],
+            'adc_range': h['fADCRange'],
+            'adc_resolution': h['lADCResolution'],
+            'units': [_decode_units(h['sADCUnits'][c]) for c in chan_ids],
+            'adc': {name: h[name][chan_ids] for name in
+                    ['fADCProgrammableGain', 'fInstrumentScaleFactor',
+                     'fInstrumentOffset', 'fSignalGain', 'fSignalOffset',
+                     'nTelegraphEnable', 'fTelegraphAdditGain']}}
+
+
+def _read_header_v2(f):
+    """ Parses the ABF2 (pCLAMP >= 10) header and the sections it points to """
+    f.seek(0)
+    buf = f.read(BLOCKSIZE)
+    start_date, start_ms = struct.unpack_from('<II', buf, 16)
+    data_format, = struct.unpack_from('<H', buf, 30)
+    sections = {}
+    for i, name in enumerate(_ABF2_SECTIONS):
+        sections[name] = struct.unpack_from('<IIq', buf, 76 + i * 16)
+
+    def read_section(name, dtype=None):
+        block, size, entries = sections[name]
+        f.seek(block * BLOCKSIZE)
+        if dtype is None:
+            return f.read(size)
+        return np.frombuffer(f.read(size * entries), dtype=dtype,
+                             count=entries)
+
+    protocol = read_section('ProtocolSection', _struct_dtype(
+        _ABF2_PROTOCOL, sections['ProtocolSection'][1]))[0]
+    adc = read_section('ADCSection', _struct_dtype(
+        _ABF2_ADC, sections['ADCSection'][1]))
+
+    # strings are indexed from the last double null, as in pyABF
+    strings = read_section('StringsSection')
+    strings = strings[strings.rfind(b'\x00\x00'):].split(b'\x00')[1:]
+
+    dtype = np.dtype('<i2') if data_format == 0 else np.dtype('<f4')
+    _, _, num_channels = sections['ADCSection']
+    synch_block, _, synch_size = sections['SynchArraySection']
+    data_block, _, total_size = sections['DataSection']
+
+    return {'dtype': dtype,
+            'num_channels': int(num_channels),
+            'data_offset': data_block * BLOCKSIZE,
+            'total_size': total_size,
+            'mode': protocol['nOperationMode'],
+            'synch_offset': synch_block * BLOCKSIZE,
+            'synch_size': synch_size,
+            'synch_time_unit': protocol['fSynchTimeUnit'],
+            'sampling': 1e6 / protocol['fADCSequenceInterval'],
+            'start_date': start_date,
+            'start_ms': start_ms,
+            'adc_range': protocol['fADCRange'],
+            'adc_resolution': protocol['lADCResolution'],
+            'units': [_decode_units(strings[i]) for i in adc['lADCUnitsIndex']],
+            'adc': {name: adc[name] for name, _, _ in _ABF2_ADC}}
+
+
+def _abf_layout(filepath):
     """
-    Imports ABF file using neo io AxonIO, breaks it down by blocks
-    which are then processed into a multidimensional pandas dataframe
-    where each block corresponds to a sweep and columns represent time
-    and each recorded channel.
+    Reads the ABF1/ABF2 header and works out where each sweep lives in the
+    data section, along with the per-channel units and int16 -> float
+    scaling.
+
+    Return
+    ------
+    layout: dict
+        dtype, data offset (bytes), number of channels, total number of
+        multiplexed samples, sampling rate (Hz), sweep row bounds
+        (n_sweeps x 2 array of [start, stop) rows), channel units,
+        gains, offsets and the recording start (datetime, None if the
+        header has no date).
+    """
+    with open(filepath, 'rb') as f:
+        signature = f.read(4)
+        if signature == b'ABF ':
+            h = _read_header_v1(f)
+        elif signature == b'ABF2':
+            h = _read_header_v2(f)
+        else:
+            raise IOError('{} is not an ABF file'.format(filepath))
+
+        # sweep lengths (in multiplexed samples) come from the synch array
+        # of event-driven (1, 2) and episodic (5) files. Gap free files (3)
+        # may list their data in chunks too, but hold a single sweep
+        if h['synch_size'] > 0 and h['mode'] in (1, 2, 5):
+            f.seek(h['synch_offset'])
+            synch = np.fromfile(f, dtype=[('offset', '<i4'), ('len', '<i4')],
+                                count=h['synch_size'])
+            lengths = synch['len'].astype(np.int64)
+            if h['synch_time_unit'] != 0 and h['mode'] == 1:
+                lengths = (lengths / h['synch_time_unit']).astype(np.int64)
+        else:
+            lengths = np.array([h['total_size']], dtype=np.int64)
+
+    num_channels = h['num_channels']
+    rows = lengths // num_channels
+    stops = np.cumsum(rows)
+    bounds = np.column_stack([stops - rows, stops])
+
+    if h['dtype'].kind == 'i':
+        adc = h['adc']
+        gains = (h['adc_range'] / adc['fInstrumentScaleFactor'] /
+                 adc['fSignalGain'] / adc['fADCProgrammableGain'] /
+                 h['adc_resolution']).astype(np.float64)
+        telegraph = adc['nTelegraphEnable'] != 0
+        gains[telegraph] /= adc['fTelegraphAdditGain'][telegraph]
+        offsets = (adc['fInstrumentOffset'] -
+                   adc['fSignalOffset']).astype(np.float64)
+    else:
+        gains = np.ones(num_channels)
+        offsets = np.zeros(num_channels)
+
+    return {'dtype': h['dtype'],
+            'data_offset': h['data_offset'],
+            'num_channels': num_channels,
+            'total_size': int(stops[-1]) * num_channels,
+            'sampling': float(h['sampling']),
+            'bounds': bounds,
+            'units': h['units'],
+            'gains': gains,
+            'offsets': offsets,
+            'start_time': _start_time(h['start_date'], h['start_ms'])}
+
+
+def _start_time(date, ms):
+    """ datetime from an ABF yyyymmdd date and milliseconds since midnight """
+    try:
+        day = datetime.datetime.strptime(str(int(date)), '%Y%m%d')
+    except ValueError:
+        return None
+    return day + datetime.timedelta(milliseconds=int(ms))
+
+
+class LazyABF(object):
+    """
+    Memory-mapped view of an Axon Binary File. Only the header is read on
+    creation; samples are decoded from disk for the sweeps, channels and
+    time windows that are actually requested.
+
+    Parameters
+    ----------
+    filepath: str
+        Full filepath WITH '.abf' extension.
+
+    Attributes
+    ----------
+    sweep_names: list of str
+        Sweep names, formatted as in `read_abf` ('sweep001', ...).
+    channels: list of str
+        Channel names, formatted as in `read_abf` ('primary', 'channel_1', ...).
+    channel_units: list of str
+        Units of the time column followed by each channel.
+    sampling: float
+        Sampling rate (Hz).
+    start_time: datetime
+        Start of the recording, from the file header (None if unset).
+
+    Examples
+    --------
+    >>> abf = LazyABF('cell1.abf')
+    >>> sweep = abf.sweep(3, channels=['primary'], t_start=0.1, t_stop=0.3)
+    >>> df = abf.to_frame()  # same layout as read_abf(filepath)
+    """
+
+    def __init__(self, filepath):
+        layout = _abf_layout(filepath)
+        self.filepath = filepath
+        self.sampling = layout['sampling']
+        self.start_time = layout['start_time']
+        self._bounds = layout['bounds']
+        self._gains = layout['gains']
+        self._offsets = layout['offsets']
+        num_channels = layout['num_channels']
+        self._raw = np.memmap(filepath, dtype=layout['dtype'], mode='r',
+                              offset=layout['data_offset'],
+                              shape=(layout['total_size'] // num_channels,
+                                     num_channels))
+        self.channels = ['primary'] + ['channel_{0}'.format(str(i+1))
+                                       for i in range(num_channels-1)]
+        self.channel_units = ['s'] + layout['units']
+        self.sweep_names = [_sweep_name(i+1) for i in range(len(self._bounds))]
+
+    def __len__(self):
+        return len(self.sweep_names)
+
+    def __iter__(self):
+        for sweep in self.sweep_names:
+            yield self.sweep(sweep)
+
+    def __getitem__(self, sweep):
+        return self.sweep(sweep)
+
+    def __repr__(self):
+        return '<LazyABF {0}: {1} sweeps x {2} channels at {3:g} Hz>'.format(
+            self.filepath, len(self), len(self.channels), self.sampling)
+
+    def _sweep_index(self, sweep):
+        """ 0-indexed position of a sweep number (1-indexed) or name """
+        if isinstance(sweep, (int, np.integer)):
+            pos = int(sweep) - 1
+            if not 0 <= pos < len(self):
+                raise KeyError(_sweep_name(sweep))
+            return pos
+        try:
+            return self.sweep_names.index(sweep)
+        except ValueError:
+            raise KeyError(sweep)
+
+    def _channel_index(self, channels):
+        """ Column positions of channel names or (0-indexed) numbers """
+        if channels is None:
+            return list(range(len(self.channels)))
+        if isinstance(channels, (str, int, np.integer)):
+            channels = [channels]
+        if _all_ints(channels):
+            idx = list(channels)
+        elif _all_strs(channels):
+            missing = [ch for ch in channels if ch not in self.channels]
+            if missing:
+                raise KeyError(missing)
+            idx = [self.channels.index(ch) for ch in channels]
+        else:
+            raise TypeError(
+            'Channels should either be channel names or integers')
+        if any(not 0 <= i < len(self.channels) for i in idx):
+            raise KeyError(channels)
+        return idx
+
+    def _window(self, pos, t_start=None, t_stop=None):
+        """
+        Memory map rows [start, stop) of the inclusive t_start/t_stop window
+        of the sweep at position pos, and the in-sweep index of row start.
+        """
+        start, stop = self._bounds[pos]
+        length = stop - start
+        i_start = 0 if t_start is None else max(
+            nu_util.sample_index(t_start, self.sampling, 'left'), 0)
+        i_stop = length if t_stop is None else min(
+            nu_util.sample_index(t_stop, self.sampling, 'right'), length)
+        i_stop = max(i_stop, i_start)
+        return start + i_start, start + i_stop, i_start
+
+    def sweep_length(self, sweep):
+        """ Number of samples in a sweep """
+        start, stop = self._bounds[self._sweep_index(sweep)]
+        return int(stop - start)
+
+    def _selection(self, sweeps, channels, t_start, t_stop):
+        """
+        Resolves a sweeps/channels/time window request into sweep names,
+        channel positions, memory map windows and window lengths.
+        """
+        if sweeps is None:
+            sweeps = self.sweep_names
+        elif isinstance(sweeps, (str, int, np.integer)):
+            sweeps = [sweeps]
+        positions = list(OrderedDict.fromkeys(self._sweep_index(s)
+                                              for s in sweeps))
+        names = [self.sweep_names[pos] for pos in positions]
+        ch_idx = self._channel_index(channels)
+        windows = [self._window(pos, t_start, t_stop) for pos in positions]
+        lengths = np.array([stop - start for start, stop, _ in windows],
+                           dtype=np.int64)
+        return names, ch_idx, windows, lengths
+
+    def _frame(self, time, data, ch_idx, raw, index=None):
+        """
+        DataFrame of a time vector and a (samples x channels) data array.
+        Raw frames keep the per-channel scaling in df.attrs.
+        """
+        data_dict = OrderedDict([('time', time)])
+        for i, ch in enumerate(ch_idx):
+            data_dict[self.channels[ch]] = data[:, i]
+        df = pd.DataFrame(data_dict, index=index, copy=False)
+        if raw:
+            df.attrs['scale'] = OrderedDict(
+                (self.channels[ch], float(self._gains[ch])) for ch in ch_idx)
+            df.attrs['offset'] = OrderedDict(
+                (self.channels[ch], float(self._offsets[ch])) for ch in ch_idx)
+        return df
+
+    def sweep(self, sweep, channels=None, t_start=None, t_stop=None,
+              raw=False):
+        """
+        Decodes a single sweep into a DataFrame with a time column and
+        one column per requested channel.
+
+        Parameters
+        ----------
+        sweep: int or str
+            Sweep number (1-indexed) or sweep name, e.g. 3 or 'sweep003'.
+        channels: list of str or int (default: None)
+            Channel names or column numbers (primary = 0). None keeps all.
+        t_start, t_stop: float (seconds, default: None)
+            Inclusive time window relative to the start of the sweep.
+            None reads from the start/to the end of the sweep.
+        raw: boolean, default = False
+            keep samples as stored in the file (int16 ADC counts, or
+            float32) and put the per-channel scale and offset in df.attrs
+            instead of converting to float64. See utilities.scaled.
+
+        Return
+        ------
+        df: DataFrame
+        """
+        start, stop, i_start = self._window(self._sweep_index(sweep),
+                                            t_start, t_stop)
+        ch_idx = self._channel_index(channels)
+
+        # only these rows/columns are paged in from the memory map
+        data = self._raw[start:stop, ch_idx]
+        if not raw:
+            data = data * self._gains[ch_idx] + self._offsets[ch_idx]
+        time = np.arange(i_start, i_start + len(data)) / self.sampling
+
+        return self._frame(time, data, ch_idx, raw)
+
+    def to_frame(self, sweeps=None, channels=None, t_start=None, t_stop=None,
+                 raw=False):
+        """
+        Decodes the requested sweeps into the ('sweep', 'index')
+        multiindexed DataFrame returned by `read_abf`.
+
+        Parameters
+        ----------
+        sweeps: list of int or str (default: None)
+            Sweep numbers (1-indexed) or sweep names. None keeps all.
+        channels, t_start, t_stop, raw:
+            See `LazyABF.sweep`.
+
+        Return
+        ------
+        df: DataFrame
+            Pandas DataFrame broken down by sweep.
+        """
+        names, ch_idx, windows, lengths = self._selection(sweeps, channels,
+                                                          t_start, t_stop)
+
+        # copy the raw samples of every sweep into one block, then apply
+        # the time base and channel scaling to the whole block at once
+        time = np.empty(lengths.sum())
+        data = np.empty((lengths.sum(), len(ch_idx)), order='F',
+                        dtype=self._raw.dtype if raw else np.float64)
+        row = 0
+        for (start, stop, i_start), length in zip(windows, lengths):
+            time[row:row + length] = np.arange(i_start, i_start + length)
+            data[row:row + length] = self._raw[start:stop, ch_idx]
+            row += length
+        time /= self.sampling
+        if not raw:
+            data *= self._gains[ch_idx]
+            data += self._offsets[ch_idx]
+
+        index = pd.MultiIndex(
+            levels=[names, np.arange(lengths.max() if len(lengths) else 0)],
+            codes=[np.repeat(np.arange(len(names)), lengths),
+                   np.concatenate([np.arange(n) for n in lengths] or [[]])],
+            names=['sweep', 'index'])
+        df = self._frame(time, data, ch_idx, raw, index)
+        df.channel_units = ['s'] + [self.channel_units[i+1] for i in ch_idx]
+
+        return df
+
+    def to_array(self, sweeps=None, channels=None, t_start=None, t_stop=None,
+                 raw=False):
+        """
+        Decodes the requested sweeps into a SweepArray (sweeps x samples x
+        channels). All requested sweeps must have the same length.
+
+        Parameters
+        ----------
+        sweeps, channels, t_start, t_stop, raw:
+            See `LazyABF.to_frame`.
+
+        Return
+        ------
+        sa: SweepArray
+        """
+        names, ch_idx, windows, lengths = self._selection(sweeps, channels,
+                                                          t_start, t_stop)
+        if len(set(lengths)) > 1:
+            raise ValueError('Sweeps have different lengths, '
+                             'use to_frame instead')
+        num_samples = lengths[0] if len(lengths) else 0
+        data = np.empty((len(names), num_samples, len(ch_idx)),
+                        dtype=self._raw.dtype if raw else np.float64)
+        for i, (start, stop, _) in enumerate(windows):
+            data[i] = self._raw[start:stop, ch_idx]
+        if not raw:
+            data *= self._gains[ch_idx]
+            data += self._offsets[ch_idx]
+        i_start = windows[0][2] if windows else 0
+        time = np.arange(i_start, i_start + num_samples) / self.sampling
+        channel_names = [self.channels[i] for i in ch_idx]
+        scale = offset = None
+        if raw:
+            scale = dict(zip(channel_names, self._gains[ch_idx].tolist()))
+            offset = dict(zip(channel_names, self._offsets[ch_idx].tolist()))
+
+        return SweepArray(data, time, channel_names, names,
+                          ['s'] + [self.channel_units[i+1] for i in ch_idx],
+                          scale, offset)
+
+
+class ContinuousABF(object):
+    """
+    One continuous recording made of several consecutive gap free .abf
+    files, as split by the acquisition software. Files are ordered by the
+    start time in their headers and stitched end to end; samples are read
+    lazily from the memory-mapped files, so the whole session is never
+    loaded.
+
+    Parameters
+    ----------
+    paths: list of str
+        .abf files of the session, in any order. They must share sampling
+        rate, channels and units.
+
+    Attributes
+    ----------
+    files: list of LazyABF
+        Files in recording order.
+    file_starts: array of int
+        Sample index at which each file starts (plus the total length).
+    gaps: array of float
+        Seconds between the end of each file and the start of the next,
+        from the header start times (NaN where unknown). Samples are
+        stitched end to end whatever the gaps.
+    channels, channel_units, sampling:
+        As in LazyABF.
+
+    Examples
+    --------
+    >>> rec = ContinuousABF(glob('2017_05_04_*.abf'))
+    >>> df = rec.window(600, 660, channels=['primary'])
+    >>> for chunk in rec.iter_chunks(60., channels=['primary']):
+    ...     freq = pacemaking.calc_freq(chunk, mph=-20, mpd=100)
+    """
+
+    def __init__(self, paths):
+        files = [LazyABF(path) for path in paths]
+        if not files:
+            raise ValueError('No files given')
+        if any(f.start_time is None for f in files):
+            warnings.warn('Some files have no start time, '
+                          'keeping the given file order')
+        else:
+            files.sort(key=lambda f: f.start_time)
+        first = files[0]
+        for f in files[1:]:
+            if (f.sampling != first.sampling or f.channels != first.channels
+                    or f.channel_units != first.channel_units):
+                raise ValueError('{0} does not match the sampling rate and '
+                                 'channels of {1}'.format(f.filepath,
+                                                          first.filepath))
+        self.files = files
+        self.sampling = first.sampling
+        self.channels = first.channels
+        self.channel_units = first.channel_units
+        self.start_time = first.start_time
+        lengths = [len(f._raw) for f in files]
+        self.file_starts = np.concatenate([[0], np.cumsum(lengths)])
+        self.gaps = np.array([
+            (b.start_time - a.start_time).total_seconds() -
+            n / self.sampling
+            if a.start_time is not None and b.start_time is not None
+            else np.nan
+            for a, b, n in zip(files[:-1], files[1:], lengths[:-1])])
+
+    def __len__(self):
+        return int(self.file_starts[-1])
+
+    def __repr__(self):
+        return ('<ContinuousABF: {0} files, {1:g} s x {2} channels '
+                'at {3:g} Hz>'.format(len(self.files), self.duration,
+                                      len(self.channels), self.sampling))
+
+    @property
+    def duration(self):
+        """ Length of the whole session (seconds) """
+        return len(self) / self.sampling
+
+    def read(self, start, stop, channels=None, raw=False):
+        """
+        Samples [start, stop) of the session as a (samples x channels)
+        array, across file boundaries.
+
+        Parameters
+        ----------
+        start, stop: int
+            Sample indices from the start of the first file.
+        channels: list of str or int (default: None)
+            Channel names or column numbers. None keeps all.
+        raw: boolean, default = False
+            return the stored samples (int16 ADC counts or float32) instead
+            of scaled float64 values. Files may have different gains, so
+            raw chunks spanning several files are only meaningful when the
+            gains match.
+        """
+        start = max(int(start), 0)
+        stop = min(int(stop), len(self))
+        ch_idx = self.files[0]._channel_index(channels)
+        dtype = self.files[0]._raw.dtype if raw else np.float64
+        out = np.empty((max(stop - start, 0), len(ch_idx)), dtype=dtype)
+        first = np.searchsorted(self.file_starts, start, side='right') - 1
+        pos = start
+        for i in range(max(first, 0), len(self.files)):
+            if pos >= stop:
+                break
+            f = self.files[i]
+            lo = pos - self.file_starts[i]
+            hi = min(stop, self.file_starts[i+1]) - self.file_starts[i]
+            chunk = f._raw[lo:hi, ch_idx]
+            dest = out[pos - start:pos - start + len(chunk)]
+            if raw:
+                dest[:] = chunk
+            else:
+                np.multiply(chunk, f._gains[ch_idx], out=dest)
+                dest += f._offsets[ch_idx]
+            pos += len(chunk)
+        return out
+
+    def _window_frame(self, start, stop, ch_idx, raw):
+        data = self.read(start, stop, ch_idx, raw)
+        time = np.arange(start, start + len(data)) / self.sampling
+        return self.files[0]._frame(time, data, ch_idx, raw)
+
+    def window(self, t_start=None, t_stop=None, channels=None, raw=False):
+        """
+        DataFrame (time + channel columns) of an inclusive time window of
+        the session, with time in seconds from the start of the first file.
+        Takes the place of a single sweep in the analysis functions.
+        """
+        start = 0 if t_start is None else \
+            nu_util.sample_index(t_start, self.sampling, 'left')
+        stop = len(self) if t_stop is None else \
+            nu_util.sample_index(t_stop, self.sampling, 'right')
+        ch_idx = self.files[0]._channel_index(channels)
+        return self._window_frame(start, stop, ch_idx, raw)
+
+    def iter_chunks(self, duration, overlap=0., channels=None, raw=False):
+        """
+        Streams the session as consecutive DataFrames of `duration`
+        seconds, each starting `duration - overlap` seconds after the
+        previous one. The last chunk may be shorter.
+
+        Yields
+        ------
+        df: DataFrame (time + channel columns)
+        """
+        size = int(round(duration * self.sampling))
+        step = size - int(round(overlap * self.sampling))
+        if size <= 0 or step <= 0:
+            raise ValueError('duration must be positive and longer than '
+                             'overlap')
+        ch_idx = self.files[0]._channel_index(channels)
+        for start in range(0, len(self), step):
+            yield self._window_frame(start, start + size, ch_idx, raw)
+            if start + size >= len(self):
+                break
+
+
+def read_abf(filepath, sweeps=None, channels=None, t_start=None,
+             t_stop=None, raw=False, as_array=False, lazy=False, cache=False):
+    """
+    Imports ABF file into a multidimensional pandas dataframe where each
+    block corresponds to a sweep and columns represent time and each
+    recorded channel. Only the requested sweeps, channels and time window
+    are decoded from the memory-mapped data section, so unwanted data is
+    never copied into memory.
 
     Parameters
     ----------
     filename: str
         Full filepath WITH '.abf' extension.
+    sweeps: 1D array_like of ints or properly formatted strings
+        Sweeps to load. Example: [1,4,6] or ['sweep001', 'sweep004'].
+        Default (None) loads every sweep.
+    channels: 1D array_like of ints or channel names
+        Channels to load, by column number (primary = 0) or name.
+        Example: ['primary'] or [0, 2]. Default (None) loads every channel.
+    t_start: positive number (seconds)
+        Beginning of the time window to load in every sweep.
+        Default (None) loads from the start of the sweep.
+    t_stop: positive number (seconds)
+        End of the time window (inclusive) to load in every sweep.
+        Default (None) loads to the end of the sweep.
+    raw: boolean, default = False
+        keep samples as stored in the file (int16 ADC counts, or float32)
+        instead of float64, a quarter of the memory for int16 files. The
+        per-channel scale and offset are kept in df.attrs['scale'] and
+        df.attrs['offset']; analysis functions scale the windows they use
+        (see utilities.scaled) and utilities.to_float converts the frame.
+    as_array: boolean, default = False
+        return a SweepArray (sweeps x samples x channels) instead of a
+        DataFrame. All loaded sweeps must have the same length.
+    lazy: boolean, default = False
+        return a memory-mapped LazyABF instead of decoding every sweep.
+        Use LazyABF.to_frame() to get the same DataFrame later on.
+    cache: boolean or str, default = False
+        keep the decoded DataFrame in the on-disk cache (see neurphys.cache)
+        and memory-map it on later calls for the same, unmodified file.
+        True uses the default cache directory, a string sets it.
 
     Return
     ------
     df: DataFrame
-        Pandas DataFrame broken down by sweep.
+        Pandas DataFrame broken down by sweep. The time column is
+        relative to the start of each sweep, even when t_start is given.
+    **if lazy == True:
+        LazyABF of the file (pass sweeps, channels, t_start, t_stop and
+        raw to LazyABF.to_frame() or LazyABF.to_array() instead)
+    **if as_array == True:
+        SweepArray of the selected data
 
     References
     ----------
-    [1] https://neo.readthedocs.org/en/latest/index.html
-    """
-
-    r = io.AxonIO(filename=filepath)
-    bl = r.read_block(lazy=False, cascade=True)
-    num_channels = len(bl.segments[0].analogsignals)
-    df_list = []
-    sweep_list = []
-    units = ['s']
-
-    for seg_num, seg in enumerate(bl.segments):
-        channels = ['primary']+['channel_{0}'.format(str(i+1))
-                                for i in range(num_channels-1)]
-        signals = []
-        for i in range(num_channels):
-            data = np.array(bl.segments[seg_num].analogsignals[i].data)
-            signals.append(data.T[0])
-            unit = bl.segments[seg_num].analogsignals[i].units
-            units.append(str(unit).split()[-1])
-        data_dict = OrderedDict(zip(channels, signals))
-        time = seg.analogsignals[0].times - seg.analogsignals[0].times[0]
-        data_dict.update({'time': time})
-        data_dict.move_to_end('time', last=False)
-        df = pd.DataFrame(data_dict)
-        df_list.append(df)
-        sweep_list.append('sweep' + str(seg_num + 1).zfill(3))
-    df = pd.concat(df_list, keys=sweep_list, names=['sweep', 'index'])
-    df.channel_units = units
+    [1] http://www.moleculardevices.com/pages/software/developer_info.html
+    [2] https://swharden.com/pyabf/abf2-file-format/
+    [3] https://neo.readthedocs.org/en/latest/index.html (header layout)
+    """
+
+    if lazy:
+        return LazyABF(filepath)
+
+    if cache:
+        params = {'sweeps': sweeps, 'channels': channels,
+                  't_start': t_start, 't_stop': t_stop, 'raw': raw}
+
+        def build():
+            df = read_abf(filepath, sweeps, channels, t_start, t_stop, raw)
+            return {'data': df}, {'channel_units': df.channel_units}
+
+        frames, meta = nu_cache.memoize(filepath, 'read_abf', CACHE_VERSION,
+                                        build, cache, params)
+        df = frames['data']
+        df.channel_units = meta['channel_units']
+        return SweepArray.from_frame(df) if as_array else df
+
+    abf = LazyABF(filepath)
+    if as_array:
+        return abf.to_array(sweeps=sweeps, channels=channels,
+                            t_start=t_start, t_stop=t_stop, raw=raw)
+    return abf.to_frame(sweeps=sweeps, channels=channels,
+                        t_start=t_start, t_stop=t_stop, raw=raw)
+
+
+def iter_abf_sweeps(filepath, sweeps=None, channels=None, t_start=None,
+                    t_stop=None, raw=False):
+    """
+    Streams an .abf file one sweep at a time. Only the sweep being yielded
+    is decoded, so memory use is bounded by one sweep however long the
+    protocol is.
+
+    Parameters
+    ----------
+    filepath: str
+    sweeps, channels, t_start, t_stop, raw:
+        See `read_abf`.
+
+    Yields
+    ------
+    sweep_name, df: str, DataFrame
+        Name of the sweep (e.g. 'sweep003') and a single sweep DataFrame
+        (time + channel columns) with a `channel_units` attribute, as
+        taken by the analysis functions.
+
+    Examples
+    --------
+    >>> for name, df in iter_abf_sweeps('cell1.abf', channels=['primary']):
+    ...     peak = synaptics.analyze_current(df, 0, 0.1, 0.2, 0.3)
+    """
+    abf = LazyABF(filepath)
+    if sweeps is None:
+        sweeps = abf.sweep_names
+    elif isinstance(sweeps, (str, int, np.integer)):
+        sweeps = [sweeps]
+    ch_idx = abf._channel_index(channels)
+    units = ['s'] + [abf.channel_units[i+1] for i in ch_idx]
+    for sweep in OrderedDict.fromkeys(abf._sweep_index(s) for s in sweeps):
+        df = abf.sweep(sweep + 1, channels=ch_idx, t_start=t_start,
+                       t_stop=t_stop, raw=raw)
+        df.channel_units = units
+        yield abf.sweep_names[sweep], df
+
+
+def _read_abf_safe(args):
+    """
+    read_abf for worker processes. Returns (df, channel_units, error),
+    since the channel_units attribute does not survive pickling and errors
+    are reported instead of raised.
+    """
+    filepath, kwargs = args
+    try:
+        df = read_abf(filepath, **kwargs)
+        return df, df.channel_units, None
+    except Exception as err:
+        return None, None, '{0}: {1}'.format(type(err).__name__, err)
+
+
+def read_abf_many(paths, workers=1, **kwargs):
+    """
+    Imports many ABF files in parallel into one DataFrame, with a 'file'
+    index level above the 'sweep' and 'index' levels of `read_abf`.
+
+    Parameters
+    ----------
+    paths: list of str
+        Full filepaths WITH '.abf' extension.
+    workers: int (default: 1)
+        Number of worker processes. 1 reads the files one after the other
+        in this process, None uses every CPU.
+    **kwargs:
+        Passed on to `read_abf` (sweeps, channels, t_start, t_stop, raw,
+        cache).
+
+    Return
+    ------
+    df: DataFrame
+        Pandas DataFrame broken down by file and sweep. Files that could
+        not be read are skipped; they are listed with their error in
+        `df.failed_files` and reported with a warning. Raises ValueError if
+        the files do not share channel units.
+    """
+    paths = list(paths)
+    results = nu_util.map_chunks(_read_abf_safe,
+                                 [(path, kwargs) for path in paths], workers)
+
+    frames = OrderedDict()
+    failed = OrderedDict()
+    units = OrderedDict()
+    for path, (df, channel_units, err) in zip(paths, results):
+        if err is None:
+            frames[path] = df
+            units[path] = channel_units
+        else:
+            failed[path] = err
+    if failed:
+        warnings.warn('Could not read {0} of {1} files:\n{2}'.format(
+            len(failed), len(paths),
+            '\n'.join('{0} ({1})'.format(*item) for item in failed.items())))
+    if not frames:
+        raise IOError('None of the files could be read')
+
+    scalings = set(repr(sorted(f.attrs.items())) for f in frames.values())
+    if len(scalings) > 1:
+        raise ValueError('Files have different channel scaling, '
+                         'read them with raw=False')
+    first_units = next(iter(units.values()))
+    mismatched = [path for path, u in units.items() if u != first_units]
+    if mismatched:
+        raise ValueError('Files have different channel units than {0} '
+                         '({1}): {2}'.format(next(iter(units)), first_units,
+                                             ', '.join(mismatched)))
+    df = pd.concat(frames.values(), keys=frames.keys(),
+                   names=['file', 'sweep', 'index'])
+    df.channel_units = first_units
+    df.failed_files = failed
 
     return df
 
 
+def _sweep_keys(sweep_list):
+    """ Sweep names for a list of sweep numbers (1-indexed) or names """
+    if _all_ints(sweep_list):
+        return [_sweep_name(i) for i in sweep_list]
+    elif _all_strs(sweep_list):
+        return list(sweep_list)
+    else:
+        raise TypeError(
+        'List should either be appropriate sweep names or integers')
+
+
+def _sweep_runs(df):
+    """
+    Row ranges of each sweep of a ('sweep', 'index') multiindexed DataFrame.
+
+    Return
+    ------
+    runs: OrderedDict of sweep name: array of row positions, in the order
+        the sweeps appear in df.
+    """
+    codes = np.asarray(df.index.codes[0])
+    names = df.index.levels[0]
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate([[0], starts]) if len(codes) else starts
+    stops = np.append(starts[1:], len(codes))
+    run_codes = codes[starts]
+    runs = OrderedDict()
+    if len(np.unique(run_codes)) == len(run_codes):
+        # every sweep is one contiguous block of rows (the usual layout)
+        for code, start, stop in zip(run_codes, starts, stops):
+            runs[names[code]] = np.arange(start, stop)
+    else:
+        for code in OrderedDict.fromkeys(run_codes):
+            runs[names[code]] = np.flatnonzero(codes == code)
+    return runs
+
+
+def _take_sweeps(df, sweep_names, runs):
+    """
+    Rows of the given sweeps, in order. A single contiguous block of rows is
+    taken as a slice (no copy of the data), anything else with one take.
+    """
+    rows = [runs[name] for name in sweep_names]
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+    if len(rows) and np.array_equal(rows, np.arange(rows[0],
+                                                    rows[0] + len(rows))):
+        out = df.iloc[rows[0]:rows[0] + len(rows)]
+    else:
+        out = df.iloc[rows]
+    if hasattr(df, 'channel_units'):
+        out.channel_units = df.channel_units
+    return out
+
+
+def _check_sweeps(sweep_names, available):
+    missing = [name for name in sweep_names if name not in available]
+    if missing:
+        raise KeyError('Sweeps not found: {}'.format(missing))
+
+
 def keep_sweeps(df, sweep_list):
     """
     Keeps specified sweeps from your DataFrame.
 
     Parameters
     ----------
-    df: Pandas DataFrame
+    df: Pandas DataFrame or SweepArray
         Dataframe created using one of the functions from Neurphys.
     sweep_list: 1D array_like of ints or properly formatted strings
-        List containing numbers of the sweeps you'd like dropped from the
+        List containing numbers of the sweeps you'd like to keep in the
         DataFrame. Example: [1,4,6] or ['sweep001', 'sweep004', 'sweep006']
 
     Return
     ------
-    keep_df: Pandas Dataframe
-        Dataframe containing only the sweeps you want to keep.
+    keep_df: Pandas Dataframe or SweepArray
+        Dataframe containing only the sweeps you want to keep, in the order
+        of sweep_list. When these are one contiguous block of rows the data
+        is not copied.
 
     Notes
     -----
     Some type checks are made, but not enough to cover the plethora of
-    potential inputs, so read the docs if you're having trouble.
+    potential inputs, so read the docs if you're having trouble. Raises a
+    KeyError naming every sweep that is not in df.
     """
 
-    if _all_ints(sweep_list):
-        keep_sweeps = [('sweep'+str(i).zfill(3)) for i in sweep_list]
-    elif _all_strs(sweep_list):
-        keep_sweeps = sweep_list
-    else:
-        raise TypeError(
-        'List should either be appropriate sweep names or integers')
-    keep_df = df.loc[keep_sweeps]
+    keep = list(OrderedDict.fromkeys(_sweep_keys(sweep_list)))
+    if isinstance(df, SweepArray):
+        _check_sweeps(keep, set(df.sweep_names))
+        return df.select(sweeps=keep)
+
+    runs = _sweep_runs(df)
+    _check_sweeps(keep, runs)
 
-    return keep_df
+    return _take_sweeps(df, keep, runs)
 
 
 def drop_sweeps(df, sweep_list):
@@ -109,7 +998,7 @@ def drop_sweeps(df, sweep_list):
 
     Parameters
     ----------
-    df: Pandas DataFrame
+    df: Pandas DataFrame or SweepArray
         Dataframe created using one of the functions from Neurphys. It must
         be multiindexed for the function to work properly.
     sweep_list: 1D array_like of ints or properly formatted strings
@@ -118,31 +1007,24 @@ def drop_sweeps(df, sweep_list):
 
     Return
     ------
-    drop_df: Pandas Dataframe
-        Dataframe containing only the sweeps you want to keep.
+    drop_df: Pandas Dataframe or SweepArray
+        Dataframe containing only the sweeps you want to keep, in their
+        original order.
 
     Notes
     -----
-    Making the grand assumption that the df.index.level[0]=='sweeps'
+    Making the grand assumption that the df.index.level[0]=='sweeps'.
+    Raises a KeyError naming every sweep that is not in df.
     """
 
-    if _all_ints(sweep_list):
-        drop_sweeps = [('sweep'+str(i).zfill(3)) for i in sweep_list]
-    elif _all_strs(sweep_list):
-        drop_sweeps = sweep_list
-    else:
-        raise TypeError(
-        'List should either be appropriate sweep names or integers')
-
-    all_sweeps = df.index.levels[0].values
-
-    if drop_sweeps[0] in all_sweeps:
-        pass
-    else:
-        raise KeyError('Cannot index a multi-index axis with these keys')
+    drop = set(_sweep_keys(sweep_list))
+    if isinstance(df, SweepArray):
+        _check_sweeps(sorted(drop), set(df.sweep_names))
+        return df.select(sweeps=[name for name in df.sweep_names
+                                 if name not in drop])
 
-    # keep_sweeps = list(set(all_sweeps).difference(drop_sweeps))
-    keep_sweeps = list(set(all_sweeps) ^ set(drop_sweeps))
-    drop_df = df.loc[keep_sweeps]
+    runs = _sweep_runs(df)
+    _check_sweeps(sorted(drop), runs)
 
-    return drop_df
+    return _take_sweeps(df, [name for name in runs if name not in drop],
+                        runs)
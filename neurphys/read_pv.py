@@ -1,10 +1,30 @@
 
 """ Module for importing PraireView5.0+ generated .csv files."""
 
+import hashlib
+import json
 import os
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import numpy as np
 import pandas as pd
 from lxml import etree
 from glob import glob
+from . import archive as nu_archive
+from . import cache as nu_cache
+from . import utilities as nu_util
+from .linescan import LineScan
+from .sweeps import SweepArray
+
+# bump whenever the output of import_folder changes, so that cached
+# copies made by older versions are not reused
+CACHE_VERSION = 2
+# folder metadata indexes, inside the cache directory (see folder_index)
+INDEX_DIRNAME = 'folder_index'
+INDEX_VERSION = 1
 
 
 def _get_ephys_vals(element):
@@ -27,42 +47,56 @@ def _get_ephys_vals(element):
 
 
 def parse_xml(filename):
-    """Parses VoltageRecording .xml file to get experiment metadata"""
+    """Parses VoltageRecording .xml file to get experiment metadata
 
-    tree = etree.parse(filename)
-    # find all elements associated with enabled channels
-    enabled_ch = tree.xpath('.//Enabled[text()="true"]')
+    The file is streamed (lxml iterparse) in a single pass instead of
+    running one XPath scan of the whole tree per value, and each channel
+    element is freed once read.
+    """
+    first = {'DataFile': None, 'AssociatedLinescanProfileFile': None,
+             'Rate': None, 'AcquisitionTime': None}
 
-    file_attr = {}
     ch_names = []
     divisors = {}
     units = {}
-    for ch in enabled_ch:
-        parent = ch.getparent()
-        if parent.find('.//Type').text == 'Physical':
-            clamp_device = parent.find('.//PatchclampDevice').text
-            name = parent.find('.//Name').text.lower()
+    for _, elem in etree.iterparse(filename, events=('end',)):
+        if elem.tag in first:
+            if first[elem.tag] is None:
+                first[elem.tag] = elem.text
+            continue
+        # channels are the elements with an Enabled child
+        enabled = elem.find('Enabled')
+        if enabled is None:
+            continue
+        if enabled.text == 'true' and \
+                elem.find('.//Type').text == 'Physical':
+            clamp_device = elem.find('.//PatchclampDevice').text
+            name = elem.find('.//Name').text.lower()
             ch_names.append(name)
 
             if clamp_device is not None:
-                unit, divisor = _get_ephys_vals(parent)
+                unit, divisor = _get_ephys_vals(elem)
                 divisors[name] = divisor
                 units[name] = unit
             else:
                 units[name] = 'V'
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
 
+    file_attr = {}
     file_attr['channels'] = ch_names
     file_attr['divisors'] = divisors
     file_attr['units'] = units
     # gets sampling rate
-    file_attr['sampling'] = int((tree.find('.//Rate')).text)
+    file_attr['sampling'] = int(first['Rate'])
     # gets recording time, converts to sec
-    file_attr['duration'] = (int((tree.find('.//AcquisitionTime')).text))/1000
+    file_attr['duration'] = int(first['AcquisitionTime'])/1000
 
     # finds the voltage recording csv file name
-    datafile = (tree.find('.//DataFile')).text
+    datafile = first['DataFile']
     # finds the linescan profile file name (if doesn't exist, will be None)
-    ls_file = (tree.find('.//AssociatedLinescanProfileFile')).text
+    ls_file = first['AssociatedLinescanProfileFile']
 
     # If ls_file is none this could mean that there is no linescan associated
     # with that voltage recording file or that the file passed to parse_vr is
@@ -83,39 +117,289 @@ def parse_xml(filename):
     return file_attr
 
 
-def import_vr_csv(filename, col_names, divisors):
+def _index_path(folder, cache):
+    """ File keeping the metadata index of folder in the cache directory """
+    name = hashlib.sha1(os.path.abspath(folder).encode('utf-8')).hexdigest()
+    return os.path.join(nu_cache.get_cache_dir(cache), INDEX_DIRNAME,
+                        name + '.json')
+
+
+def folder_index(folder, cache=False):
+    """Metadata index of every VoltageRecording XML in a data folder.
+
+    With cache, the index is kept in the cache directory (see
+    neurphys.cache), never in the data folder. XML files whose size and
+    modification time match the stored entry are not parsed again; new or
+    modified ones are parsed (see `parse_xml`) and the stored index is
+    rewritten.
+
+    Parameters
+    ----------
+    folder: string
+        Full path to data folder.
+    cache: boolean or string, default = False
+        keep the index between calls. True uses the default cache
+        directory, a string sets it. An index that cannot be written is
+        only rebuilt on the next call.
+
+    Return
+    ------
+    index: OrderedDict
+        XML file name: file attributes (as returned by `parse_xml`), in
+        acquisition order.
+    """
+    index_file = _index_path(folder, cache) if cache else None
+    stored = {}
+    if index_file is not None:
+        try:
+            with open(index_file) as f:
+                stored = json.load(f)
+            if stored.get('version') != INDEX_VERSION:
+                stored = {}
+        except (IOError, OSError, ValueError):
+            stored = {}
+    entries = stored.get('files', {})
+
+    changed = set(entries) != set(os.path.basename(f)
+                                  for f in _vr_xmls(folder))
+    index = OrderedDict()
+    files = OrderedDict()
+    for file in _vr_xmls(folder):
+        name = os.path.basename(file)
+        st = os.stat(file)
+        entry = entries.get(name)
+        if entry is None or entry['size'] != st.st_size or \
+                entry['mtime_ns'] != st.st_mtime_ns:
+            entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+                     'attributes': parse_xml(file)}
+            changed = True
+        files[name] = entry
+        index[name] = entry['attributes']
+
+    if index_file is not None and changed:
+        tmp = index_file + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump({'version': INDEX_VERSION,
+                           'folder': os.path.abspath(folder),
+                           'files': files}, f)
+            os.replace(tmp, index_file)
+        except OSError:
+            pass
+
+    return index
+
+
+def index_table(folders, cache=False):
+    """Lists the VoltageRecording XMLs of many data folders as one table,
+    from their metadata indexes (see `folder_index`), e.g. to select the
+    sessions to import.
+
+    Parameters
+    ----------
+    folders: list of strings
+        Full paths to data folders.
+    cache: boolean or string, default = False
+        See `folder_index`.
+
+    Return
+    ------
+    table: dataframe
+        One row per XML file with the folder, file, channels, units,
+        sampling, duration and the linked voltage recording and linescan
+        files.
+    """
+    rows = []
+    for folder in folders:
+        for name, attr in folder_index(folder, cache).items():
+            rows.append(OrderedDict([
+                ('folder', folder),
+                ('file', name),
+                ('channels', attr['channels']),
+                ('units', [attr['units'][ch] for ch in attr['channels']]),
+                ('sampling', attr['sampling']),
+                ('duration', attr['duration']),
+                ('voltage recording file', attr['voltage recording file']),
+                ('linescan file', attr['linescan file'])]))
+
+    return pd.DataFrame(rows, columns=['folder', 'file', 'channels', 'units',
+                                       'sampling', 'duration',
+                                       'voltage recording file',
+                                       'linescan file'])
+
+
+def _read_scaled_csv(filename, names, scale, times, dtype, engine,
+                     spaced=False, **kwargs):
+    """
+    Reads a csv of numeric columns with an explicit dtype (no type
+    inference) and multiplies each column by its scale factor, one column
+    at a time so that at most one extra column is held in memory. times
+    selects the time columns, which stay float64 whatever dtype. names
+    None takes them from the header. spaced files separate fields with
+    ', ' rather than ','.
+    """
+    if names is None:
+        names = list(pd.read_csv(filename, nrows=0,
+                                 skipinitialspace=spaced).columns)
+        kwargs.update(skiprows=1, header=None)
+    time_cols = set(times(names))
+    dtypes = {name: np.dtype(np.float64 if name in time_cols else dtype)
+              for name in names}
+    if spaced and engine == 'pyarrow':
+        # pyarrow has no skipinitialspace: read the fields as text, the
+        # float conversion of each column below strips the spaces
+        kwargs['dtype'] = str
+    else:
+        kwargs['dtype'] = dtypes
+        if spaced:
+            kwargs['skipinitialspace'] = True
+    df = pd.read_csv(filename, names=names, engine=engine, **kwargs)
+    for name, factor in zip(names, scale(names)):
+        column = df[name].to_numpy(dtype=dtypes[name])
+        if factor != 1:
+            column = column * dtypes[name].type(factor)
+        df[name] = column
+
+    return df
+
+
+def import_vr_csv(filename, col_names, divisors, dtype=np.float64,
+                  engine='c'):
     """
     Reads voltage recording .csv file into a pandas dataframe.
     Will convert primary and secondary channels to appropriate values if those
     channels are in the file.
 
+    dtype sets the float type of the channels (e.g. np.float32 to halve
+    memory use); time is always float64. engine is the pd.read_csv engine; 'pyarrow' (multithreaded,
+    if installed) can be faster on large files.
+
     Returns a dataframe
     """
     col_names = ['time'] + col_names
-    df = pd.read_csv(filename, names=col_names, skiprows=1)
-    df.time /= 1000
-
-    for ch, divisor in divisors.items():
-        df[ch] /= divisor
+    # time is stored in ms; channels are divided by their unit divisor
+    scale = lambda columns: [1e-3] + [1 / divisors.get(ch, 1.)
+                                      for ch in columns[1:]]
 
-    return df
+    return _read_scaled_csv(filename, col_names, scale,
+                            lambda columns: columns[:1], dtype, engine,
+                            skiprows=1, header=None)
 
 
-def import_ls_csv(filename):
+def import_ls_csv(filename, dtype=np.float64, engine='c'):
     """
     Reads linescan profile .csv file into pandas dataframe.
+    dtype and engine are as in `import_vr_csv`.
     Returns a dataframe
     """
-
-    df = pd.read_csv(filename, skipinitialspace=True)
-    df.rename(columns=lambda header: header.strip('(ms)'), inplace=True)
     # time columns occur as every other column, starting with column 0
-    df.loc[:, ::2] /= 1000
+    scale = lambda columns: [1e-3 if i % 2 == 0 else 1.
+                             for i in range(len(columns))]
+    df = _read_scaled_csv(filename, None, scale,
+                          lambda columns: columns[::2], dtype, engine,
+                          spaced=True)
+    df.rename(columns=lambda header: header.strip().strip('(ms)'),
+              inplace=True)
 
     return df
 
 
-def import_folder(folder):
+def _vr_xmls(folder):
+    """ VoltageRecording XML files of a folder, in acquisition order """
+    return sorted(glob(os.path.join(folder, '*_VoltageRecording_*.xml')))
+
+
+def iter_pv_sweeps(folder, dtype=np.float64, engine='c'):
+    """Streams a data folder one sweep (VoltageRecording XML) at a time, so
+    that memory use is bounded by one sweep.
+
+    Parameters
+    ----------
+    folder: string
+        Full path to data folder (see `import_folder`).
+    dtype: numpy float type, default = np.float64
+        type of the dataframe columns (see `import_vr_csv`).
+    engine: string, default = 'c'
+        pd.read_csv engine (see `import_vr_csv`).
+
+    Yields
+    ------
+    sweep, sweep_data: string, dictionary
+        Sweep name (e.g. 'sweep003') and a dictionary with the same keys as
+        the output of `import_folder`, holding this sweep only:
+        'voltage recording' and 'linescan' single sweep dataframes (or
+        None) and 'file attributes' parsed from the XML.
+    """
+    for i, file in enumerate(_vr_xmls(folder)):
+        sweep_data = _read_sweep(folder, file, dtype, engine)
+        yield 'sweep' + str(i+1).zfill(3), sweep_data
+
+
+def _sweep_csvs(folder, file_vals):
+    """ Voltage recording and linescan csv files (or None) named by an XML """
+    vr_filename = None
+    ls_filename = None
+    if file_vals['voltage recording file'] is not None:
+        vr_filename = os.path.join(folder,
+                                   (file_vals['voltage recording file']
+                                    + '.csv'))
+    if file_vals['linescan file'] is not None:
+        ls_filename = os.path.join(folder,
+                                   (file_vals['linescan file']))
+    return vr_filename, ls_filename
+
+
+def _read_sweep(folder, file, dtype=np.float64, engine='c'):
+    """ Parses one VoltageRecording XML and reads the csv files it names """
+    file_vals = parse_xml(file)
+    vr_filename, ls_filename = _sweep_csvs(folder, file_vals)
+    df_vr = None
+    df_ls = None
+
+    if vr_filename is not None:
+        df_vr = import_vr_csv(vr_filename,
+                              file_vals['channels'],
+                              file_vals['divisors'], dtype, engine)
+
+    if ls_filename is not None:
+        df_ls = import_ls_csv(ls_filename, dtype, engine)
+
+    return {"voltage recording": df_vr, "linescan": df_ls,
+            "file attributes": file_vals}
+
+
+def _read_sweep_safe(folder, file, dtype=np.float64, engine='c'):
+    """
+    _read_sweep for FolderFollower. Returns (sweep_data, error), errors
+    being reported instead of raised.
+    """
+    try:
+        return _read_sweep(folder, file, dtype, engine), None
+    except Exception as err:
+        return None, '{0}: {1}'.format(type(err).__name__, err)
+
+
+def _channel_units(file_attr):
+    """ Units of the time and channel columns of the voltage recording """
+    units = file_attr['File1']['units']
+    return ['s'] + [units[ch] for ch in file_attr['File1']['channels']]
+
+
+def _as_arrays(output):
+    """ Converts the dataframes of an import_folder output to containers """
+    output = dict(output)
+    if output["voltage recording"] is not None:
+        output["voltage recording"] = SweepArray.from_frame(
+            output["voltage recording"],
+            _channel_units(output["file attributes"]))
+    if output["linescan"] is not None:
+        output["linescan"] = LineScan.from_frame(output["linescan"])
+    return output
+
+
+def import_folder(folder, cache=False, as_array=False, workers=1,
+                  dtype=np.float64, engine='c'):
     """Collapse entire data folder into multidimensional dataframe
 
     Parameters
@@ -123,6 +407,24 @@ def import_folder(folder):
     folder: string
         Full path to data folder. Folder must contain, at a minimum
         a single VoltageRecording XML file and associated csv file
+    cache: boolean or string, default = False
+        keep the imported data in the on-disk cache (see neurphys.cache)
+        and memory-map it on later calls for the same, unmodified folder.
+        True uses the default cache directory, a string sets it.
+    as_array: boolean, default = False
+        return the voltage recording as a SweepArray (sweeps x samples x
+        channels) and the linescan as a LineScan (sweeps x profiles x
+        samples, float32) instead of DataFrames. Sweeps must have equal
+        length.
+    workers: int, default = 1
+        number of threads reading the sweeps. 1 reads them in this thread,
+        None uses the ThreadPoolExecutor default.
+    dtype: numpy float type, default = np.float64
+        dtype of the voltage recording and linescan values (time stays
+        float64).
+    engine: string, default = 'c'
+        pd.read_csv engine; 'pyarrow' (multithreaded, if installed) can be
+        faster on large files.
 
     Return
     ------
@@ -134,48 +436,59 @@ def import_folder(folder):
               'file attributes': dictionary of contain file: file attribute
                key: value pairs (file attributes from parsing XML)
     """
-    vr_xmls = sorted(glob(os.path.join(folder, '*_VoltageRecording_*.xml')))
-
+    if cache:
+        def build():
+            output = import_folder(folder, workers=workers, dtype=dtype,
+                                   engine=engine)
+            frames = {"voltage recording": output["voltage recording"],
+                      "linescan": output["linescan"]}
+            return frames, output["file attributes"]
+
+        params = {'dtype': np.dtype(dtype).name}
+        frames, file_attr = nu_cache.memoize(folder, 'import_folder',
+                                             CACHE_VERSION, build, cache,
+                                             params)
+        output = {"voltage recording": frames["voltage recording"],
+                  "linescan": frames["linescan"],
+                  "file attributes": file_attr}
+        return _as_arrays(output) if as_array else output
+
+    vr_xmls = _vr_xmls(folder)
     if any(vr_xmls):
         data_vr = []
         data_ls = []
-        sweep_list = []
+        vr_sweeps = []
+        ls_sweeps = []
         file_attr = {}
         output = {}
 
-        for i, file in enumerate(vr_xmls):
-            sweep = 'sweep' + str(i+1).zfill(3)
-            sweep_list.append(sweep)
-            file_vals = parse_xml(file)
-
-            if file_vals['voltage recording file'] is not None:
-                vr_filename = os.path.join(folder,
-                                           (file_vals['voltage recording file']
-                                            + '.csv'))
-
-                df_vr = import_vr_csv(vr_filename,
-                                      file_vals['channels'],
-                                      file_vals['divisors'])
-
-                data_vr.append(df_vr)
+        sweeps = nu_util.map_chunks(partial(_read_sweep, folder,
+                                            dtype=dtype, engine=engine),
+                                    vr_xmls, workers,
+                                    executor=ThreadPoolExecutor)
 
-            if file_vals['linescan file'] is not None:
-                ls_filename = os.path.join(folder,
-                                           (file_vals['linescan file']))
-
-                df_ls = import_ls_csv(ls_filename)
-
-                data_ls.append(df_ls)
-
-            file_attr['File'+str(i+1)] = file_vals
-
-        if data_vr:
-            output["voltage recording"] = pd.concat(data_vr, keys=sweep_list,
+        for i, sweep_data in enumerate(sweeps):
+            sweep = 'sweep' + str(i+1).zfill(3)
+            if sweep_data["voltage recording"] is not None:
+                data_vr.append(sweep_data["voltage recording"])
+                vr_sweeps.append(sweep)
+            if sweep_data["linescan"] is not None:
+                data_ls.append(sweep_data["linescan"])
+                ls_sweeps.append(sweep)
+            file_attr['File'+str(i+1)] = sweep_data["file attributes"]
+
+        if data_vr and as_array:
+            output["voltage recording"] = SweepArray.from_frames(
+                data_vr, vr_sweeps, _channel_units(file_attr))
+        elif data_vr:
+            output["voltage recording"] = pd.concat(data_vr, keys=vr_sweeps,
                                                     names=['sweep', 'index'])
         elif not data_vr:
             output["voltage recording"] = None
-        if data_ls:
-            output["linescan"] = pd.concat(data_ls, keys=sweep_list,
+        if data_ls and as_array:
+            output["linescan"] = LineScan.from_frames(data_ls, ls_sweeps)
+        elif data_ls:
+            output["linescan"] = pd.concat(data_ls, keys=ls_sweeps,
                                            names=['sweep', 'index'])
         elif not data_ls:
             output["linescan"] = None
@@ -186,3 +499,294 @@ def import_folder(folder):
                   "file attributes": None}
 
     return output
+
+
+class _SweepFrames(object):
+    """
+    Sweep frames appended to growing column buffers, so that adding a
+    sweep copies only that sweep. `frame` gives the same ('sweep', 'index')
+    frame as concatenating them with pd.concat.
+    """
+
+    def __init__(self):
+        self.sweeps = []
+        self.size = 0
+        self.attrs = {}
+        self._columns = None
+        self._buffers = None
+        self._frame = None
+
+    def _compatible(self, df):
+        return (list(df.columns) == self._columns and
+                all(df[col].dtype == self._buffers[col].dtype
+                    for col in self._columns) and
+                df.index.equals(pd.RangeIndex(len(df))))
+
+    def append(self, sweep, df):
+        if self._buffers is None:
+            self._columns = list(df.columns)
+            self._buffers = {col: np.empty(len(df), df[col].dtype)
+                             for col in self._columns}
+            self._buffers['sweep'] = np.empty(len(df), np.int64)
+            self._buffers['index'] = np.empty(len(df), np.int64)
+            self.attrs = dict(df.attrs)
+        elif not self._compatible(df):
+            # new columns or dtypes: fall back on concatenating everything
+            merged = pd.concat([self.frame(), pd.concat([df], keys=[sweep])])
+            return self._reset(merged)
+
+        end = self.size + len(df)
+        capacity = len(self._buffers['sweep'])
+        if end > capacity:
+            capacity = max(end, 2*capacity)
+            for key, buf in self._buffers.items():
+                grown = np.empty(capacity, buf.dtype)
+                grown[:self.size] = buf[:self.size]
+                self._buffers[key] = grown
+        for col in self._columns:
+            self._buffers[col][self.size:end] = df[col].values
+        self._buffers['sweep'][self.size:end] = len(self.sweeps)
+        self._buffers['index'][self.size:end] = np.arange(len(df))
+        self.sweeps.append(sweep)
+        self.size = end
+        self._frame = None
+
+    def _reset(self, merged):
+        self.sweeps = list(merged.index.levels[0])
+        self.size = len(merged)
+        self.attrs = dict(merged.attrs)
+        self._columns = list(merged.columns)
+        self._buffers = {col: merged[col].values.copy()
+                         for col in self._columns}
+        self._buffers['sweep'] = np.asarray(merged.index.codes[0], np.int64)
+        self._buffers['index'] = np.asarray(
+            merged.index.levels[1][merged.index.codes[1]], np.int64)
+        self._frame = merged
+
+    def frame(self):
+        if self._frame is None:
+            n = self.size
+            codes = self._buffers['index'][:n]
+            index = pd.MultiIndex(levels=[self.sweeps,
+                                          np.arange(codes.max() + 1)],
+                                  codes=[self._buffers['sweep'][:n], codes],
+                                  names=['sweep', 'index'],
+                                  verify_integrity=False)
+            self._frame = pd.DataFrame(
+                {col: self._buffers[col][:n] for col in self._columns},
+                index=index, columns=self._columns, copy=False)
+            self._frame.attrs.update(self.attrs)
+        return self._frame
+
+
+class FolderFollower(object):
+    """Incremental importer for a data folder that is still being acquired.
+    Remembers which VoltageRecording XML files it has already imported and
+    only parses the new ones on each update, so the cost of an update is
+    proportional to the number of new sweeps.
+
+    Parameters
+    ----------
+    folder: string
+        Full path to data folder (see `import_folder`).
+    workers, dtype, engine:
+        See `import_folder`.
+    settle: float, default = 0.5
+        seconds a new XML file and the csv files it names must be left
+        unmodified before they are read, so that files still being written
+        are picked up on a later update.
+    retries: int, default = 3
+        updates on which a sweep that fails to read is tried again, in
+        case its files were incomplete, before it is skipped with a
+        warning. Later sweeps wait for it, to keep the acquisition order.
+        A csv file still missing once its XML has settled counts as a
+        failed read.
+
+    Examples
+    --------
+    >>> follower = FolderFollower('/data/2017_05_04/TSeries-001')
+    >>> for sweep, sweep_data in follower.watch(interval=1., idle_timeout=60):
+    ...     df = sweep_data['voltage recording']
+    >>> output = follower.output()   # same layout as import_folder
+    """
+
+    def __init__(self, folder, workers=1, dtype=np.float64, engine='c',
+                 settle=0.5, retries=3):
+        self.folder = folder
+        self.workers = workers
+        self.dtype = dtype
+        self.engine = engine
+        self.settle = settle
+        self.retries = retries
+        self.sweep_names = []
+        self._seen = set()
+        self._failures = {}
+        self._frames = {"voltage recording": _SweepFrames(),
+                        "linescan": _SweepFrames()}
+        self._file_attributes = OrderedDict()
+
+    def __len__(self):
+        return len(self.sweep_names)
+
+    def _settled(self, files, now):
+        try:
+            return all(now - os.path.getmtime(file) >= self.settle
+                       for file in files)
+        except OSError:
+            return False
+
+    def _new_xmls(self):
+        now = time.time()
+        new = []
+        for file in _vr_xmls(self.folder):
+            if file in self._seen:
+                continue
+            if not self._settled([file], now):
+                break
+            try:
+                csvs = _sweep_csvs(self.folder, parse_xml(file))
+            except Exception:
+                # unreadable XML: goes through the retries of update
+                new.append(file)
+                continue
+            csvs = [csv for csv in csvs if csv is not None]
+            if not all(os.path.exists(csv) for csv in csvs):
+                # the XML has settled without its csv: goes through the
+                # retries of update, then is skipped
+                new.append(file)
+                continue
+            if not self._settled(csvs, now):
+                break
+            new.append(file)
+        return new
+
+    def update(self):
+        """Imports the XML files that appeared since the last update.
+
+        Return
+        ------
+        new: list of (sweep, sweep_data) tuples
+            As yielded by `iter_pv_sweeps`, for the new sweeps only.
+        """
+        files = self._new_xmls()
+        results = nu_util.map_chunks(partial(_read_sweep_safe, self.folder,
+                                             dtype=self.dtype,
+                                             engine=self.engine),
+                                     files, self.workers,
+                                     executor=ThreadPoolExecutor)
+
+        new = []
+        for file, (sweep_data, err) in zip(files, results):
+            if err is not None:
+                self._failures[file] = self._failures.get(file, 0) + 1
+                if self._failures[file] <= self.retries:
+                    break
+                warnings.warn('Skipping {0} ({1})'.format(file, err))
+                self._seen.add(file)
+                continue
+            sweep = 'sweep' + str(len(self.sweep_names)+1).zfill(3)
+            self._seen.add(file)
+            self.sweep_names.append(sweep)
+            for key, frames in self._frames.items():
+                if sweep_data[key] is not None:
+                    frames.append(sweep, sweep_data[key])
+            self._file_attributes['File'+str(len(self.sweep_names))] = \
+                sweep_data["file attributes"]
+            new.append((sweep, sweep_data))
+
+        return new
+
+    def watch(self, interval=1., idle_timeout=None):
+        """Polls the folder and yields each new sweep as it is imported.
+
+        Parameters
+        ----------
+        interval: float, default = 1.
+            seconds between polls.
+        idle_timeout: float, default = None
+            stop once no new sweep has appeared for this many seconds.
+            None polls forever.
+
+        Yields
+        ------
+        sweep, sweep_data: as `iter_pv_sweeps`
+        """
+        last_new = time.time()
+        while True:
+            new = self.update()
+            for sweep in new:
+                yield sweep
+            now = time.time()
+            if new:
+                last_new = now
+            elif idle_timeout is not None and now - last_new >= idle_timeout:
+                return
+            time.sleep(interval)
+
+    def output(self):
+        """Everything imported so far, in the layout of `import_folder`.
+        Sweeps are copied into the output frames as they are imported, so
+        this only rebuilds the frames' index.
+        """
+        if not self.sweep_names:
+            return {"voltage recording": None, "linescan": None,
+                    "file attributes": None}
+        output = {key: frames.frame() if frames.size else None
+                  for key, frames in self._frames.items()}
+        output["file attributes"] = dict(self._file_attributes)
+        return output
+
+
+def convert_folder(folder, filepath=None, workers=1, dtype=np.float64,
+                   engine='c'):
+    """Converts a data folder into a single binary archive file that
+    `read_archive` memory-maps, so that later analyses skip parsing the
+    XML and csv files.
+
+    Parameters
+    ----------
+    folder: string
+        Full path to data folder (see `import_folder`).
+    filepath: string, default = None
+        Archive to write. None writes '<folder>.nph' next to the folder.
+    workers, dtype, engine:
+        See `import_folder`.
+
+    Return
+    ------
+    filepath: string
+        Path of the archive.
+    """
+    if filepath is None:
+        filepath = os.path.normpath(folder) + '.nph'
+    output = import_folder(folder, workers=workers, dtype=dtype,
+                           engine=engine)
+    nu_archive.save(filepath,
+                    {"voltage recording": output["voltage recording"],
+                     "linescan": output["linescan"]},
+                    output["file attributes"])
+
+    return filepath
+
+
+def read_archive(filepath, as_array=False):
+    """Opens an archive written by `convert_folder`.
+
+    Parameters
+    ----------
+    filepath: string
+    as_array: boolean, default = False
+        See `import_folder`.
+
+    Return
+    ------
+    output: dictionary
+        Same keys and layout as the output of `import_folder`; the
+        dataframes are memory-mapped from the archive.
+    """
+    frames, file_attr = nu_archive.load(filepath)
+    output = {"voltage recording": frames["voltage recording"],
+              "linescan": frames["linescan"],
+              "file attributes": file_attr}
+
+    return _as_arrays(output) if as_array else output
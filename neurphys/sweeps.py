@@ -0,0 +1,258 @@
+"""
+Array-backed container for multi-sweep recordings.
+"""
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def _sweep_names(num_sweeps):
+    return ['sweep' + str(i+1).zfill(3) for i in range(num_sweeps)]
+
+
+class SweepArray(object):
+    """
+    Recording held as one contiguous (sweeps x samples x channels) array
+    with a time base shared by every sweep. Alternative to the
+    ('sweep', 'index') multiindexed DataFrames returned by the readers:
+    single sweeps and channels are views of the array, sweep lookup is a
+    dictionary lookup and DataFrames are only built on request.
+
+    Parameters
+    ----------
+    data: 3D array_like (sweeps x samples x channels)
+    time: 1D array_like (samples)
+        Time base of every sweep (seconds).
+    channels: list of str
+        Channel names, e.g. ['primary', 'channel_1'].
+    sweep_names: list of str (default: None)
+        Defaults to 'sweep001', 'sweep002', ...
+    channel_units: list of str (default: None)
+        Units of the time column followed by each channel, as in the
+        `channel_units` attribute of `read_abf` DataFrames.
+    scale, offset: dict of channel: float (default: None)
+        Deferred scaling of channels stored as raw ADC counts (see
+        `read_abf(raw=True)`).
+
+    Examples
+    --------
+    >>> sa = read_abf('cell1.abf', as_array=True)
+    >>> sa.sweep(3)                 # (samples x channels) view of sweep003
+    >>> sa.channel('primary')       # (sweeps x samples) view
+    >>> sa.select(sweeps=[1, 3]).to_frame()
+    """
+
+    def __init__(self, data, time, channels, sweep_names=None,
+                 channel_units=None, scale=None, offset=None):
+        data = np.asarray(data)
+        if data.ndim != 3:
+            raise ValueError('data must be (sweeps x samples x channels)')
+        if sweep_names is None:
+            sweep_names = _sweep_names(data.shape[0])
+        if len(sweep_names) != data.shape[0] or \
+                len(channels) != data.shape[2] or \
+                len(time) != data.shape[1]:
+            raise ValueError('sweep_names, time and channels do not match '
+                             'the shape of data {}'.format(data.shape))
+        self.data = data
+        self.time = np.asarray(time)
+        self.channels = list(channels)
+        self.sweep_names = list(sweep_names)
+        self.channel_units = channel_units
+        self.scale = dict(scale or {})
+        self.offset = dict(offset or {})
+        self._sweep_pos = {name: i for i, name in enumerate(self.sweep_names)}
+        self._channel_pos = {name: i for i, name in enumerate(self.channels)}
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.data[i]
+
+    def __repr__(self):
+        return '<SweepArray: {0} sweeps x {1} samples x {2} channels>'.format(
+            *self.data.shape)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def sampling(self):
+        """ Sampling rate (Hz) """
+        return 1 / (self.time[1] - self.time[0])
+
+    def sweep_index(self, sweep):
+        """
+        Position of a sweep given its number (1-indexed, as in
+        `read_abf.keep_sweeps`) or its name.
+        """
+        if isinstance(sweep, (int, np.integer)):
+            if not 0 < sweep <= len(self):
+                raise KeyError(sweep)
+            return int(sweep) - 1
+        try:
+            return self._sweep_pos[sweep]
+        except KeyError:
+            raise KeyError(sweep)
+
+    def channel_index(self, channel):
+        """ Position of a channel given its name or column number """
+        if isinstance(channel, (int, np.integer)):
+            if not 0 <= channel < len(self.channels):
+                raise KeyError(channel)
+            return int(channel)
+        try:
+            return self._channel_pos[channel]
+        except KeyError:
+            raise KeyError(channel)
+
+    def sweep(self, sweep):
+        """ (samples x channels) view of a sweep, by number or name """
+        return self.data[self.sweep_index(sweep)]
+
+    def channel(self, channel, scaled=True):
+        """
+        (sweeps x samples) array of a channel, by name or column number.
+        A view, unless the channel holds raw counts and scaled is True.
+        """
+        name = self.channels[self.channel_index(channel)]
+        values = self.data[:, :, self.channel_index(channel)]
+        if scaled and name in self.scale:
+            return values * self.scale[name] + self.offset[name]
+        return values
+
+    def select(self, sweeps=None, channels=None):
+        """
+        New SweepArray with a subset of sweeps and/or channels, in the
+        order given. Contiguous ranges are views; other selections copy.
+
+        Parameters
+        ----------
+        sweeps: list of int or str (default: None)
+            Sweep numbers (1-indexed) or names. None keeps all.
+        channels: list of int or str (default: None)
+            Channel names or column numbers. None keeps all.
+        """
+        data = self.data
+        sweep_names = self.sweep_names
+        names = self.channels
+        if sweeps is not None:
+            pos = [self.sweep_index(s) for s in sweeps]
+            data = data[_as_slice(pos)]
+            sweep_names = [self.sweep_names[i] for i in pos]
+        if channels is not None:
+            pos = [self.channel_index(c) for c in channels]
+            data = data[:, :, _as_slice(pos)]
+            names = [self.channels[i] for i in pos]
+        units = None
+        if self.channel_units is not None:
+            units = [self.channel_units[0]] + \
+                [self.channel_units[self.channels.index(n) + 1] for n in names]
+        keep = lambda d: {n: d[n] for n in names if n in d}
+
+        return SweepArray(data, self.time, names, sweep_names, units,
+                          keep(self.scale), keep(self.offset))
+
+    def sweep_frame(self, sweep):
+        """ DataFrame (time + channel columns) of a single sweep """
+        df = pd.DataFrame(self.sweep(sweep), columns=self.channels,
+                          copy=False)
+        df.insert(0, 'time', self.time)
+        df.attrs.update(self._attrs())
+        return df
+
+    def to_frame(self):
+        """
+        ('sweep', 'index') multiindexed DataFrame with the same layout as
+        `read_abf`. This copies the data.
+        """
+        num_sweeps, num_samples, _ = self.data.shape
+        index = pd.MultiIndex(
+            levels=[self.sweep_names, np.arange(num_samples)],
+            codes=[np.repeat(np.arange(num_sweeps), num_samples),
+                   np.tile(np.arange(num_samples), num_sweeps)],
+            names=['sweep', 'index'])
+        data_dict = OrderedDict([('time', np.tile(self.time, num_sweeps))])
+        flat = self.data.reshape(num_sweeps * num_samples, -1)
+        for i, ch in enumerate(self.channels):
+            data_dict[ch] = flat[:, i]
+        df = pd.DataFrame(data_dict, index=index)
+        df.attrs.update(self._attrs())
+        if self.channel_units is not None:
+            df.channel_units = list(self.channel_units)
+
+        return df
+
+    def _attrs(self):
+        if not self.scale:
+            return {}
+        return {'scale': dict(self.scale), 'offset': dict(self.offset)}
+
+    @classmethod
+    def from_frames(cls, frames, sweep_names=None, channel_units=None):
+        """
+        Builds a SweepArray from a list of single-sweep DataFrames (time
+        column + channel columns) of equal length.
+        """
+        frames = list(frames)
+        lengths = set(len(df) for df in frames)
+        if len(lengths) > 1:
+            raise ValueError('Sweeps have different lengths {}'.format(
+                sorted(lengths)))
+        channels = [c for c in frames[0].columns if c != 'time']
+        data = np.stack([df[channels].values for df in frames])
+        attrs = frames[0].attrs
+
+        return cls(data, frames[0].time.values, channels, sweep_names,
+                   channel_units, attrs.get('scale'), attrs.get('offset'))
+
+    @classmethod
+    def from_frame(cls, df, channel_units=None):
+        """
+        Builds a SweepArray from a ('sweep', 'index') multiindexed
+        DataFrame as returned by the readers. Sweeps must have equal length.
+        channel_units defaults to the channel_units attribute of df.
+
+        Sweeps are found as the runs of equal codes of the sweep level, in
+        row order, so the sweep level is never materialized. Frames whose
+        sweeps are split in several runs are regrouped first.
+        """
+        codes = np.asarray(df.index.codes[0])
+        starts = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate([[0], starts]) if len(codes) else starts
+        run_codes = codes[starts]
+        if len(np.unique(run_codes)) != len(run_codes):
+            # rows of a sweep are not contiguous; group them first
+            _, first = np.unique(codes, return_index=True)
+            run_codes = codes[np.sort(first)]
+            df = df.loc[list(df.index.levels[0][run_codes])]
+            codes = np.asarray(df.index.codes[0])
+            starts = np.flatnonzero(np.diff(codes)) + 1
+            starts = np.concatenate([[0], starts])
+        sweep_names = list(df.index.levels[0][run_codes])
+        counts = np.diff(np.append(starts, len(codes)))
+        if len(set(counts)) > 1:
+            raise ValueError('Sweeps have different lengths {}'.format(
+                sorted(set(counts))))
+        num_samples = counts[0] if len(counts) else 0
+        channels = [c for c in df.columns if c != 'time']
+        data = df[channels].values.reshape(len(sweep_names), num_samples,
+                                           len(channels))
+        time = df.time.values[:num_samples]
+        if channel_units is None:
+            channel_units = getattr(df, 'channel_units', None)
+
+        return cls(data, time, channels, sweep_names, channel_units,
+                   df.attrs.get('scale'), df.attrs.get('offset'))
+
+
+def _as_slice(positions):
+    """ Turns a run of consecutive positions into a slice (for views) """
+    if len(positions) > 0 and \
+            np.array_equal(np.diff(positions), np.ones(len(positions) - 1)):
+        return slice(positions[0], positions[-1] + 1)
+    return positions
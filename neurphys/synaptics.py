@@ -1,7 +1,10 @@
 """ Functions to analyze synaptic events """
 
+import numpy as np
 import pandas as pd
+from . import fitting
 from . import utilities as util
+from .sweeps import SweepArray
 
 
 def analyze_current(df, bsl_start, bsl_end, start_time, end_time, sign="min",
@@ -98,3 +101,90 @@ def calc_ppr(df, bsl_start, bsl_end, start_time, end_time, stim_interval,
     ppr_df = pd.DataFrame({"Peak 1": peak1, "Peak 2": peak2, "PPR": ppr})
 
     return ppr_df
+
+
+def analyze_current_all(data, bsl_start, bsl_end, windows, sign="min",
+                        calc_tau=False, workers=1, chunk_size=256):
+    """Calculate peak amplitude and (optionally) decay of the synaptic
+    currents of every sweep in each of several windows, as analyze_current
+    does for one sweep and window.
+
+    Baselines and peaks are found with one reduction over all sweeps per
+    window, on the (sweeps x samples) array; the data is left untouched.
+    Decays are fitted by `fitting.fit_decays`, in a process pool.
+
+    Parameters
+    -----------
+    data: multi-sweep dataframe (e.g. from read_abf) or SweepArray
+        should contain time and primary columns
+    bsl_start: positive number (seconds)
+        designates beginning of epoch to use to baseline data
+    bsl_end: positive number (seconds)
+        designates end of epoch (time) to use to baseline data
+    windows: list of (start_time, end_time) pairs (seconds)
+        epochs in which the events occur, e.g. one per stimulus
+    sign: string (either 'min' or 'max')
+        indicates direction of event (min = neg going, max = pos going)
+    calc_tau: boolean, default = False
+        calculate weighted tau of events
+    workers: int, default = 1
+        number of processes fitting the decays. 1 fits in this process,
+        None uses the ProcessPoolExecutor default.
+    chunk_size: int, default = 256
+        events sent to a worker at a time
+
+    Return
+    ------
+    results: dataframe
+        Long-form table with one row per sweep and window: sweep, window
+        (1-indexed position in windows), Baseline, Peak time and Peak Amp
+        columns and, if calc_tau, Tau (ms) and Fit converged. Tau is NaN
+        where the decay could not be fitted.
+    """
+    if sign not in ("min", "max"):
+        raise ValueError("sign must be 'min' or 'max'")
+    if not isinstance(data, SweepArray):
+        data = SweepArray.from_frame(data[['time', 'primary']])
+    values = data.channel('primary').astype(np.float64, copy=False)
+    time = data.time
+    windows = [tuple(w) for w in windows]
+    num_sweeps = len(values)
+    rows = np.arange(num_sweeps)
+    argpeak = np.nanargmin if sign == "min" else np.nanargmax
+
+    bsl = np.nanmean(values[:, util.time_window(time, bsl_start, bsl_end)],
+                     axis=1)
+    bsl = bsl[:, np.newaxis]
+    peak_idx = np.empty((len(windows), num_sweeps), dtype=np.int64)
+    for w, (start_time, end_time) in enumerate(windows):
+        window = util.time_window(time, start_time, end_time)
+        peak_idx[w] = argpeak(values[:, window], axis=1) + window.start
+
+    # (windows x sweeps) arrays, laid out sweep by sweep in the table
+    columns = {'sweep': np.tile(data.sweep_names, len(windows)),
+               'window': np.repeat(np.arange(1, len(windows) + 1),
+                                   num_sweeps),
+               'Baseline': np.tile(bsl[:, 0], len(windows)),
+               'Peak time': time[peak_idx].ravel(),
+               'Peak Amp': (values[rows, peak_idx] - bsl[:, 0]).ravel()}
+
+    if calc_tau:
+        # events laid out window by window, as the other columns
+        segments = []
+        for w in range(len(windows)):
+            ix1, ix2 = util.decay_bounds(values, peak_idx[w],
+                                         offset=bsl[:, 0])
+            for s, (i1, i2) in enumerate(zip(ix1, ix2)):
+                if i1 < 0 or i2 < 0:
+                    segments.append(((), ()))
+                    continue
+                segments.append((time[i1:i2 + 1] - time[i1],
+                                 values[s, i1:i2 + 1] - bsl[s, 0]))
+        fits = fitting.fit_decays(segments, workers=workers,
+                                  chunk_size=chunk_size)
+        columns['Tau'] = fits['tau'].values * 1e3
+        columns['Fit converged'] = fits['converged'].values
+
+    results = pd.DataFrame(columns)
+    order = np.arange(len(results)).reshape(len(windows), -1).T.ravel()
+    return results.iloc[order].reset_index(drop=True)
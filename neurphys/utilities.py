@@ -1,8 +1,133 @@
 """ Useful functions for performing ephys data analysis """
 
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-from scipy.optimize import curve_fit
+from . import fitting
+from .sweeps import SweepArray
+
+
+def scaled(df, channel):
+    """Returns a channel of df as float64 values, applying the deferred
+    scale and offset of frames read with raw=True (see read_abf).
+
+    Parameters
+    ----------
+    df: data as pandas dataframe
+        Only the rows of df are converted, so pass the window you need
+        rather than a whole recording.
+    channel: string
+        column name, e.g. 'primary'
+
+    Return
+    ------
+    1D float64 array
+    """
+    values = df[channel].values
+    scale = df.attrs.get('scale', {})
+    if channel in scale:
+        return values * scale[channel] + df.attrs['offset'][channel]
+
+    return values.astype(np.float64, copy=False)
+
+
+def to_float(df):
+    """Converts a frame read with raw=True (see read_abf) into a regular
+    float64 dataframe. Other frames are returned as a copy.
+
+    Return
+    ------
+    df: dataframe with scaled float64 channels and no scaling in df.attrs
+    """
+    scale = df.attrs.get('scale', {})
+    data = df.copy()
+    for channel in scale:
+        data[channel] = scaled(df, channel)
+    data.attrs.pop('scale', None)
+    data.attrs.pop('offset', None)
+
+    return data
+
+
+def sample_index(t, sampling, side='left', t0=0.):
+    """Converts times into sample indexes of a regularly sampled time base
+    (time = t0 + index / sampling), without building or scanning it.
+    Matches the inclusive `(time >= t_start) & (time <= t_stop)` masks used
+    elsewhere in the package.
+
+    Parameters
+    ----------
+    t: number or array_like (seconds)
+    sampling: number (Hz)
+    side: string (default: 'left')
+        'left' returns the first index with time >= t, 'right' returns one
+        past the last index with time <= t.
+    t0: number (seconds, default: 0)
+        time of the first sample
+
+    Return
+    ------
+    index: int, or int array shaped like t (not clipped to the recording)
+    """
+    t = np.asarray(t, dtype=np.float64)
+    i = np.ceil((t - t0) * sampling)
+    # floating point rounding can nudge ceil() one sample either way
+    if side == 'left':
+        i -= t0 + (i - 1) / sampling >= t
+        i += t0 + i / sampling < t
+    else:
+        i -= t0 + i / sampling > t
+        i += t0 + (i + 1) / sampling <= t
+        i += 1
+    i = i.astype(np.int64)
+
+    return int(i) if i.ndim == 0 else i
+
+
+def _multi_sweep(index):
+    """Whether the rows of a frame span several sweeps (or files), read
+    from the first and last codes of its outer index levels"""
+    if not isinstance(index, pd.MultiIndex) or len(index) < 2:
+        return False
+    return any(codes[0] != codes[-1] for codes in index.codes[:-1])
+
+
+def time_window(df, start_time, end_time, time='time'):
+    """Resolves the inclusive time window start_time <= time <= end_time
+    into row positions without building boolean masks.
+
+    Parameters
+    ----------
+    df: data as pandas dataframe, or sorted 1D array of times (one sweep)
+    start_time, end_time: numbers (seconds)
+    time: string (default: 'time')
+        name of the time column of df
+
+    Return
+    ------
+    window: slice of row positions (use with df.iloc or on the column
+        arrays). Selects exactly the rows of the equivalent
+        `(df.time >= start_time) & (df.time <= end_time)` mask.
+
+    Notes
+    -----
+    The window of a single sweep is found by binary search. Multi-sweep or
+    multi-file frames, whose time restarts at each sweep, are recognised
+    from their index (first and last rows in different sweeps) and their
+    positions are found with a mask instead (an array of positions is
+    returned).
+    """
+    if isinstance(df, pd.DataFrame):
+        values = df[time].values
+        if _multi_sweep(df.index):
+            return np.flatnonzero((values >= start_time) &
+                                  (values <= end_time))
+    else:
+        values = np.asarray(df)
+    start = np.searchsorted(values, start_time, side='left')
+    stop = np.searchsorted(values, end_time, side='right')
+
+    return slice(start, max(start, stop))
 
 
 def baseline(df, start_time, end_time):
@@ -21,9 +146,20 @@ def baseline(df, start_time, end_time):
     Return
     ------
     df: dataframe with modified primary column
+
+    Notes
+    -----
+    For frames read with raw=True only the deferred offset of the primary
+    column is changed; the stored samples are left untouched.
     """
-    avg = df.primary[(df.time >= start_time) & (df.time <= end_time)].mean()
-    df.primary -= avg
+    avg = scaled(df.iloc[time_window(df, start_time, end_time)],
+                 'primary').mean()
+    if 'primary' in df.attrs.get('scale', {}):
+        offset = dict(df.attrs['offset'])
+        offset['primary'] -= avg
+        df.attrs['offset'] = offset
+    else:
+        df.primary -= avg
 
     return df
 
@@ -46,19 +182,154 @@ def find_peak(df, start_time, end_time, sign="min"):
     -------
     peak_df: dataframe of Peak Amp and Peak time
     """
-    df_sub = df[(df.time >= start_time) & (df.time <= end_time)]
+    df_sub = df.iloc[time_window(df, start_time, end_time)]
+    values = scaled(df_sub, 'primary')
     if sign == "min":
-        peak = df_sub.primary.min()
+        i = np.nanargmin(values)
     elif sign == "max":
-        peak = df_sub.primary.max()
+        i = np.nanargmax(values)
 
-    peak_df = df_sub[df_sub.primary == peak][['time', 'primary']]
-    peak_df.columns = ['Peak time', 'Peak Amp']
+    peak_df = pd.DataFrame({'Peak time': df_sub.time.values[[i]],
+                            'Peak Amp': values[[i]]},
+                           index=df_sub.index[[i]])
+
+    return peak_df
+
+
+def _sweep_values(data, channel):
+    """ (sweeps x samples) float64 values of a channel, time and sweeps """
+    if not isinstance(data, SweepArray):
+        data = SweepArray.from_frame(data[['time', channel]])
+    values = data.channel(channel).astype(np.float64, copy=False)
+    return values, data.time, data.sweep_names
+
+
+def baseline_all(data, start_time, end_time, channel='primary'):
+    """Baseline (average over a time window, ignoring NaN samples) of every
+    sweep at once
+
+    Parameters
+    -----------
+    data: multiindexed dataframe (e.g. from read_abf) or SweepArray
+        sweeps must have equal length
+    start_time: positive number (seconds)
+        designates beginning of the region over which to average
+    end_time: positive number (seconds)
+        designates end of region over which to average
+    channel: string (default: 'primary')
+
+    Return
+    ------
+    bsl_df: dataframe of Baseline, indexed by sweep
+    """
+    values, time, sweeps = _sweep_values(data, channel)
+    window = time_window(time, start_time, end_time)
+    bsl = np.nanmean(values[:, window], axis=1)
 
-    return peak_df.head(1)
+    return pd.DataFrame({'Baseline': bsl},
+                        index=pd.Index(sweeps, name='sweep'))
 
 
-def calc_decay(df, peak, peak_time, return_plot_vals=False):
+def find_peak_all(data, start_time, end_time, sign="min", bsl_start=None,
+                  bsl_end=None, channel='primary'):
+    """Returns min (or max) of every sweep within a time window, found with
+    a single reduction over all sweeps
+
+    Parameters
+    -----------
+    data: multiindexed dataframe (e.g. from read_abf) or SweepArray
+        sweeps must have equal length
+    start_time: positive number (seconds)
+        designates beginning of the epoch in which the event occurs
+    end_time: positive number (seconds)
+        designates end of the epoch in which the event occurs
+    sign: string (either 'min' or 'max')
+        indicates direction of event (min = neg going, max = pos going)
+    bsl_start, bsl_end: positive numbers (seconds, default: None)
+        if given, each sweep is baselined over this window first (the data
+        is left untouched) and its baseline is added to the table
+    channel: string (default: 'primary')
+
+    Return
+    -------
+    peak_df: dataframe of Peak time and Peak Amp (and Baseline), indexed by
+        sweep
+    """
+    values, time, sweeps = _sweep_values(data, channel)
+    window = time_window(time, start_time, end_time)
+    sub = values[:, window]
+    if sign == "min":
+        i = np.nanargmin(sub, axis=1)
+    elif sign == "max":
+        i = np.nanargmax(sub, axis=1)
+    else:
+        raise ValueError("sign must be 'min' or 'max'")
+    amp = sub[np.arange(len(sub)), i]
+
+    peak_df = pd.DataFrame({'Peak time': time[window][i], 'Peak Amp': amp},
+                           index=pd.Index(sweeps, name='sweep'))
+    if bsl_start is not None:
+        bsl = np.nanmean(values[:, time_window(time, bsl_start, bsl_end)],
+                         axis=1)
+        peak_df['Peak Amp'] -= bsl
+        peak_df['Baseline'] = bsl
+
+    return peak_df
+
+
+def decay_bounds(values, peak_idx, sign=None, offset=None, block=1024):
+    """Fit bounds of calc_decay for every row of a (sweeps x samples) array:
+    the first samples after each peak back within 90% and 5% of the peak.
+
+    Each row is searched forward from its peak, block samples at a time,
+    so the work and the temporary arrays only span the decays.
+
+    Parameters
+    -----------
+    values: 2D array (sweeps x samples)
+    peak_idx: 1D int array
+        column of the peak of each row
+    sign: number or 1D array, default = None
+        direction of the events (negative for downward events); None uses
+        the sign of each (baselined) peak, as calc_decay
+    offset: number or 1D array, default = None
+        baseline of each row, subtracted from values on the fly; None if
+        values are baselined
+    block: int, default = 1024
+        samples compared at a time
+
+    Return
+    ------
+    ix1, ix2: 1D int arrays of columns, -1 where a row does not decay that
+        far
+    """
+    peak_idx = np.asarray(peak_idx, dtype=np.int64)
+    num_rows = len(peak_idx)
+    offset = np.broadcast_to(0. if offset is None else offset, num_rows)
+    ix1 = np.full(num_rows, -1, dtype=np.int64)
+    ix2 = np.full(num_rows, -1, dtype=np.int64)
+
+    def first(row, pos, level, down):
+        while pos < values.shape[1]:
+            chunk = values[row, pos:pos + block] - offset[row]
+            hit = chunk >= level if down else chunk <= level
+            i = np.argmax(hit)
+            if hit[i]:
+                return pos + i
+            pos += block
+        return -1
+
+    signs = None if sign is None else np.broadcast_to(sign, num_rows)
+    for row, idx in enumerate(peak_idx):
+        peak = values[row, idx] - offset[row]
+        down = (peak if signs is None else signs[row]) < 0
+        ix1[row] = first(row, idx, peak * 0.90, down)
+        ix2[row] = first(row, idx, peak * 0.05, down)
+
+    return ix1, ix2
+
+
+def calc_decay(df, peak, peak_time, return_plot_vals=False, select=False):
     """Performs biexponential fit of event, returns a weighted tao value
 
     Parameters
@@ -72,52 +343,48 @@ def calc_decay(df, peak, peak_time, return_plot_vals=False):
     return_plot_vals: boolean, default = False
         return x, y, fit_y values, and bounding indexes fit associated with
         tau calculation
+    select: boolean, default = False
+        keep a single exponential when the data do not support a second
+        component (see `fitting.fit_decay`)
 
     Notes
     -----
     It is assumed that the primary column in the passed df have been baselined
 
+    The fit is done by `fitting.fit_decay`; it does not raise when it fails
+    to converge, but returns a NaN tau.
+
     Return
     ------
-    tau: weighted tau (unit = ms)
+    tau: weighted tau (unit = s)
     **if return_plot_values == True:
         also return subset of 1. x values (time), 2. subet of
         y values (primary) and 3. the y-data for the fit. Useful for plotting
         the fit overlayed with the raw data.
     """
-    peak_sub = df[df.time >= peak_time]
+    peak_sub = df.iloc[time_window(df, peak_time, np.inf)]
+    primary = pd.Series(scaled(peak_sub, 'primary'), index=peak_sub.index,
+                        name='primary')
 
     if peak < 0:
-        index1 = peak_sub[peak_sub.primary >= peak * 0.90].index[0]
-        index2 = peak_sub[peak_sub.primary >= peak * 0.05].index[0]
-        fit_sub = peak_sub.loc[index1:index2]
-        guess = np.array([-1, 1, -1, 1, 0])
+        index1 = primary[primary >= peak * 0.90].index[0]
+        index2 = primary[primary >= peak * 0.05].index[0]
     else:
-        index1 = peak_sub[peak_sub.primary <= peak * 0.90].index[0]
-        index2 = peak_sub[peak_sub.primary <= peak * 0.05].index[0]
-        fit_sub = peak_sub.loc[index1:index2]
-        guess = np.array([1, 1, 1, 1, 0])
-
-    x_zeroed = fit_sub.time - fit_sub.time.values[0]
+        index1 = primary[primary <= peak * 0.90].index[0]
+        index2 = primary[primary <= peak * 0.05].index[0]
+    fit_sub = peak_sub.loc[index1:index2]
+    fit_y = primary.loc[index1:index2]
 
-    def exp_decay(x, a, b, c, d, e):
-        return a*np.exp(-x/b) + c*np.exp(-x/d) + e
-
-    popt, pcov = curve_fit(exp_decay, x_zeroed*1e3,
-                           fit_sub.primary*1e12, guess)
+    x_zeroed = fit_sub.time.values - fit_sub.time.values[0]
+    params, _, _ = fitting.fit_decay(x_zeroed, fit_y.values, select=select)
 
     x_full_zeroed = peak_sub.time - peak_sub.time.values[0]
-    y_curve = exp_decay(x_full_zeroed*1e3, *popt) / 1e12
-
-    amp1 = popt[0]
-    tau1 = popt[1]
-    amp2 = popt[2]
-    tau2 = popt[3]
+    y_curve = fitting.biexp(x_full_zeroed, *params)
 
-    tau = ((tau1*amp1)+(tau2*amp2))/(amp1+amp2) * 1e-3
+    tau = fitting.weighted_tau(params)
 
     if return_plot_vals:
-        return tau, x_full_zeroed, peak_sub.primary, y_curve, index1, index2
+        return tau, x_full_zeroed, primary, y_curve, index1, index2
     else:
         return tau
 
@@ -157,6 +424,103 @@ def simple_smoothing(data, n):
         return np.append(nan_array, smoothed)
 
 
+def iter_sweeps(data):
+    """
+    Iterates over the sweeps of a recording, one single sweep DataFrame at a
+    time.
+
+    Parameters
+    ----------
+    data: multiindexed DataFrame, SweepArray or iterable of (name, df) pairs
+        e.g. the output of read_abf, or a stream from
+        read_abf.iter_abf_sweeps / read_pv.iter_pv_sweeps (for the latter
+        the 'voltage recording' frame is used).
+
+    Yields
+    ------
+    sweep_name, df: str, DataFrame
+    """
+    if isinstance(data, SweepArray):
+        for name in data.sweep_names:
+            yield name, data.sweep_frame(name)
+    elif isinstance(data, pd.DataFrame):
+        for name, df in data.groupby(level=0, sort=False):
+            yield name, df.xs(name, level=0)
+    else:
+        for name, df in data:
+            if isinstance(df, dict):
+                df = df['voltage recording']
+            yield name, df
+
+
+def map_sweeps(func, data, *args, **kwargs):
+    """
+    Applies an analysis function to every sweep of a recording, lazily.
+    Used with a sweep stream, only one sweep is held in memory at a time.
+
+    Parameters
+    ----------
+    func: callable
+        Single sweep analysis, e.g. synaptics.analyze_current or
+        membrane.calc_mem_prop. Called as func(df, *args, **kwargs).
+    data: see `iter_sweeps`
+
+    Yields
+    ------
+    sweep_name, result
+
+    Examples
+    --------
+    >>> sweeps = read_abf.iter_abf_sweeps('cell1.abf')
+    >>> props = dict(map_sweeps(membrane.calc_mem_prop, sweeps,
+    ...                         0, 0.05, 0.1, 0.05, -5))
+    """
+    for name, df in iter_sweeps(data):
+        yield name, func(df, *args, **kwargs)
+
+
+def map_chunks(func, items, workers=1, chunk_size=None,
+               executor=ProcessPoolExecutor):
+    """
+    Applies a function to many items, in this process or in a pool, and
+    returns the results in the order of the items.
+
+    Parameters
+    ----------
+    func: callable
+        Called with one item or, if chunk_size is given, with a list of up
+        to chunk_size items, for which it returns a list of results. Must be
+        picklable (a module level function or a partial of one) for process
+        pools.
+    items: iterable
+    workers: int (default: 1)
+        Number of workers. 1 runs everything in this process, None uses the
+        executor default.
+    chunk_size: int (default: None)
+        Items sent to a worker at a time. None sends them one by one.
+    executor: concurrent.futures executor class (default: ProcessPoolExecutor)
+        ThreadPoolExecutor suits IO bound work.
+
+    Return
+    ------
+    results: list, one per item
+    """
+    items = list(items)
+    if chunk_size is None:
+        tasks = items
+    else:
+        tasks = [items[i:i + chunk_size]
+                 for i in range(0, len(items), chunk_size)]
+    if workers == 1 or len(tasks) < 2:
+        results = [func(task) for task in tasks]
+    else:
+        with executor(max_workers=workers) as pool:
+            results = list(pool.map(func, tasks))
+    if chunk_size is not None:
+        results = [r for chunk in results for r in chunk]
+    return results
+
+
 def _mock_df(rows=20, num_channels=2):
     """
     Make a mock DataFrame that mimics neurphys.read_abf
@@ -185,7 +549,7 @@ def _mock_df(rows=20, num_channels=2):
     return pd.DataFrame(d)
 
 
-def mock_multidf(rows=20, num_channels=2, num_sweeps=10):
+def mock_multidf(rows=20, num_channels=2, num_sweeps=10, as_array=False):
     """
     Make a mock DataFrame that mimics neurphys.read_abf
     dataframe for testing purposes. Assuming at 10kHz sampling rate.
@@ -195,6 +559,8 @@ def mock_multidf(rows=20, num_channels=2, num_sweeps=10):
     rows: int (default: 20)
     num_channels: int (default: 2)
     sweeps: int (default: 10)
+    as_array: bool (default: False)
+        return a neurphys.sweeps.SweepArray instead of a DataFrame
 
     Note
     ----
@@ -208,4 +574,6 @@ def mock_multidf(rows=20, num_channels=2, num_sweeps=10):
     for sweep in sweep_names:
         df_dict[sweep] = _mock_df(rows=rows, num_channels=num_channels)
 
+    if as_array:
+        return SweepArray.from_frames(df_dict.values(), sweep_names)
     return pd.concat(df_dict, names=['sweep'])
@@ -0,0 +1,298 @@
+"""
+Writers for small synthetic data files used by the test suite.
+"""
+
+import os
+import struct
+import numpy as np
+
+BLOCKSIZE = 512
+
+SECTION_NAMES = ['ProtocolSection', 'ADCSection', 'DACSection',
+                 'EpochSection', 'ADCPerDACSection', 'EpochPerDACSection',
+                 'UserListSection', 'StatsRegionSection', 'MathSection',
+                 'StringsSection', 'DataSection', 'TagSection',
+                 'ScopeSection', 'DeltaSection', 'VoiceTagSection',
+                 'SynchArraySection', 'AnnotationSection', 'StatsSection']
+
+
+def _pad(buf):
+    return buf + b'\x00' * (-len(buf) % BLOCKSIZE)
+
+
+def write_abf2(filepath, data, sampling=10e3, units=None, names=None,
+               gains=None, offsets=None, gap_free=False, start_time=0.,
+               synch_chunks=0):
+    """
+    Writes an ABF2 file holding int16 data.
+
+    Parameters
+    ----------
+    filepath: str
+    data: array (sweeps x samples x channels)
+        Values in physical units, quantized with each channel's gain.
+    sampling: float
+        Sampling rate (Hz).
+    units, names: list of str
+        Per-channel units and ADC names (default pA/mV, IN 0, IN 1...).
+    gains: list of float
+        Physical units per ADC count (default 0.01).
+    offsets: list of float
+        Physical offset of each channel (default 0).
+    gap_free: bool
+        Write a single gap free sweep without a synch array.
+    start_time: float
+        Recording start, in seconds after midnight of 2026-01-01.
+    synch_chunks: int
+        With gap_free, also write a synch array listing the data as this
+        many chunks, as Clampex does in some gap free files.
+
+    Return
+    ------
+    raw: int16 array (sweeps x samples x channels) that was written
+    """
+    data = np.atleast_3d(np.asarray(data, dtype=float))
+    num_sweeps, num_samples, num_channels = data.shape
+    if units is None:
+        units = (['pA', 'mV'] * num_channels)[:num_channels]
+    if names is None:
+        names = ['IN {}'.format(i) for i in range(num_channels)]
+    if gains is None:
+        gains = [0.01] * num_channels
+    if offsets is None:
+        offsets = [0.] * num_channels
+    gains = np.asarray(gains, dtype=float)
+    offsets = np.asarray(offsets, dtype=float)
+
+    raw = np.round((data - offsets) / gains)
+    raw = np.clip(raw, -32768, 32767).astype('<i2')
+
+    adc_range, adc_resolution = 10., 32768
+    strings = [b'Clampex', b'C:/protocol.pro']
+    name_idx, unit_idx = [], []
+    for name, unit in zip(names, units):
+        strings.append(name.encode())
+        name_idx.append(len(strings))
+        strings.append(unit.replace('u', '\xb5').encode('latin-1'))
+        unit_idx.append(len(strings))
+    string_sec = b'SSCH' + b'\x00' * 40 + b'\x00\x00' + b'\x00'.join(strings)
+
+    protocol = bytearray(BLOCKSIZE)
+    struct.pack_into('<hf', protocol, 0, 3 if gap_free else 5, 1e6 / sampling)
+    struct.pack_into('<f', protocol, 14, 0.)
+    struct.pack_into('<i', protocol, 22, num_samples * num_channels)
+    struct.pack_into('<f', protocol, 110, adc_range)
+    struct.pack_into('<i', protocol, 118, adc_resolution)
+
+    adc = bytearray(128 * num_channels)
+    for i in range(num_channels):
+        # gain = range / (scale * signal gain * prog gain * resolution)
+        scale = adc_range / (gains[i] * adc_resolution)
+        base = 128 * i
+        struct.pack_into('<hh', adc, base, i, 0)
+        struct.pack_into('<hh', adc, base + 24, i, i)
+        struct.pack_into('<f', adc, base + 28, 1.)
+        struct.pack_into('<ffff', adc, base + 40, scale, offsets[i], 1., 0.)
+        struct.pack_into('<ii', adc, base + 74, name_idx[i], unit_idx[i])
+
+    flat = raw.reshape(-1)
+    if gap_free and synch_chunks:
+        rows = num_samples * num_sweeps
+        edges = np.linspace(0, rows, synch_chunks + 1).astype(int)
+        synch = np.zeros(synch_chunks,
+                         dtype=[('offset', '<i4'), ('len', '<i4')])
+        synch['offset'] = edges[:-1]
+        synch['len'] = np.diff(edges) * num_channels
+        synch = synch.tobytes()
+    elif gap_free:
+        synch = b''
+    else:
+        synch = np.zeros(num_sweeps, dtype=[('offset', '<i4'), ('len', '<i4')])
+        synch['offset'] = np.arange(num_sweeps) * num_samples
+        synch['len'] = num_samples * num_channels
+        synch = synch.tobytes()
+
+    blocks = [('ProtocolSection', bytes(protocol), len(protocol), 1),
+              ('ADCSection', bytes(adc), 128, num_channels),
+              ('StringsSection', string_sec, len(string_sec), len(strings)),
+              ('SynchArraySection', synch, 8, len(synch) // 8),
+              ('DataSection', flat.tobytes(), 2, flat.size)]
+
+    index = {}
+    body = b''
+    block = 1
+    for name, buf, size, entries in blocks:
+        index[name] = (block if buf else 0, size, entries)
+        padded = _pad(buf)
+        body += padded
+        block += len(padded) // BLOCKSIZE
+
+    header = bytearray(BLOCKSIZE)
+    header[0:4] = b'ABF2'
+    header[4:8] = bytes([0, 0, 6, 2])
+    struct.pack_into('<III', header, 8, BLOCKSIZE,
+                     1 if gap_free else num_sweeps, 20260101)
+    struct.pack_into('<I', header, 20, int(round(start_time * 1000)))
+    struct.pack_into('<HH', header, 28, 1, 0)
+    struct.pack_into('<II', header, 56, 0, 1)
+    struct.pack_into('<I', header, 72, 2)
+    for s, name in enumerate(SECTION_NAMES):
+        struct.pack_into('<IIq', header, 76 + s * 16,
+                         *index.get(name, (0, 0, 0)))
+
+    with open(filepath, 'wb') as f:
+        f.write(bytes(header) + body)
+
+    return raw
+
+
+def write_abf1(filepath, data, sampling=10e3, units=None, gains=None,
+               offsets=None):
+    """
+    Writes an episodic ABF1 file holding int16 data. See `write_abf2`.
+    """
+    data = np.atleast_3d(np.asarray(data, dtype=float))
+    num_sweeps, num_samples, num_channels = data.shape
+    if units is None:
+        units = (['pA', 'mV'] * num_channels)[:num_channels]
+    if gains is None:
+        gains = [0.01] * num_channels
+    if offsets is None:
+        offsets = [0.] * num_channels
+    gains = np.asarray(gains, dtype=float)
+    offsets = np.asarray(offsets, dtype=float)
+
+    raw = np.round((data - offsets) / gains)
+    raw = np.clip(raw, -32768, 32767).astype('<i2')
+
+    adc_range, adc_resolution = 10., 32768
+    header_blocks = 12
+    synch = np.zeros(num_sweeps, dtype=[('offset', '<i4'), ('len', '<i4')])
+    synch['offset'] = np.arange(num_sweeps) * num_samples
+    synch['len'] = num_samples * num_channels
+    synch = _pad(synch.tobytes())
+    data_block = header_blocks + len(synch) // BLOCKSIZE
+
+    seq = [-1] * 16
+    seq[:num_channels] = range(num_channels)
+    per_channel = lambda vals, fill: list(vals) + [fill] * (16 - len(vals))
+    scale = adc_range / (gains * adc_resolution)
+
+    header = bytearray(header_blocks * BLOCKSIZE)
+    header[0:4] = b'ABF '
+    fields = [(4, 'f', [1.83]), (8, 'h', [5]), (10, 'i', [raw.size]),
+              (14, 'h', [0]), (16, 'i', [num_sweeps]),
+              (40, 'i', [data_block]), (44, 'i', [0]), (48, 'i', [0]),
+              (92, 'i', [header_blocks]), (96, 'i', [num_sweeps]),
+              (100, 'h', [0]), (120, 'h', [num_channels]),
+              (122, 'f', [1e6 / (sampling * num_channels)]),
+              (130, 'f', [0.]), (138, 'i', [num_samples * num_channels]),
+              (244, 'f', [adc_range]), (252, 'i', [adc_resolution]),
+              (378, '16h', list(range(16))), (410, '16h', seq),
+              (730, '16f', [1.] * 16),
+              (922, '16f', per_channel(scale, 1.)),
+              (986, '16f', per_channel(offsets, 0.)),
+              (1050, '16f', [1.] * 16), (1114, '16f', [0.] * 16),
+              (4512, '16h', [0] * 16), (4576, '16f', [1.] * 16)]
+    for offset, fmt, vals in fields:
+        struct.pack_into('<' + fmt, header, offset, *vals)
+    for i, unit in enumerate(units):
+        header[442 + 10 * i:452 + 10 * i] = 'IN {}'.format(i).ljust(10).encode()
+        header[602 + 8 * i:610 + 8 * i] = unit.ljust(8).encode()
+
+    with open(filepath, 'wb') as f:
+        f.write(bytes(header) + synch + raw.reshape(-1).tobytes())
+
+    return raw
+
+
+_VR_SIGNAL = """
+   <VRecSignal>
+    <Name>{name}</Name>
+    <Enabled>true</Enabled>
+    <PatchclampDevice>{device}</PatchclampDevice>
+    <PatchclampChannel>{pc_channel}</PatchclampChannel>
+    <Type>Physical</Type>
+    <Unit>
+     <UnitName>{unit}</UnitName>
+     <Multiplier>1</Multiplier>
+     <Divisor>{divisor}</Divisor>
+    </Unit>
+   </VRecSignal>"""
+
+_VR_XML = """<?xml version="1.0" encoding="utf-8"?>
+<VRecSessionEntry>
+ <DataFile>{datafile}</DataFile>
+ <AssociatedLinescanProfileFile>{ls_file}</AssociatedLinescanProfileFile>
+ <Experiment>
+  <Rate>{rate}</Rate>
+  <AcquisitionTime>{duration}</AcquisitionTime>
+  <SignalList>{signals}
+   <VRecSignal>
+    <Name>Unused</Name>
+    <Enabled>false</Enabled>
+    <PatchclampDevice />
+    <Type>Physical</Type>
+   </VRecSignal>
+  </SignalList>
+ </Experiment>
+</VRecSessionEntry>
+"""
+
+
+def write_pv_folder(folder, num_sweeps=3, rows=100, rate=10000,
+                    num_profiles=2, ls_rows=20, prefix='TSeries-001'):
+    """
+    Writes a PrairieView-like T-series folder: per sweep a VoltageRecording
+    XML, its csv, and (if num_profiles) a linescan profile csv.
+
+    Channels are 'primary' (patch clamp, pA, divisor 0.5), 'secondary'
+    (patch clamp, mV, divisor 0.1) and 'input 2' (plain voltage).
+
+    Return
+    ------
+    vr: array (sweeps x rows x 3) of channel values after divisor scaling
+    ls: array (sweeps x ls_rows x profiles) of profile values
+    """
+    channels = [('Primary', '1', '0', 'pA', 0.5),
+                ('Secondary', '1', '1', 'mV', 0.1),
+                ('Input 2', '', '', 'V', 1)]
+    signals = ''.join(_VR_SIGNAL.format(name=name, device=device,
+                                        pc_channel=pc, unit=unit,
+                                        divisor=divisor)
+                      for name, device, pc, unit, divisor in channels)
+    divisors = np.array([c[-1] for c in channels], dtype=float)
+    rng = np.random.RandomState(0)
+    vr = np.round(rng.randn(num_sweeps, rows, len(channels)) * 100) / 100
+    ls = np.round(rng.rand(num_sweeps, ls_rows, num_profiles) * 1000, 1)
+    time_ms = np.arange(rows) * 1000. / rate
+    ls_time_ms = np.arange(ls_rows) * 2.5
+
+    for i in range(num_sweeps):
+        base = '{0}_Cycle{1:05d}'.format(prefix, i + 1)
+        datafile = base + '_VoltageRecording_001'
+        ls_file = base + '_LineProfileData.csv' if num_profiles else ''
+        with open(os.path.join(folder, datafile + '.xml'), 'w') as f:
+            f.write(_VR_XML.format(datafile=datafile, ls_file=ls_file,
+                                   rate=rate, duration=int(rows * 1000 / rate),
+                                   signals=signals))
+        with open(os.path.join(folder, datafile + '.csv'), 'w') as f:
+            f.write('Time(ms),' + ','.join(c[0] for c in channels) + '\n')
+            for t, row in zip(time_ms, vr[i] * divisors):
+                f.write('{:g},'.format(t) +
+                        ','.join('{:.6g}'.format(v) for v in row) + '\n')
+        if num_profiles:
+            header = []
+            for p in range(num_profiles):
+                header += ['Prof {} time(ms)'.format(p + 1),
+                           'Prof {}'.format(p + 1)]
+            with open(os.path.join(folder, ls_file), 'w') as f:
+                f.write(', '.join(header) + '\n')
+                for j in range(ls_rows):
+                    vals = []
+                    for p in range(num_profiles):
+                        vals += ['{:g}'.format(ls_time_ms[j]),
+                                 '{:g}'.format(ls[i, j, p])]
+                    f.write(', '.join(vals) + '\n')
+
+    return vr, ls
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+import neurphys.archive as archive
+import neurphys.cache as cache
+import neurphys.read_abf as read_abf
+import neurphys.read_pv as read_pv
+from .synthetic import write_abf2, write_pv_folder
+
+
+def test_read_abf_cache(tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    filepath = str(tmpdir.join('test.abf'))
+    write_abf2(filepath, np.random.randn(3, 500, 2) * 50)
+
+    cold = read_abf.read_abf(filepath, channels=['primary'], cache=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    warm = read_abf.read_abf(filepath, channels=['primary'], cache=cache_dir)
+    assert isinstance(warm.primary.values.base, np.memmap) or \
+        isinstance(warm.primary.values, np.memmap)
+    pd.testing.assert_frame_equal(cold, warm)
+    assert warm.channel_units == ['s', 'pA']
+
+    # different arguments or a modified file make new entries
+    read_abf.read_abf(filepath, cache=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    write_abf2(filepath, np.random.randn(3, 500, 2) * 50)
+    os.utime(filepath, ns=(0, 12345))
+    fresh = read_abf.read_abf(filepath, channels=['primary'], cache=cache_dir)
+    assert not np.allclose(fresh.primary, cold.primary)
+
+
+def test_import_folder_cache(tmpdir):
+    folder = tmpdir.mkdir('pv')
+    write_pv_folder(str(folder))
+    cache_dir = str(tmpdir.join('cache'))
+
+    cold = read_pv.import_folder(str(folder), cache=cache_dir)
+    warm = read_pv.import_folder(str(folder), cache=cache_dir)
+    pd.testing.assert_frame_equal(cold['voltage recording'],
+                                  warm['voltage recording'])
+    pd.testing.assert_frame_equal(cold['linescan'], warm['linescan'])
+    assert cold['file attributes'] == warm['file attributes']
+
+
+def test_lru_eviction(tmpdir):
+    cache_dir = str(tmpdir)
+    df = pd.DataFrame({'time': np.arange(1000.), 'primary': np.zeros(1000)})
+    for key in ['a', 'b', 'c']:
+        cache.store(key, {'data': df}, {}, cache_dir)
+        os.utime(os.path.join(cache_dir, key, 'meta.json'),
+                 (0, {'a': 100, 'b': 200, 'c': 300}[key]))
+    # using 'a' makes 'b' the least recently used entry
+    assert cache.load('a', cache_dir) is not None
+    entry_size = sum(os.path.getsize(os.path.join(dirpath, f))
+                     for dirpath, _, files in os.walk(os.path.join(cache_dir, 'c'))
+                     for f in files)
+    cache.evict(cache_dir, max_bytes=2 * entry_size + 100)
+    assert sorted(os.listdir(cache_dir)) == ['a', 'c']
+
+
+def test_frame_round_trip(tmpdir):
+    index = pd.MultiIndex.from_product([['Sweep1', 'Sweep2'], range(4)],
+                                       names=['sweep', 'index'])
+    df = pd.DataFrame({'time': np.arange(8, dtype=np.int16),
+                       'primary': np.arange(8, dtype=np.int16) * 3},
+                      index=index)
+    df.attrs = {'scale': {'time': 1e-4, 'primary': 0.05},
+                'offset': {'time': 0., 'primary': -1.5}}
+    cache.store('raw', {'data': df}, {}, str(tmpdir))
+    cached = cache.load('raw', str(tmpdir))[0]['data']
+    filepath = str(tmpdir.join('raw.npha'))
+    archive.save(filepath, {'data': df}, {})
+    archived = archive.load(filepath)[0]['data']
+    for frame in [cached, archived]:
+        pd.testing.assert_frame_equal(df, frame.copy())
+        assert frame.attrs == df.attrs
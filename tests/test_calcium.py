@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+import neurphys.calcium as calcium
+import neurphys.read_pv as read_pv
+from neurphys.linescan import LineScan
+from .synthetic import write_pv_folder
+
+
+def test_calc_ca_conc_all(tmpdir):
+    write_pv_folder(str(tmpdir), num_sweeps=3, num_profiles=3, ls_rows=40)
+    df = read_pv.import_folder(str(tmpdir))['linescan']
+    params = dict(f0_start=0.005, f0_end=0.02, kd=200., rf=40., rf_real=20.)
+
+    conc = calcium.calc_ca_conc_all(df, background=[10., 20., 30.],
+                                    **params)
+    assert conc.shape == (3, 3, 40)
+    for s, sweep in enumerate(['sweep001', 'sweep002', 'sweep003']):
+        for p in range(3):
+            expected = calcium.calc_ca_conc(df.loc[sweep], p + 1,
+                                            background=10. * (p + 1),
+                                            **params)
+            assert np.allclose(conc.data[s, p], expected, rtol=1e-5)
+
+    with pytest.raises(ValueError):
+        calcium.calc_ca_conc_all(df, 0.005, 0.02, 10.)
+
+    dff = calcium.calc_ca_conc_all(df, 0.005, 0.02, 10., method='dff')
+    f = df.loc['sweep002']['Prof 1'].values - 10.
+    f0 = f[2:9].mean()
+    assert np.allclose(dff.profile(1)[1], (f - f0) / f0, rtol=1e-4,
+                       atol=1e-6)
+
+
+def _transient_scan():
+    """ Transients rising over 30 ms from a baseline of 0.1 """
+    time = np.arange(3000) * 1e-3
+    data = np.full((2, 2, 3000), 0.1)
+    onsets = [0.2, 1.0, 1.9]
+    for s in range(2):
+        for p in range(2):
+            for k, onset in enumerate(onsets):
+                amp = 1. + 0.5 * k + p
+                t = time - onset
+                rise = np.clip(t / 0.03, 0, 1)
+                decay = np.where(t > 0.03, np.exp(-(t - 0.03) / 0.1), 1)
+                data[s, p] += amp * rise * decay
+    return LineScan(data, time), onsets
+
+
+def test_find_transients():
+    scan, onsets = _transient_scan()
+    events = calcium.find_transients(scan, threshold=0.3, window=0.7,
+                                     workers=1)
+    assert len(events) == 12
+    assert list(events.columns) == ['sweep', 'profile', 'onset time',
+                                    'peak time', 'time to peak',
+                                    'rise time', 'amplitude', 'decay tau',
+                                    'fit converged']
+    first = events[(events.sweep == 'sweep002') & (events.profile == 'Prof 2')]
+    assert np.allclose(first['onset time'], onsets, atol=1e-3)
+    assert np.allclose(first['peak time'], np.array(onsets) + 0.03,
+                       atol=1e-3)
+    # measured from the baseline, not from the threshold crossing
+    assert np.allclose(first.amplitude, [2., 2.5, 3.], atol=0.01)
+    assert np.allclose(events['time to peak'], 0.03, atol=1.5e-3)
+    assert np.allclose(events['rise time'], 0.8 * 0.03, atol=1.5e-3)
+    assert events['fit converged'].all()
+    assert np.allclose(events['decay tau'], 0.1, rtol=0.01)
+
+    pooled = calcium.find_transients(scan, threshold=0.3, window=0.7,
+                                     workers=2, chunk_size=5)
+    pd.testing.assert_frame_equal(pooled, events)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import neurphys.fitting as fitting
+import neurphys.utilities as util
+
+
+def _events(num_events, seed=0):
+    rng = np.random.RandomState(seed)
+    x = np.arange(0, 0.2, 1e-4)
+    segments = []
+    for _ in range(num_events):
+        params = [-50 * (1 + 0.1 * rng.randn()), 0.003, -20, 0.03, 0.5]
+        segments.append((x, fitting.biexp(x, *params) +
+                         rng.randn(len(x))))
+    return segments
+
+
+def test_fit_decay():
+    x, y = _events(1)[0]
+    guess = fitting.initial_guess(x, y)
+    assert guess[1] < guess[3]
+    params, converged, nfev = fitting.fit_decay(x, y)
+    assert converged and nfev > 0
+    assert np.allclose(params[[1, 3]], [0.003, 0.03], rtol=0.05)
+    assert np.isclose(params[2], -20, rtol=0.05)
+
+    # same fit whatever the units
+    scaled, _, _ = fitting.fit_decay(x * 1e3, y * 1e-12)
+    assert np.allclose(scaled * [1e12, 1e-3, 1e12, 1e-3, 1e12], params,
+                       rtol=1e-3)
+
+
+def test_fit_decay_failures():
+    x = np.arange(100) * 1e-3
+    params, converged, _ = fitting.fit_decay(x[:3], x[:3])
+    assert not converged and np.isnan(params).all()
+    y = np.exp(-x / 0.01)
+    y[10] = np.nan
+    params, converged, _ = fitting.fit_decay(x, y)
+    assert not converged and np.isnan(params).all()
+
+
+def test_fit_exp_decay():
+    rng = np.random.RandomState(0)
+    x = np.arange(0, 0.1, 1e-4)
+    y = fitting.exp_decay(x, 30, 0.01, 2) + 0.2*rng.randn(len(x))
+    params, converged, _ = fitting.fit_exp_decay(x, y)
+    assert converged
+    assert np.allclose(params, [30, 0.01, 2], rtol=0.02, atol=0.05)
+
+    # opt-in model selection keeps the single exponential
+    params, converged, _ = fitting.fit_decay(x, y, select=True)
+    assert converged and params[2] == 0
+    assert np.isclose(params[1], 0.01, rtol=0.02)
+
+    fits = fitting.fit_decays([(x, y)] * 3, single=True)
+    assert fits.converged.all()
+    assert np.allclose(fits.tau, 0.01, rtol=0.02)
+    assert (fits.a2 == 0).all()
+
+
+def test_fit_decays():
+    segments = _events(20) + [(np.arange(3.), np.ones(3))]
+    fits = fitting.fit_decays(segments, workers=1, chunk_size=8)
+    assert list(fits.columns) == fitting.PARAMS + ['tau', 'converged',
+                                                   'nfev']
+    assert fits.converged[:20].all() and not fits.converged[20]
+    assert np.isnan(fits.tau[20])
+    assert np.allclose(fits.tau2[:20], 0.03, rtol=0.05)
+
+    warm = fitting.fit_decays(segments, warm_start=True, workers=1)
+    assert np.allclose(warm.tau[:20], fits.tau[:20], rtol=1e-3)
+    assert warm.nfev[:20].sum() <= fits.nfev[:20].sum()
+
+    pooled = fitting.fit_decays(segments, workers=2, chunk_size=8)
+    pd.testing.assert_frame_equal(pooled, fits)
+    # however the work is split
+    pd.testing.assert_frame_equal(
+        fitting.fit_decays(segments, chunk_size=1), fits)
+
+
+def test_fit_decay_unidentifiable():
+    # single exponential decay: a second component fitted to it trades off
+    # with the offset, towards very slow time constants
+    rng = np.random.RandomState(3)
+    x = np.arange(120) * 1e-4
+    y = fitting.exp_decay(x, -68, 0.0052, 1.3) + rng.randn(len(x))
+    for seed in range(10):
+        noisy = y + np.random.RandomState(seed).randn(len(x))
+        params, converged, _ = fitting.fit_decay(x, noisy)
+        if converged:
+            assert params[3] < fitting.MAX_TAU_SPAN * np.ptp(x)
+            assert 0.003 < fitting.weighted_tau(params) < 0.008
+        else:
+            assert np.isnan(params).all()
+        params, converged, _ = fitting.fit_decay(x, noisy, select=True)
+        assert converged and np.isclose(params[1], 0.0052, rtol=0.15)
+
+
+def test_calc_decay():
+    x, y = _events(1)[0]
+    df = pd.DataFrame({'time': x + 0.1, 'primary': y - 0.5})
+    peak = df.primary.min()
+    peak_time = df.time[df.primary.idxmin()]
+    tau = util.calc_decay(df, peak, peak_time)
+    assert 0.003 < tau < 0.03
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+import neurphys.read_pv as read_pv
+from neurphys.linescan import LineScan
+from .synthetic import write_pv_folder
+
+
+def test_linescan_from_folder(tmpdir):
+    _, ls = write_pv_folder(str(tmpdir), num_sweeps=3, num_profiles=2,
+                            ls_rows=20)
+    output = read_pv.import_folder(str(tmpdir))
+    scan = read_pv.import_folder(str(tmpdir), as_array=True)['linescan']
+
+    assert isinstance(scan, LineScan)
+    assert scan.shape == (3, 2, 20)
+    assert scan.data.dtype == np.float32
+    assert scan.profile_names == ['Prof 1', 'Prof 2']
+    assert np.allclose(scan.time, np.arange(20) * 2.5e-3)
+    assert scan.sampling == pytest.approx(400)
+    assert np.allclose(scan.data, ls.transpose(0, 2, 1))
+    assert np.shares_memory(scan.profile(2), scan.data)
+    assert np.array_equal(scan.profile('Prof 2')[1], scan.sweep(2)[1])
+    assert scan.data.nbytes * 4 == output['linescan'].values.nbytes
+
+    pd.testing.assert_frame_equal(scan.to_frame(), output['linescan'],
+                                  check_dtype=False, check_names=False)
+
+
+def test_linescan_time_base():
+    df = pd.DataFrame({'Prof 1 time': [0., 1., 2.], 'Prof 1': [1., 2., 3.],
+                       'Prof 2 time': [0., 1., 2.], 'Prof 2': [4., 5., 6.]})
+    scan = LineScan.from_frame(df)
+    assert scan.shape == (1, 2, 3)
+    assert np.array_equal(scan.sweep(1), [[1, 2, 3], [4, 5, 6]])
+
+    df['Prof 2 time'] += 0.5
+    with pytest.raises(ValueError):
+        LineScan.from_frame(df)
+
+
+def test_time_index():
+    from neurphys.linescan import time_index
+    line_time = np.arange(10) * 2.5e-3
+    vr_time = np.arange(300) * 1e-4
+    idx = time_index(line_time, vr_time)
+    mask_idx = np.array([np.argmin(np.abs(line_time - t)) for t in vr_time])
+    early = vr_time <= 0.02375
+    assert np.array_equal(idx[early], mask_idx[early])
+    assert (idx[vr_time > 0.02375] == -1).all()
+
+    prev = time_index(line_time, vr_time, 'previous')
+    expected = np.array([np.flatnonzero(line_time <= t)[-1] for t in vr_time])
+    assert np.array_equal(prev[vr_time <= 0.0225], expected[vr_time <= 0.0225])
+
+    # irregular time bases go through a binary search
+    irregular = np.array([0., 0.1, 0.3, 0.35])
+    assert list(time_index(irregular, [-1, 0.04, 0.06, 0.34, 0.32, 0.5])) == \
+        [-1, 0, 1, 3, 2, -1]
+
+
+def test_event_triggered():
+    from neurphys.linescan import event_triggered_average, event_triggered
+    time = np.arange(100) * 0.01
+    data = np.tile(np.arange(100.), (2, 3, 1)) + \
+        np.array([0, 1000])[:, None, None] + np.arange(3)[None, :, None] * 100
+    scan = LineScan(data, time)
+    events = pd.DataFrame({'sweep': ['sweep001', 'sweep002', 2, 1],
+                           'time': [0.2, 0.5, 0.981, 0.01]})
+
+    lags, snippets = event_triggered(scan, events, pre=0.03, post=0.02)
+    assert np.allclose(lags, [-0.03, -0.02, -0.01, 0, 0.01, 0.02])
+    assert snippets.shape == (4, 3, 6)
+    assert np.array_equal(snippets[0, 0], np.arange(17, 23))
+    assert np.array_equal(snippets[1, 2], 1200 + np.arange(47, 53))
+    assert np.isnan(snippets[2, :, -1]).all()
+    assert np.isnan(snippets[3, :, :2]).all()
+
+    # no events (e.g. no spike detected) give no snippets
+    for empty in [events[:0], iter([]), []]:
+        lags, snippets = event_triggered(scan, empty, pre=0.03, post=0.02)
+        assert len(lags) == 6
+        assert snippets.shape == (0, 3, 6)
+
+    lags, average = event_triggered_average(scan, events[:2], 0.03, 0.02)
+    # mask-based loop the gather replaces
+    expected = np.mean([data[s, :, (time >= t - 0.03 - 1e-9) &
+                             (time <= t + 0.02 + 1e-9)]
+                        for s, t in [(0, 0.2), (1, 0.5)]], axis=0)
+    assert np.allclose(average, expected.T)
+
+    values = scan.sample([0.0149, 0.5, 2.], method='nearest')
+    assert values.shape == (2, 3, 3)
+    assert np.array_equal(values[0, 0, :2], [1, 50])
+    assert np.isnan(values[:, :, 2]).all()
+    linear = scan.sample([0.015, 0.5], method='linear')
+    assert np.allclose(linear[1, 0], [1001.5, 1050])
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import neurphys.membrane as membrane
+from neurphys.sweeps import SweepArray
+
+
+def _seal_test(num_sweeps, ra=10e6, rm=200e6, cm=50e-12, dv=-5e-3, seed=0):
+    """ RC cell response (pA) to a dv step from 20 to 60 ms, at 100 kHz """
+    rng = np.random.RandomState(seed)
+    time = np.arange(0, 0.1, 1e-5)
+    tau = ra*rm/(ra + rm)*cm
+
+    def step(t0):
+        x = np.clip(time - t0, 0, None)
+        return np.where(time >= t0, dv/(ra + rm) +
+                        (dv/ra - dv/(ra + rm))*np.exp(-x/tau), 0)
+
+    current = (step(0.02) - step(0.06))*1e12 + 20
+    data = current + 0.5*rng.randn(num_sweeps, len(time))
+    return SweepArray(data[:, :, np.newaxis], time, ['primary'])
+
+
+def test_calc_mem_prop_all():
+    sa = _seal_test(6)
+    args = (0, 0.015, 0.02, 0.04, -5)
+    props = membrane.calc_mem_prop_all(sa, *args, workers=1)
+    assert list(props.index) == sa.sweep_names
+    assert list(props.columns) == ['Ra', 'Rm', 'Cm', 'Tau', 'Fit converged']
+    assert props['Fit converged'].all()
+    for name in sa.sweep_names:
+        expected = membrane.calc_mem_prop(sa.sweep_frame(name), *args)
+        assert np.allclose(props.loc[name].values[:4].astype(float),
+                           expected)
+    # time constant of the RC circuit: Ra*Rm/(Ra+Rm)*Cm
+    assert np.allclose(props['Tau'], 0.476, rtol=0.01)
+
+    pd.testing.assert_frame_equal(
+        membrane.calc_mem_prop_all(sa.to_frame(), *args, workers=1), props)
+
+    pd.testing.assert_frame_equal(
+        membrane.calc_mem_prop_all(sa, *args, workers=2, chunk_size=2),
+        props)
+
+    avg = membrane.calc_mem_prop_all(sa, *args, average=True, workers=1)
+    assert list(avg.index) == ['average']
+    assert np.allclose(avg.values[0, :4].astype(float),
+                       props.values[:, :4].astype(float).mean(axis=0),
+                       rtol=0.02)
+
+
+def _monitored_recording(ra, rm=200e6, cm=50e-12, dv=-5e-3, period=0.1,
+                         first=0.05, pulse_dur=0.02, fs=50e3, seed=0):
+    """ Continuous current (pA) with a test pulse every period, whose
+    access resistance takes the successive values of ra """
+    rng = np.random.RandomState(seed)
+    time = np.arange(int(round(len(ra)*period*fs))) / fs
+    current = np.full(len(time), 20.)
+    for i, r in enumerate(ra):
+        tau = r*rm/(r + rm)*cm
+        for t0, sign in [(first + i*period, 1), (first + i*period +
+                                                 pulse_dur, -1)]:
+            x = time - t0
+            on = x >= 0
+            current[on] += sign*1e12*(dv/(r + rm) + (dv/r - dv/(r + rm)) *
+                                      np.exp(-x[on]/tau))
+    current += 0.5*rng.randn(len(time))
+    return pd.DataFrame({'time': time, 'primary': current})
+
+
+def test_membrane_monitor():
+    ra = np.linspace(10e6, 20e6, 12)
+    df = _monitored_recording(ra)
+    whole = membrane.MembraneMonitor(0.05, 0.1, 0.02, -5)
+    props = whole.update(df)
+    assert np.allclose(props.index, 0.05 + 0.1*np.arange(len(ra)))
+    assert props['Fit converged'].all()
+    assert (np.diff(props.Ra) > 0).all()
+
+    # chunks of any size, overlapping, give the same measurements
+    monitor = membrane.MembraneMonitor(0.05, 0.1, 0.02, -5)
+    new = [monitor.update(df.iloc[start:start + 1850])
+           for start in range(0, len(df), 1600)]
+    assert sum(len(n) for n in new) == len(props)
+    assert len(monitor._time) < 0.1*50e3
+    pd.testing.assert_frame_equal(monitor.output(), props)
+
+    # monitor started mid-recording skips the pulses already begun
+    late = membrane.MembraneMonitor(0.05, 0.1, 0.02, -5)
+    assert np.allclose(late.update(df.iloc[27100:]).index, props.index[6:])
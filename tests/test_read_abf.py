@@ -1,4 +1,9 @@
+import numpy as np
+import pandas as pd
+import pytest
 import neurphys.read_abf as read_abf
+import neurphys.utilities as util
+from .synthetic import write_abf1, write_abf2
 
 
 def test_all_strs():
@@ -19,3 +24,210 @@ def test_all_ints():
     assert read_abf._all_ints(('test', 12345)) == False
     assert read_abf._all_ints((54321, 12345))
     assert read_abf._all_ints((43.21, 12.34)) == False
+
+
+def test_lazy_abf(tmpdir):
+    data = np.random.randn(3, 1000, 2) * 50
+    filepath = str(tmpdir.join('test.abf'))
+    raw = write_abf2(filepath, data, units=['pA', 'mV'])
+
+    abf = read_abf.read_abf(filepath, lazy=True)
+    assert len(abf) == 3
+    assert abf.channels == ['primary', 'channel_1']
+    assert abf.channel_units == ['s', 'pA', 'mV']
+    assert abf.sampling == 10e3
+
+    sweep = abf.sweep(2, channels=['channel_1'], t_start=0.01, t_stop=0.02)
+    assert list(sweep.columns) == ['time', 'channel_1']
+    assert len(sweep) == 101
+    assert np.allclose(sweep.time.values[[0, -1]], [0.01, 0.02])
+    assert np.allclose(sweep.channel_1, raw[1, 100:201, 1] * 0.01)
+
+    df = abf.to_frame()
+    assert df.index.names == ['sweep', 'index']
+    assert list(df.index.levels[0]) == ['sweep001', 'sweep002', 'sweep003']
+    assert np.allclose(df.loc['sweep003'].primary, raw[2, :, 0] * 0.01)
+
+
+def test_read_abf_selection(tmpdir):
+    data = np.random.randn(4, 2000, 3) * 50
+    filepath = str(tmpdir.join('test.abf'))
+    raw = write_abf2(filepath, data)
+
+    df = read_abf.read_abf(filepath)
+    assert df.shape == (8000, 4)
+    assert np.allclose(df.loc['sweep002'].channel_2, raw[1, :, 2] * 0.01)
+
+    df = read_abf.read_abf(filepath, sweeps=[4, 2], channels=['channel_2'],
+                           t_start=0.1, t_stop=0.15)
+    assert list(df.index.levels[0]) == ['sweep004', 'sweep002']
+    assert list(df.columns) == ['time', 'channel_2']
+    assert df.channel_units == ['s', 'pA']
+    sweep = df.loc['sweep004']
+    assert len(sweep) == 501
+    assert np.isclose(sweep.time.values[0], 0.1)
+    assert np.allclose(sweep.channel_2, raw[3, 1000:1501, 2] * 0.01)
+
+    with pytest.raises(KeyError):
+        read_abf.read_abf(filepath, sweeps=[5])
+    with pytest.raises(KeyError):
+        read_abf.read_abf(filepath, channels=['channel_3'])
+
+
+def test_read_abf1(tmpdir):
+    data = np.random.randn(3, 1000, 2) * 50
+    filepath = str(tmpdir.join('test.abf'))
+    raw = write_abf1(filepath, data, units=['pA', 'mV'], offsets=[0, 1.5])
+
+    df = read_abf.read_abf(filepath)
+    assert df.channel_units == ['s', 'pA', 'mV']
+    assert np.allclose(df.loc['sweep002'].primary, raw[1, :, 0] * 0.01)
+    assert np.allclose(df.loc['sweep002'].channel_1,
+                       raw[1, :, 1] * 0.01 + 1.5)
+
+
+def test_read_abf_matches_neo(tmpdir):
+    rawio = pytest.importorskip('neo.rawio')
+    filepath = str(tmpdir.join('test.abf'))
+    write_abf2(filepath, np.random.randn(2, 500, 2) * 50)
+
+    reader = rawio.AxonRawIO(filepath)
+    reader.parse_header()
+    df = read_abf.read_abf(filepath)
+    for seg in range(2):
+        chunk = reader.get_analogsignal_chunk(0, seg, stream_index=0)
+        signal = reader.rescale_signal_raw_to_float(chunk, dtype='float64')
+        sweep = df.loc[read_abf._sweep_name(seg + 1)]
+        assert np.allclose(sweep[['primary', 'channel_1']].values, signal)
+
+
+def test_read_abf_many(tmpdir):
+    paths = []
+    raws = []
+    for i in range(3):
+        paths.append(str(tmpdir.join('cell{}.abf'.format(i))))
+        raws.append(write_abf2(paths[-1], np.random.randn(2, 300, 2) * 50))
+    bad = str(tmpdir.join('corrupt.abf'))
+    with open(bad, 'wb') as f:
+        f.write(b'not an abf file')
+    paths.insert(1, bad)
+
+    with pytest.warns(UserWarning, match='Could not read 1 of 4'):
+        df = read_abf.read_abf_many(paths, workers=2, channels=['primary'])
+    assert df.index.names == ['file', 'sweep', 'index']
+    assert list(df.index.get_level_values('file').unique()) == \
+        [paths[0], paths[2], paths[3]]
+    assert list(df.failed_files) == [bad]
+    assert np.allclose(df.loc[(paths[3], 'sweep002'), 'primary'],
+                       raws[2][1, :, 0] * 0.01)
+
+    other = str(tmpdir.join('current_clamp.abf'))
+    write_abf2(other, np.random.randn(2, 300, 2) * 50, units=['mV', 'pA'])
+    with pytest.raises(ValueError, match='different channel units'):
+        read_abf.read_abf_many([paths[0], other], workers=1)
+
+
+def test_read_abf_raw(tmpdir):
+    filepath = str(tmpdir.join('test.abf'))
+    raw = write_abf2(filepath, np.random.randn(2, 1000, 2) * 50,
+                     offsets=[0, 2.5])
+
+    df = read_abf.read_abf(filepath, raw=True)
+    assert df.primary.dtype == np.int16
+    assert df.time.dtype == np.float64
+    assert np.array_equal(df.loc['sweep002'].channel_1, raw[1, :, 1])
+    assert df.attrs['scale'] == {'primary': pytest.approx(0.01),
+                                 'channel_1': pytest.approx(0.01)}
+    assert df.attrs['offset'] == {'primary': 0, 'channel_1': 2.5}
+
+    full = read_abf.read_abf(filepath)
+    assert np.allclose(util.scaled(df.loc['sweep002'], 'channel_1'),
+                       full.loc['sweep002'].channel_1)
+    pd.testing.assert_frame_equal(util.to_float(df), full, check_like=True)
+
+
+def test_keep_drop_sweeps():
+    df = util.mock_multidf(rows=10, num_sweeps=6)
+    kept = read_abf.keep_sweeps(df, [5, 2, 5])
+    assert list(kept.index.get_level_values(0).unique()) == ['sweep005',
+                                                             'sweep002']
+    pd.testing.assert_frame_equal(kept.loc['sweep005'], df.loc['sweep005'])
+    block = read_abf.keep_sweeps(df, ['sweep002', 'sweep003'])
+    assert np.shares_memory(block.primary.values, df.primary.values)
+
+    dropped = read_abf.drop_sweeps(df, np.array([1, 4]))
+    assert list(dropped.index.get_level_values(0).unique()) == \
+        ['sweep002', 'sweep003', 'sweep005', 'sweep006']
+    assert len(dropped) == 40
+    # sweeps are found in frames whose sweeps were reordered
+    assert len(read_abf.drop_sweeps(kept, [5])) == 10
+
+    with pytest.raises(KeyError, match='sweep009'):
+        read_abf.drop_sweeps(df, [2, 9])
+    with pytest.raises(KeyError):
+        read_abf.keep_sweeps(df, ['sweep001', 'sweep010'])
+    with pytest.raises(TypeError):
+        read_abf.keep_sweeps(df, [1, 'sweep002'])
+
+    sa = util.mock_multidf(rows=10, num_sweeps=6, as_array=True)
+    assert read_abf.drop_sweeps(sa, [1]).sweep_names == \
+        ['sweep00{}'.format(i) for i in range(2, 7)]
+    assert np.shares_memory(read_abf.drop_sweeps(sa, [1]).data, sa.data)
+
+
+def test_iter_abf_sweeps(tmpdir):
+    filepath = str(tmpdir.join('test.abf'))
+    write_abf2(filepath, np.random.randn(4, 300, 2) * 50)
+    df = read_abf.read_abf(filepath, channels=['primary'], t_start=0.01)
+
+    stream = read_abf.iter_abf_sweeps(filepath, channels=['primary'],
+                                      t_start=0.01)
+    names = []
+    for name, sweep_df in stream:
+        names.append(name)
+        assert sweep_df.channel_units == ['s', 'pA']
+        assert np.array_equal(sweep_df.primary.values,
+                              df.loc[name].primary.values)
+        assert np.array_equal(sweep_df.time.values, df.loc[name].time.values)
+    assert names == ['sweep001', 'sweep002', 'sweep003', 'sweep004']
+
+    stream = read_abf.iter_abf_sweeps(filepath, sweeps=[3, 1])
+    assert [name for name, _ in stream] == ['sweep003', 'sweep001']
+
+
+def test_continuous_abf(tmpdir):
+    data = np.random.randn(1, 9000, 2) * 50
+    paths = []
+    # written out of order, the third file starts 0.5 s after the second ends
+    for i, (lo, hi, start) in enumerate([(3000, 6000, 0.3), (0, 3000, 0.),
+                                         (6000, 9000, 1.1)]):
+        paths.append(str(tmpdir.join('rec{}.abf'.format(i))))
+        write_abf2(paths[-1], data[:, lo:hi], gap_free=True,
+                   start_time=100 + start)
+    full = str(tmpdir.join('full.abf'))
+    write_abf2(full, data, gap_free=True)
+    expected = read_abf.read_abf(full).loc['sweep001']
+
+    # a gap free file listing its data in chunks is still a single sweep
+    chunked = str(tmpdir.join('chunked.abf'))
+    write_abf2(chunked, data, gap_free=True, synch_chunks=4)
+    pd.testing.assert_frame_equal(read_abf.read_abf(chunked),
+                                  read_abf.read_abf(full))
+
+    rec = read_abf.ContinuousABF(paths)
+    assert [f.filepath for f in rec.files] == [paths[1], paths[0], paths[2]]
+    assert len(rec) == 9000
+    assert rec.duration == pytest.approx(0.9)
+    assert np.allclose(rec.gaps, [0., 0.5])
+
+    assert np.array_equal(rec.read(2990, 6010),
+                          expected[['primary', 'channel_1']].values[2990:6010])
+    window = rec.window(0.25, 0.65, channels=['primary'])
+    mask = (expected.time >= 0.25) & (expected.time <= 0.65)
+    assert np.array_equal(window.time.values, expected.time[mask].values)
+    assert np.array_equal(window.primary.values, expected.primary[mask].values)
+
+    chunks = list(rec.iter_chunks(0.2, overlap=0.05, channels=[0]))
+    assert [len(c) for c in chunks] == [2000] * 5 + [1500]
+    assert np.array_equal(chunks[1].primary.values,
+                          expected.primary.values[1500:3500])
@@ -0,0 +1,221 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import neurphys.read_pv as read_pv
+from .synthetic import write_pv_folder
+
+
+def test_iter_pv_sweeps(tmpdir):
+    vr, ls = write_pv_folder(str(tmpdir), num_sweeps=3, rows=50)
+    output = read_pv.import_folder(str(tmpdir))
+
+    sweeps = list(read_pv.iter_pv_sweeps(str(tmpdir)))
+    assert [name for name, _ in sweeps] == ['sweep001', 'sweep002',
+                                            'sweep003']
+    for i, (name, sweep_data) in enumerate(sweeps):
+        df_vr = sweep_data['voltage recording']
+        assert np.allclose(df_vr[['primary', 'secondary', 'input 2']], vr[i])
+        pd.testing.assert_frame_equal(
+            df_vr, output['voltage recording'].loc[name], check_names=False)
+        assert np.allclose(sweep_data['linescan'].iloc[:, 1::2], ls[i])
+        assert sweep_data['file attributes'] == \
+            output['file attributes']['File' + str(i + 1)]
+
+
+def test_import_folder_workers(tmpdir):
+    write_pv_folder(str(tmpdir), num_sweeps=12, rows=30)
+    serial = read_pv.import_folder(str(tmpdir), workers=1)
+    threaded = read_pv.import_folder(str(tmpdir), workers=4)
+
+    pd.testing.assert_frame_equal(serial['voltage recording'],
+                                  threaded['voltage recording'])
+    pd.testing.assert_frame_equal(serial['linescan'], threaded['linescan'])
+    assert serial['file attributes'] == threaded['file attributes']
+    assert list(threaded['voltage recording'].index.levels[0]) == \
+        ['sweep{:03d}'.format(i + 1) for i in range(12)]
+
+    # the csv engine is passed down to every sweep
+    parsed = read_pv.import_folder(str(tmpdir), workers=4, engine='python')
+    pd.testing.assert_frame_equal(parsed['voltage recording'],
+                                  serial['voltage recording'])
+    pd.testing.assert_frame_equal(parsed['linescan'], serial['linescan'])
+    for name, sweep_data in read_pv.iter_pv_sweeps(str(tmpdir),
+                                                   engine='python'):
+        pd.testing.assert_frame_equal(
+            sweep_data['voltage recording'],
+            serial['voltage recording'].loc[name], check_names=False)
+
+
+def test_typed_csv(tmpdir):
+    vr, ls = write_pv_folder(str(tmpdir), num_sweeps=1, rows=200)
+    base = 'TSeries-001_Cycle00001_'
+    vr_file = str(tmpdir.join(base + 'VoltageRecording_001.csv'))
+    ls_file = str(tmpdir.join(base + 'LineProfileData.csv'))
+    channels = ['primary', 'secondary', 'input 2']
+    divisors = {'primary': 0.5, 'secondary': 0.1}
+
+    df = read_pv.import_vr_csv(vr_file, channels, divisors)
+    assert list(df.columns) == ['time'] + channels
+    assert (df.dtypes == np.float64).all()
+    assert np.allclose(df[channels], vr[0])
+    assert np.allclose(df.time, np.arange(200) / 10000)
+
+    df32 = read_pv.import_vr_csv(vr_file, channels, divisors,
+                                 dtype=np.float32, engine='c')
+    assert df32.time.dtype == np.float64
+    assert (df32[channels].dtypes == np.float32).all()
+    assert np.array_equal(df32.time, df.time)
+    assert np.allclose(df32, df, rtol=1e-6, atol=1e-6)
+
+    df_ls = read_pv.import_ls_csv(ls_file)
+    assert list(df_ls.columns) == ['Prof 1 time', 'Prof 1',
+                                   'Prof 2 time', 'Prof 2']
+    assert np.allclose(df_ls['Prof 1 time'], np.arange(20) * 2.5e-3)
+    assert np.allclose(df_ls[['Prof 1', 'Prof 2']], ls[0])
+
+    ls32 = read_pv.import_ls_csv(ls_file, dtype=np.float32)
+    assert list(ls32.dtypes) == [np.float64, np.float32] * 2
+    pd.testing.assert_frame_equal(ls32.astype(np.float64), df_ls, rtol=1e-6)
+
+
+def test_import_csv_pyarrow(tmpdir):
+    pytest.importorskip('pyarrow')
+    write_pv_folder(str(tmpdir), num_sweeps=1, rows=200)
+    base = 'TSeries-001_Cycle00001_'
+    vr_file = str(tmpdir.join(base + 'VoltageRecording_001.csv'))
+    ls_file = str(tmpdir.join(base + 'LineProfileData.csv'))
+    channels = ['primary', 'secondary', 'input 2']
+    divisors = {'primary': 0.5, 'secondary': 0.1}
+
+    pd.testing.assert_frame_equal(
+        read_pv.import_vr_csv(vr_file, channels, divisors, engine='pyarrow'),
+        read_pv.import_vr_csv(vr_file, channels, divisors))
+    pd.testing.assert_frame_equal(
+        read_pv.import_ls_csv(ls_file, engine='pyarrow'),
+        read_pv.import_ls_csv(ls_file))
+    pd.testing.assert_frame_equal(
+        read_pv.import_ls_csv(ls_file, np.float32, engine='pyarrow'),
+        read_pv.import_ls_csv(ls_file, np.float32))
+
+
+def test_archive(tmpdir):
+    folder = tmpdir.mkdir('TSeries-001')
+    write_pv_folder(str(folder), num_sweeps=4, rows=60)
+    output = read_pv.import_folder(str(folder))
+
+    filepath = read_pv.convert_folder(str(folder))
+    assert filepath == str(tmpdir.join('TSeries-001.nph'))
+    archived = read_pv.read_archive(filepath)
+    for key in ['voltage recording', 'linescan']:
+        pd.testing.assert_frame_equal(archived[key], output[key])
+    assert isinstance(archived['voltage recording'].primary.values.base,
+                      np.memmap)
+    assert archived['file attributes'] == output['file attributes']
+
+    sa = read_pv.read_archive(filepath, as_array=True)['voltage recording']
+    assert sa.shape == (4, 60, 3)
+
+
+def test_folder_follower(tmpdir):
+    staging = tmpdir.mkdir('staging')
+    folder = tmpdir.mkdir('TSeries-001')
+    write_pv_folder(str(staging), num_sweeps=5, rows=40)
+
+    def acquire(cycles):
+        for cycle in cycles:
+            for f in staging.listdir('*Cycle0000{}*'.format(cycle)):
+                f.copy(folder.join(f.basename))
+
+    acquire([1, 2])
+    follower = read_pv.FolderFollower(str(folder), settle=0)
+    assert [sweep for sweep, _ in follower.update()] == ['sweep001',
+                                                         'sweep002']
+    assert follower.update() == []
+    assert len(follower.output()['voltage recording']) == 80
+
+    acquire([3, 4, 5])
+    new = list(follower.watch(interval=0.01, idle_timeout=0.05))
+    assert [sweep for sweep, _ in new] == ['sweep003', 'sweep004',
+                                           'sweep005']
+
+    output = follower.output()
+    expected = read_pv.import_folder(str(folder))
+    for key in ['voltage recording', 'linescan']:
+        pd.testing.assert_frame_equal(output[key], expected[key])
+    assert output['file attributes'] == expected['file attributes']
+    assert follower.output()['voltage recording'] is \
+        output['voltage recording']
+
+
+def test_folder_follower_partial_files(tmpdir):
+    staging = tmpdir.mkdir('staging')
+    folder = tmpdir.mkdir('TSeries-001')
+    write_pv_folder(str(staging), num_sweeps=4, rows=40)
+    for f in staging.listdir():
+        f.copy(folder.join(f.basename))
+        os.utime(str(folder.join(f.basename)), (0, 0))
+    folder.listdir('*Cycle00004*VoltageRecording*.csv')[0].remove()
+    csv = folder.listdir('*Cycle00001*VoltageRecording*.csv')[0]
+    follower = read_pv.FolderFollower(str(folder), settle=60, retries=1)
+
+    # the first sweep's csv is still being written
+    csv.setmtime()
+    assert follower.update() == []
+    os.utime(str(csv), (0, 0))
+
+    # an unreadable sweep is retried, then skipped
+    bad = folder.listdir('*Cycle00002*VoltageRecording*.xml')[0]
+    bad.write(bad.read()[:100])
+    os.utime(str(bad), (0, 0))
+    assert [sweep for sweep, _ in follower.update()] == ['sweep001']
+    with pytest.warns(UserWarning, match='Cycle00002'):
+        assert [sweep for sweep, _ in follower.update()] == ['sweep002']
+    assert list(follower.output()['file attributes']) == ['File1', 'File2']
+
+    # as is a sweep whose csv never appeared, once its XML has settled
+    with pytest.warns(UserWarning, match='Cycle00004'):
+        assert follower.update() == []
+    assert len(follower) == 2
+
+
+def test_folder_index(tmpdir, monkeypatch):
+    folders = [tmpdir.mkdir('TSeries-00{}'.format(i)) for i in range(2)]
+    for folder in folders:
+        write_pv_folder(str(folder), num_sweeps=3, rows=20)
+    output = read_pv.import_folder(str(folders[0]))
+    raw_files = folders[0].listdir()
+    cache_dir = str(tmpdir.join('cache'))
+
+    index = read_pv.folder_index(str(folders[0]), cache=cache_dir)
+    assert folders[0].listdir() == raw_files
+    assert len(tmpdir.join('cache', read_pv.INDEX_DIRNAME).listdir()) == 1
+    assert list(index.values()) == [output['file attributes']['File' + str(i)]
+                                    for i in range(1, 4)]
+    assert read_pv.folder_index(str(folders[0])) == index
+
+    # an up to date index is read without parsing any XML
+    parsed = []
+    parse_xml = read_pv.parse_xml
+    monkeypatch.setattr(read_pv, 'parse_xml',
+                        lambda f: parsed.append(f) or parse_xml(f))
+    assert read_pv.folder_index(str(folders[0]), cache=cache_dir) == index
+    assert parsed == []
+
+    xml = folders[0].listdir('*Cycle00002*.xml')[0]
+    xml.write(xml.read().replace('<Rate>10000', '<Rate>20000'))
+    assert read_pv.folder_index(str(folders[0]), cache=cache_dir)[
+        xml.basename]['sampling'] == 20000
+    assert parsed == [str(xml)]
+
+    # an index that cannot be stored is rebuilt instead
+    blocked = tmpdir.join('blocked')
+    blocked.write('')
+    assert read_pv.folder_index(str(folders[0]), cache=str(blocked))[
+        xml.basename]['sampling'] == 20000
+
+    table = read_pv.index_table([str(f) for f in folders], cache=cache_dir)
+    assert len(table) == 6
+    assert list(table.sampling) == [10000, 20000, 10000, 10000, 10000, 10000]
+    assert table.channels[0] == ['primary', 'secondary', 'input 2']
+    assert table.units[0] == ['pA', 'mV', 'V']
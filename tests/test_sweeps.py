@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+import neurphys.read_abf as read_abf
+import neurphys.read_pv as read_pv
+import neurphys.utilities as util
+from neurphys.sweeps import SweepArray
+from .synthetic import write_abf2, write_pv_folder
+
+
+def test_sweep_array_views():
+    sa = util.mock_multidf(rows=50, num_sweeps=4, as_array=True)
+    assert sa.shape == (4, 50, 3)
+    assert sa.sweep_names[0] == 'sweep001'
+    assert np.shares_memory(sa.sweep(2), sa.data)
+    assert np.shares_memory(sa.channel('primary'), sa.data)
+    assert np.array_equal(sa.sweep('sweep003'), sa.sweep(3))
+    with pytest.raises(KeyError):
+        sa.sweep(5)
+
+    sub = sa.select(sweeps=[2, 3], channels=['primary'])
+    assert np.shares_memory(sub.data, sa.data)
+    assert sub.sweep_names == ['sweep002', 'sweep003']
+    picked = sa.select(sweeps=['sweep004', 'sweep001'])
+    assert picked.sweep_names == ['sweep004', 'sweep001']
+    assert np.array_equal(picked.sweep(1), sa.sweep(4))
+
+
+def test_sweep_array_frame_round_trip():
+    df = util.mock_multidf(rows=30, num_sweeps=3)
+    sa = SweepArray.from_frame(df)
+    out = sa.to_frame()
+    pd.testing.assert_frame_equal(out, df[out.columns], check_names=False)
+    assert np.array_equal(SweepArray.from_frame(out).data, sa.data)
+
+    # rows of a sweep split in two runs
+    split = pd.concat([df.iloc[:45], df.iloc[60:], df.iloc[45:60]])
+    assert np.array_equal(SweepArray.from_frame(split).data, sa.data)
+
+    # sweeps keep their row order, not the sorted order of the level
+    reordered = pd.concat([df.loc[['sweep003']], df.loc[['sweep001']]])
+    assert SweepArray.from_frame(reordered).sweep_names == ['sweep003',
+                                                           'sweep001']
+
+    with pytest.raises(ValueError):
+        SweepArray.from_frame(df.drop(('sweep002', 0)))
+
+
+def test_read_abf_as_array(tmpdir):
+    filepath = str(tmpdir.join('test.abf'))
+    write_abf2(filepath, np.random.randn(3, 400, 2) * 50)
+    df = read_abf.read_abf(filepath)
+    sa = read_abf.read_abf(filepath, as_array=True)
+    assert sa.shape == (3, 400, 2)
+    assert sa.channel_units == df.channel_units
+    pd.testing.assert_frame_equal(sa.to_frame(), df)
+
+    raw = read_abf.read_abf(filepath, sweeps=[3, 1], t_start=0.01,
+                            raw=True, as_array=True)
+    assert raw.data.dtype == np.int16
+    assert raw.sweep_names == ['sweep003', 'sweep001']
+    assert np.allclose(raw.channel('primary'),
+                       sa.select(sweeps=[3, 1]).channel('primary')[:, 100:])
+    assert raw.time[0] == pytest.approx(0.01)
+
+
+def test_import_folder_as_array(tmpdir):
+    vr, _ = write_pv_folder(str(tmpdir), num_sweeps=3, rows=100)
+    output = read_pv.import_folder(str(tmpdir), as_array=True)
+    sa = output['voltage recording']
+    assert isinstance(sa, SweepArray)
+    assert sa.channels == ['primary', 'secondary', 'input 2']
+    assert sa.channel_units == ['s', 'pA', 'mV', 'V']
+    assert np.allclose(sa.data, vr)
+
+    # the cached and archived copies carry the same units
+    cached = read_pv.import_folder(str(tmpdir), as_array=True,
+                                   cache=str(tmpdir.join('cache')))
+    assert cached['voltage recording'].channel_units == sa.channel_units
+    archived = read_pv.read_archive(
+        read_pv.convert_folder(str(tmpdir), str(tmpdir.join('a.nph'))),
+        as_array=True)
+    assert archived['voltage recording'].channel_units == sa.channel_units
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+import neurphys.fitting as fitting
+import neurphys.synaptics as syn
+from neurphys.sweeps import SweepArray
+
+
+def _evoked_currents(num_sweeps, seed=0):
+    """ Sweeps with two EPSCs (at 0.1 and 0.15 s) of varying amplitude,
+    rising in 0.5 ms and decaying in 5 ms """
+    rng = np.random.RandomState(seed)
+    time = np.arange(0, 0.3, 1e-4)
+    data = np.empty((num_sweeps, len(time)))
+    for s in range(num_sweeps):
+        current = np.full(len(time), 10.)
+        for onset, amp in [(0.1, -100. - s), (0.15, -150. - 2*s)]:
+            x = np.clip(time - onset, 0, None)
+            current += np.where(time >= onset,
+                                fitting.biexp(x, amp, 0.005, -amp, 0.0005, 0),
+                                0)
+        data[s] = current + rng.randn(len(time))
+    return SweepArray(data[:, :, np.newaxis], time, ['primary'])
+
+
+def test_analyze_current_all():
+    sa = _evoked_currents(5)
+    df = sa.to_frame()
+    windows = [(0.1, 0.14), (0.15, 0.2)]
+    results = syn.analyze_current_all(df, 0, 0.09, windows, calc_tau=True,
+                                      workers=1)
+    assert len(results) == 10
+    assert list(results.columns) == ['sweep', 'window', 'Baseline',
+                                     'Peak time', 'Peak Amp', 'Tau',
+                                     'Fit converged']
+    assert list(results.sweep[:4]) == ['sweep001', 'sweep001', 'sweep002',
+                                       'sweep002']
+    assert list(results.window[:4]) == [1, 2, 1, 2]
+    # past its rise, an EPSC decays single exponentially: the second
+    # component of some fits is not identifiable, and they fail instead of
+    # reporting slow, noise driven time constants
+    converged = results['Fit converged']
+    assert converged.sum() >= 5
+    assert np.allclose(results.Tau[converged], 5, rtol=0.1)
+    assert results.Tau[~converged].isnull().all()
+
+    for row in results.itertuples():
+        sweep = df.loc[row.sweep].copy()
+        peak_df, tau = syn.analyze_current(sweep, 0, 0.09,
+                                           *windows[row.window - 1],
+                                           calc_tau=True)
+        assert row._4 == pytest.approx(peak_df['Peak time'].values[0])
+        assert row._5 == pytest.approx(peak_df['Peak Amp'].values[0])
+        assert row.Tau == pytest.approx(tau, rel=1e-6, nan_ok=True)
+    # the input is not baselined in place
+    pd.testing.assert_frame_equal(df, sa.to_frame())
+
+    # the same however the fits are split between workers
+    for workers, chunk_size in [(2, 3), (1, 1)]:
+        pooled = syn.analyze_current_all(sa, 0, 0.09, windows, calc_tau=True,
+                                         workers=workers,
+                                         chunk_size=chunk_size)
+        pd.testing.assert_frame_equal(pooled, results)
+
+    # dropped samples are ignored in the baseline
+    gaps = sa.data.copy()
+    gaps[:, 10] = np.nan
+    gapped = syn.analyze_current_all(
+        SweepArray(gaps, sa.time, ['primary']), 0, 0.09, windows)
+    assert np.isfinite(gapped[['Baseline', 'Peak Amp']].values).all()
+
+    peaks = syn.analyze_current_all(sa, 0, 0.09, windows)
+    pd.testing.assert_frame_equal(peaks, results.iloc[:, :5])
+    with pytest.raises(ValueError):
+        syn.analyze_current_all(sa, 0, 0.09, windows, sign='up')
@@ -0,0 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import neurphys.utilities as util
+from neurphys.sweeps import SweepArray
+
+
+def _raw_frame():
+    """ mock frame stored as int16 counts with deferred scaling """
+    df = util.mock_multidf(rows=1000, num_sweeps=1).loc['sweep001']
+    df['primary'] = (df.primary * 1000).astype(np.int16)
+    df.attrs['scale'] = {'primary': 0.01}
+    df.attrs['offset'] = {'primary': -3.}
+    return df
+
+
+def test_scaled():
+    df = _raw_frame()
+    assert np.allclose(util.scaled(df, 'primary'),
+                       df.primary.values * 0.01 - 3)
+    assert np.array_equal(util.scaled(df, 'time'), df.time.values)
+
+
+def test_baseline_raw():
+    df = _raw_frame()
+    float_df = util.to_float(df)
+    raw_counts = df.primary.values.copy()
+
+    util.baseline(df, 0.01, 0.05)
+    util.baseline(float_df, 0.01, 0.05)
+    assert np.array_equal(df.primary.values, raw_counts)
+    assert np.allclose(util.scaled(df, 'primary'), float_df.primary)
+
+
+def test_find_peak_raw():
+    df = _raw_frame()
+    float_df = util.to_float(df)
+    for sign in ['min', 'max']:
+        peak = util.find_peak(df, 0.01, 0.08, sign)
+        expected = util.find_peak(float_df, 0.01, 0.08, sign)
+        assert list(peak.columns) == ['Peak time', 'Peak Amp']
+        assert np.allclose(peak.values, expected.values)
+        assert peak.index[0] == expected.index[0]
+
+
+def test_map_sweeps():
+    import neurphys.synaptics as syn
+    df = util.mock_multidf(rows=1000, num_sweeps=3)
+    names = ['sweep001', 'sweep002', 'sweep003']
+    expected = [syn.analyze_current(df.loc[name].copy(), 0, 0.01, 0.02, 0.05)
+                for name in names]
+
+    for data in [df.copy(), util.iter_sweeps(df.copy()),
+                 SweepArray.from_frame(df)]:
+        results = list(util.map_sweeps(syn.analyze_current, data,
+                                       0, 0.01, 0.02, 0.05))
+        assert [name for name, _ in results] == names
+        for (_, peak), exp in zip(results, expected):
+            assert np.allclose(peak.values, exp.values)
+
+
+def test_sample_index():
+    time = np.arange(1000) / 10e3
+    for t_start, t_stop in [(0.01, 0.02), (0.0123, 0.05), (0, 0.0999)]:
+        mask = np.where((time >= t_start) & (time <= t_stop))[0]
+        assert util.sample_index(t_start, 10e3, 'left') == mask[0]
+        assert util.sample_index(t_stop, 10e3, 'right') == mask[-1] + 1
+
+    # vectorized, on a time base starting at t0
+    time = 0.5 + np.arange(1000) / 10e3
+    starts = time[::7] - 1e-5
+    assert np.array_equal(util.sample_index(starts, 10e3, 'left', 0.5),
+                          np.searchsorted(time, starts, side='left'))
+    assert np.array_equal(util.sample_index(time, 10e3, 'right', 0.5),
+                          np.arange(1, 1001))
+
+
+def test_time_window():
+    df = util.mock_multidf(rows=1000, num_sweeps=3)
+    sweep = df.loc['sweep002']
+    for start, stop in [(0.01, 0.05), (0.0123, 0.0456), (-1, 0.00999),
+                        (0.0999, 1), (0.05, 0.01)]:
+        mask = (sweep.time >= start) & (sweep.time <= stop)
+        window = util.time_window(sweep, start, stop)
+        assert isinstance(window, slice)
+        assert np.array_equal(sweep.iloc[window].index, sweep[mask].index)
+        assert util.time_window(sweep.time.values, start, stop) == window
+
+    # time restarts in every sweep of a multiindexed frame
+    mask = (df.time >= 0.01) & (df.time <= 0.02)
+    assert np.array_equal(df.iloc[util.time_window(df, 0.01, 0.02)].index,
+                          df[mask].index)
+
+    # and in a single file (file, sweep, index) frame of read_abf_many
+    files = pd.concat([util.mock_multidf(rows=10, num_sweeps=3)],
+                      keys=['cell1.abf'], names=['file'])
+    start, stop = files.time.values[2], files.time.values[4]
+    window = util.time_window(files, start, stop)
+    assert np.array_equal(window, [2, 3, 4, 12, 13, 14, 22, 23, 24])
+
+    # a single sweep selected from a multi-file frame keeps its binary search
+    sweep = files.loc[('cell1.abf', 'sweep002')]
+    assert util.time_window(sweep, start, stop) == slice(2, 5)
+    assert util.time_window(files.iloc[10:20], start, stop) == slice(2, 5)
+
+
+def test_find_peak_all():
+    df = util.mock_multidf(rows=1000, num_sweeps=5)
+    sa = SweepArray.from_frame(df)
+    bsl = util.baseline_all(df, 0, 0.01)
+    assert list(bsl.index) == ['sweep00{}'.format(i) for i in range(1, 6)]
+
+    for data in [df, sa]:
+        peaks = util.find_peak_all(data, 0.02, 0.05, sign='max',
+                                   bsl_start=0, bsl_end=0.01)
+        for sweep in peaks.index:
+            sweep_df = util.baseline(df.loc[sweep].copy(), 0, 0.01)
+            expected = util.find_peak(sweep_df, 0.02, 0.05, sign='max')
+            assert peaks.loc[sweep, 'Peak time'] == \
+                expected['Peak time'].values[0]
+            assert np.isclose(peaks.loc[sweep, 'Peak Amp'],
+                              expected['Peak Amp'].values[0])
+            assert np.isclose(peaks.loc[sweep, 'Baseline'],
+                              bsl.loc[sweep, 'Baseline'])
+
+    mins = util.find_peak_all(df, 0.02, 0.05)
+    assert np.allclose(mins['Peak Amp'],
+                       df.primary.values.reshape(5, 1000)[:, 200:501].min(1))
+
+    # dropped samples (NaN) are ignored, as by the single sweep functions
+    gaps = df.copy()
+    gaps.iloc[1003:1006, gaps.columns.get_loc('primary')] = np.nan
+    expected = gaps.loc['sweep002'].primary.iloc[:101].mean()
+    assert np.isclose(util.baseline_all(gaps, 0, 0.01).loc['sweep002',
+                                                           'Baseline'],
+                      expected)
+    assert np.isclose(util.find_peak_all(gaps, 0.02, 0.05, bsl_start=0,
+                                         bsl_end=0.01).loc['sweep002',
+                                                           'Baseline'],
+                      expected)
+
+
+def test_decay_bounds():
+    rng = np.random.RandomState(0)
+    x = np.arange(500) * 1e-4
+    values = np.array([-80*np.exp(-x/0.005), 60*np.exp(-x/0.002),
+                       np.linspace(-5, -50, 500)]) + 0.5*rng.randn(3, 500)
+    peak_idx = np.array([0, 0, 499])
+    offset = np.array([1., -2., 0.])
+
+    def expected(row, fraction, down):
+        v = values[row, peak_idx[row]:]
+        peak = v[0]
+        hit = v >= peak*fraction if down else v <= peak*fraction
+        return peak_idx[row] + np.argmax(hit) if hit.any() else -1
+
+    ix1, ix2 = util.decay_bounds(values + offset[:, np.newaxis], peak_idx,
+                                 offset=offset, block=7)
+    assert list(ix1) == [expected(r, 0.9, r != 1) for r in range(3)]
+    assert list(ix2) == [expected(r, 0.05, r != 1) for r in range(3)]
+    assert ix1[2] == ix2[2] == -1
+
+    # direction given by the caller (e.g. the test pulse) over the peak's
+    ix1, _ = util.decay_bounds(values + offset[:, np.newaxis], peak_idx,
+                               sign=1, offset=offset)
+    assert ix1[0] == expected(0, 0.9, False)
+
+
+def _squares(chunk):
+    return [i * i for i in chunk]
+
+
+def test_map_chunks():
+    items = list(range(10))
+    assert util.map_chunks(abs, [-1, 2, -3]) == [1, 2, 3]
+    assert util.map_chunks(_squares, items, chunk_size=3) == \
+        [i * i for i in items]
+    assert util.map_chunks(_squares, items, workers=2, chunk_size=4,
+                           executor=ThreadPoolExecutor) == \
+        [i * i for i in items]
+    assert util.map_chunks(_squares, [], chunk_size=4) == []